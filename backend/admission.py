@@ -0,0 +1,118 @@
+"""Admission control for password hashing.
+
+bcrypt is deliberately slow, so an auth storm (credential stuffing, a whole
+class logging in at once) can queue far more hash work than the CPU can
+clear. HashAdmission runs hashes on a fixed pool of threads (bcrypt releases
+the GIL, so the event loop keeps serving other routes) and bounds the wait:
+
+- at most HASH_MAX_PENDING hashes may wait for a thread; beyond that a
+  request is rejected immediately (reason "queue_full")
+- a queued hash not started within HASH_WAIT_SECONDS is withdrawn and the
+  request rejected (reason "deadline")
+
+Rejections raise Overloaded; the app turns it into a 503 with a Retry-After
+derived from the current backlog and the observed hash duration.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "64"))
+HASH_WAIT_SECONDS = float(os.getenv("HASH_WAIT_SECONDS", "2"))
+
+HASH_QUEUE_DEPTH = metrics.Gauge(
+    "hash_queue_depth",
+    "Password hashes waiting for a thread (pending) and running.",
+    ("state",),
+)
+HASH_QUEUE_WAIT = metrics.Histogram(
+    "hash_queue_wait_seconds",
+    "Time an admitted hash waited for a hashing thread.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0),
+)
+HASH_ADMISSIONS = metrics.Counter(
+    "hash_admissions_total",
+    "Hash requests admitted to the queue, or rejected because it was full (queue_full) "
+    "or because they waited past the deadline (deadline).",
+    ("result",),
+)
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class HashAdmission:
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING,
+                 wait_seconds: float = HASH_WAIT_SECONDS):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.wait_seconds = wait_seconds
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+        self.pending = 0
+        self.running = 0
+        # Moving average of one hash, seeded with a cost-12 bcrypt
+        self.average_seconds = 0.25
+        self._lock = threading.Lock()
+
+    def _publish(self):
+        HASH_QUEUE_DEPTH.set(self.pending, "pending")
+        HASH_QUEUE_DEPTH.set(self.running, "running")
+
+    def retry_after(self) -> int:
+        backlog = (self.pending + self.running) / max(self.workers, 1)
+        return max(1, math.ceil(backlog * self.average_seconds))
+
+    def _reject(self, reason: str):
+        HASH_ADMISSIONS.inc(reason)
+        raise Overloaded(reason, self.retry_after())
+
+    def _call(self, queued_at: float, function, args):
+        started = time.perf_counter()
+        with self._lock:
+            self.pending -= 1
+            self.running += 1
+            self._publish()
+        HASH_QUEUE_WAIT.observe(started - queued_at)
+        try:
+            return function(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.running -= 1
+                self.average_seconds = 0.9 * self.average_seconds + 0.1 * elapsed
+                self._publish()
+
+    async def run(self, function, *args):
+        """Run `function(*args)` on a hashing thread, or raise Overloaded."""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                full = True
+            else:
+                full = False
+                self.pending += 1
+                self._publish()
+        if full:
+            self._reject("queue_full")
+        HASH_ADMISSIONS.inc("admitted")
+        future = self.executor.submit(self._call, time.perf_counter(), function, args)
+        result = asyncio.wrap_future(future)
+        try:
+            return await asyncio.wait_for(asyncio.shield(result), self.wait_seconds)
+        except asyncio.TimeoutError:
+            # Still queued: withdraw it. Already hashing: let it finish.
+            if future.cancel():
+                with self._lock:
+                    self.pending -= 1
+                    self._publish()
+                self._reject("deadline")
+            return await result
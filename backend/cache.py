@@ -0,0 +1,57 @@
+"""Small per-process TTL caches for hot reads.
+
+Each worker keeps its own copy, so a write made through another worker is
+seen here at most `ttl` seconds later; writes made through this worker
+invalidate immediately. A ttl of 0 disables the cache.
+"""
+import time
+from collections import OrderedDict
+
+import metrics
+
+MISSING = object()
+
+
+class TTLCache:
+    """LRU-bounded mapping whose entries expire `ttl` seconds after being set."""
+
+    def __init__(self, name: str, ttl: float, maxsize: int = 10_000):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return MISSING
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            metrics.CACHE_LOOKUPS.inc(self.name, "miss")
+            return MISSING
+        self._entries.move_to_end(key)
+        metrics.CACHE_LOOKUPS.inc(self.name, "hit")
+        return entry[1]
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def freeze(query: dict):
+    """Hashable key for a flat query dict (the catalog filters)."""
+    return tuple(sorted((key, repr(value)) for key, value in query.items()))
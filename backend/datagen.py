@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""Synthetic dataset generator for scale testing.
+
+    python datagen.py --users 1000000 --sheets 200000 --download-events 2000000
+
+Everything derives from --seed: ids are uuid5 values of the entity index and
+each collection draws from its own random stream, so two runs with the same
+options produce the same documents. Sheets are sample sheets (their id
+derives from their file, as for the seeded ones), so their files are
+placeholders in SAMPLE_FILES_DIR (--files) rather than missing uploads. Documents are generated in batches and
+written by parallel unordered insert_many calls; indexes are (re)built once
+the data is loaded, which is much faster than maintaining them during the
+load. All generated accounts share one password (--password), hashed once.
+"""
+import asyncio
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import typer
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import passwords
+from indexes import INDEXES
+from repositories import name_key, sample_sheet_id
+from tokens import create_reset_token
+
+LEVELS = ["PS", "MS", "GS", "CP", "CE1", "CE2", "CM1", "CM2", "6e", "5e", "4e", "3e"]
+SUBJECTS = [
+    "mathématiques", "français", "sciences", "découverte du monde", "histoire",
+    "géographie", "anglais", "arts plastiques", "éducation musicale", "EMC",
+]
+FIRST_NAMES = [
+    "Camille", "Léa", "Manon", "Chloé", "Emma", "Inès", "Sarah", "Julie", "Lucas", "Hugo",
+    "Louis", "Nathan", "Thomas", "Julien", "Nicolas", "Marie", "Sophie", "Claire", "Antoine", "Paul",
+]
+LAST_NAMES = [
+    "Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand", "Leroy", "Moreau",
+    "Simon", "Laurent", "Lefebvre", "Michel", "Garcia", "David", "Bertrand", "Roux", "Vincent", "Fournier",
+]
+TOPICS = [
+    "Les nombres", "La lecture", "Les animaux", "Le temps", "Les formes", "La conjugaison",
+    "Les fractions", "Le corps humain", "Les saisons", "La carte de France", "Les verbes", "La mesure",
+]
+SAMPLE_FILES_DIR = "/tmp/sample_files"
+NAMESPACE = uuid.UUID("6f1c1d2e-5b7a-4e0c-9a53-2d4f3b8e9c10")
+
+# Per-user flags kept in a bytearray so later collections can refer to users
+TEACHER, PREMIUM, VERIFIED = 1, 2, 4
+
+cli = typer.Typer(help="Generate a realistic large dataset for L'École des Génies.")
+
+
+def entity_id(seed: int, kind: str, index: int) -> str:
+    return str(uuid.uuid5(NAMESPACE, f"{seed}:{kind}:{index}"))
+
+
+class Writer:
+    """Bounded queue of batches drained by parallel insert_many workers."""
+
+    def __init__(self, database, workers: int):
+        self.database = database
+        self.queue = asyncio.Queue(maxsize=workers * 2)
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(workers)]
+        self.error = None
+
+    async def _work(self):
+        while True:
+            collection, batch = await self.queue.get()
+            try:
+                await self.database[collection].insert_many(batch, ordered=False)
+            except Exception as exc:
+                self.error = self.error or exc
+            finally:
+                self.queue.task_done()
+
+    async def put(self, collection: str, batch: list):
+        await self.queue.put((collection, batch))
+
+    async def close(self):
+        await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+
+
+async def write_batches(writer: Writer, collection: str, documents, batch_size: int):
+    start = time.perf_counter()
+    total = 0
+    batch = []
+    for document in documents:
+        total += 1
+        batch.append(document)
+        if len(batch) >= batch_size:
+            await writer.put(collection, batch)
+            batch = []
+    if batch:
+        await writer.put(collection, batch)
+    await writer.queue.join()
+    if writer.error is not None:
+        raise writer.error
+    elapsed = time.perf_counter() - start
+    typer.echo(f"  {collection}: {total:,} documents in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f}/s)")
+
+
+def generate_users(seed: int, count: int, flags: bytearray, password_hash: str, now: datetime):
+    rng = random.Random(f"{seed}:users")
+    for i in range(count):
+        # About 80% parents (15% of them premium), 20% teachers (60% verified)
+        is_teacher = rng.random() < 0.2
+        is_premium = not is_teacher and rng.random() < 0.15
+        is_verified = not is_teacher or rng.random() < 0.6
+        flags[i] = (TEACHER if is_teacher else 0) | (PREMIUM if is_premium else 0) | (VERIFIED if is_verified else 0)
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield {
+            "id": entity_id(seed, "user", i),
+            "email": f"{'enseignant' if is_teacher else 'parent'}{i}@genies.example",
+            "password": password_hash,
+            "first_name": first_name,
+            "last_name": last_name,
+            "name_key": name_key(first_name, last_name),
+            "user_type": "teacher" if is_teacher else "parent",
+            "is_premium": is_premium,
+            "is_verified": is_verified,
+            "is_admin": False,
+            "created_at": now - timedelta(seconds=rng.randrange(3 * 365 * 86400)),
+        }
+
+
+def sheet_file_url(index: int) -> str:
+    return f"/api/files/gen_{index:07d}.pdf"
+
+
+def generate_sheets(seed: int, count: int, now: datetime):
+    rng = random.Random(f"{seed}:sheets")
+    for i in range(count):
+        level = rng.choice(LEVELS)
+        subject = rng.choice(SUBJECTS)
+        yield {
+            "id": sample_sheet_id(sheet_file_url(i)),
+            "title": f"{rng.choice(TOPICS)} - {level} ({i})",
+            "description": f"Fiche de {subject} pour le niveau {level}.",
+            "level": level,
+            "subject": subject,
+            "is_premium": rng.random() < 0.45,
+            "is_teacher_only": rng.random() < 0.25,
+            "file_url": sheet_file_url(i),
+            "created_at": now - timedelta(seconds=rng.randrange(2 * 365 * 86400)),
+        }
+
+
+def generate_verifications(seed: int, flags: bytearray, now: datetime):
+    rng = random.Random(f"{seed}:verifications")
+    for i, user_flags in enumerate(flags):
+        if not user_flags & TEACHER:
+            continue
+        if user_flags & VERIFIED:
+            status = "approved"
+        elif rng.random() < 0.7:
+            status = "pending"
+        elif rng.random() < 0.5:
+            status = "rejected"
+        else:
+            continue
+        verification_id = entity_id(seed, "verification", i)
+        yield {
+            "id": verification_id,
+            "user_id": entity_id(seed, "user", i),
+            "document_url": f"/tmp/verifications/{verification_id}_justificatif.jpg",
+            "status": status,
+            "created_at": now - timedelta(seconds=rng.randrange(365 * 86400)),
+        }
+
+
+def generate_resets(seed: int, users: int, count: int, flags: bytearray, now: datetime):
+    rng = random.Random(f"{seed}:resets")
+    for i, user_index in enumerate(rng.sample(range(users), count)):
+        email = f"{'enseignant' if flags[user_index] & TEACHER else 'parent'}{user_index}@genies.example"
+        created_at = now - timedelta(minutes=rng.randrange(120))
+        yield {
+            "id": entity_id(seed, "reset", i),
+            "email": email,
+            "token": create_reset_token(email),
+            "used": rng.random() < 0.3,
+            "created_at": created_at,
+            "expires_at": created_at + timedelta(hours=1),
+        }
+
+
+def generate_download_events(seed: int, count: int, users: int, sheets: int, now: datetime):
+    rng = random.Random(f"{seed}:downloads")
+    for i in range(count):
+        sheet_index = rng.randrange(sheets)
+        yield {
+            "id": entity_id(seed, "download", i),
+            "user_id": entity_id(seed, "user", rng.randrange(users)),
+            "sheet_id": sample_sheet_id(sheet_file_url(sheet_index)),
+            "file_url": sheet_file_url(sheet_index),
+            "downloaded_at": now - timedelta(seconds=rng.randrange(365 * 86400)),
+        }
+
+
+def write_placeholder_files(count: int, workers: int):
+    os.makedirs(SAMPLE_FILES_DIR, exist_ok=True)
+
+    def write(index: int):
+        filename = f"gen_{index:07d}.pdf"
+        with open(os.path.join(SAMPLE_FILES_DIR, filename), "w") as f:
+            f.write(f"Sample PDF content for {filename}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(write, range(count), chunksize=256))
+    typer.echo(f"  files: {count:,} placeholders in {time.perf_counter() - start:.1f}s")
+
+
+async def generate(options: dict):
+    client = AsyncIOMotorClient(options["mongo_url"], maxPoolSize=options["workers"] * 2)
+    database = client[options["db_name"]]
+    seed = options["seed"]
+    now = datetime(2025, 9, 1)
+    users, sheets = options["users"], options["sheets"]
+
+    if options["drop"]:
+        for collection in ("users", "pedagogical_sheets", "teacher_verifications",
+                           "password_resets", "download_events"):
+            await database[collection].drop()
+
+    typer.echo(f"Generating into {options['db_name']} (seed {seed})")
+    # BCRYPT_ROUNDS as for the server (logins upgrade hashes below its cost)
+    rounds = int(os.getenv("BCRYPT_ROUNDS") or passwords.DEFAULT_ROUNDS)
+    password_hash = passwords.build_context(rounds).hash(options["password"])
+    flags = bytearray(users)
+    writer = Writer(database, options["workers"])
+    batch_size = options["batch_size"]
+
+    await write_batches(writer, "users", generate_users(seed, users, flags, password_hash, now), batch_size)
+    await write_batches(writer, "pedagogical_sheets", generate_sheets(seed, sheets, now), batch_size)
+    await write_batches(writer, "teacher_verifications", generate_verifications(seed, flags, now), batch_size)
+    # Reset records sit under a TTL index, so they are dated from the real clock
+    resets = min(users, int(users * options["reset_ratio"]))
+    await write_batches(
+        writer, "password_resets", generate_resets(seed, users, resets, flags, datetime.utcnow()), batch_size
+    )
+    if users and sheets and options["download_events"]:
+        await write_batches(
+            writer, "download_events",
+            generate_download_events(seed, options["download_events"], users, sheets, now), batch_size,
+        )
+    await writer.close()
+
+    if options["indexes"]:
+        start = time.perf_counter()
+        for collection, indexes in INDEXES.items():
+            await database[collection].create_indexes(indexes)
+        typer.echo(f"  indexes built in {time.perf_counter() - start:.1f}s")
+    client.close()
+
+    if options["files"]:
+        write_placeholder_files(min(options["files"], sheets), options["workers"])
+
+
+@cli.command()
+def main(
+    users: int = typer.Option(100_000, help="Number of accounts."),
+    sheets: int = typer.Option(20_000, help="Number of pedagogical sheets."),
+    download_events: int = typer.Option(200_000, help="Number of download events."),
+    reset_ratio: float = typer.Option(0.02, help="Share of users with a password reset record."),
+    files: int = typer.Option(0, help=f"Placeholder files to write to {SAMPLE_FILES_DIR}."),
+    seed: int = typer.Option(42, help="Seed for every random choice."),
+    batch_size: int = typer.Option(5000, help="Documents per insert_many."),
+    workers: int = typer.Option(8, help="Concurrent insert_many calls."),
+    password: str = typer.Option("Genie123!", help="Password shared by every generated account."),
+    mongo_url: str = typer.Option(os.getenv("MONGO_URL", "mongodb://localhost:27017")),
+    db_name: str = typer.Option(os.getenv("MONGO_DB_NAME", "ecole_des_genies")),
+    drop: bool = typer.Option(True, help="Drop the generated collections first."),
+    indexes: bool = typer.Option(True, help="Build indexes.INDEXES after loading."),
+):
+    """Fill a database with a deterministic synthetic dataset."""
+    options = dict(locals())
+    start = time.perf_counter()
+    asyncio.run(generate(options))
+    typer.echo(f"Done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    cli()
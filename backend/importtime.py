@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Import-time profiler for the API process.
+
+    python importtime.py                   # top modules and packages for `import server`
+    python importtime.py --budget-ms 1500  # exit 1 when the import exceeds the budget
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter
+(so nothing is already cached in sys.modules) and aggregates its output:
+cumulative cost of the heaviest modules, and self time summed per
+top-level package, which adds up to the total. With --runs the fastest run
+is kept to reduce noise.
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+import typer
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+cli = typer.Typer(help="Report what importing the API costs, per module.")
+
+
+@dataclass
+class ImportRecord:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> List[ImportRecord]:
+    records = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        records.append(ImportRecord(name.strip(), int(self_us), int(cumulative_us), depth))
+    return records
+
+
+def measure(module: str = "server", env: Optional[dict] = None) -> List[ImportRecord]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env={**os.environ, **(env or {})},
+        capture_output=True, text=True, check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def subtree(records: List[ImportRecord], module: str) -> List[ImportRecord]:
+    """Records imported by `module`, dropping interpreter start-up (site, encodings)."""
+    # -X importtime prints children before their parent
+    end = next(i for i, record in enumerate(records) if record.name == module and record.depth == 0)
+    start = end
+    while start > 0 and records[start - 1].depth > 0:
+        start -= 1
+    return records[start:end + 1]
+
+
+def total_us(records: List[ImportRecord], module: str) -> int:
+    return subtree(records, module)[-1].cumulative_us
+
+
+def by_package(records: List[ImportRecord]) -> dict:
+    totals = defaultdict(int)
+    for record in records:
+        totals[record.name.split(".")[0]] += record.self_us
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+@cli.command()
+def main(
+    module: str = typer.Option("server", help="Module to import."),
+    top: int = typer.Option(25, help="Rows per table."),
+    runs: int = typer.Option(3, help="Fresh-interpreter runs; the fastest one is reported."),
+    budget_ms: Optional[float] = typer.Option(None, help="Fail when the import takes longer."),
+    as_json: bool = typer.Option(False, "--json", help="Print a JSON report instead of tables."),
+):
+    """Profile `import <module>` and report cumulative cost per module."""
+    profiles = [subtree(measure(module), module) for _ in range(max(runs, 1))]
+    records = min(profiles, key=lambda run: run[-1].cumulative_us)
+    total_ms = total_us(records, module) / 1000
+    packages = by_package(records)
+    heaviest = sorted(records, key=lambda record: record.cumulative_us, reverse=True)[:top]
+
+    if as_json:
+        typer.echo(json.dumps({
+            "module": module,
+            "total_ms": total_ms,
+            "packages_ms": {name: us / 1000 for name, us in packages.items()},
+            "modules": [asdict(record) for record in heaviest],
+        }, indent=2))
+    else:
+        typer.echo(f"import {module}: {total_ms:.1f} ms ({len(records)} modules)\n")
+        typer.echo(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for record in heaviest:
+            typer.echo(f"{record.cumulative_us / 1000:>14.1f} {record.self_us / 1000:>9.1f}  "
+                       f"{'  ' * record.depth}{record.name}")
+        typer.echo(f"\n{'self ms':>14}  package")
+        for name, us in list(packages.items())[:top]:
+            typer.echo(f"{us / 1000:>14.1f}  {name}")
+
+    if budget_ms is not None and total_ms > budget_ms:
+        typer.echo(f"import {module} took {total_ms:.1f} ms, over the {budget_ms:.0f} ms budget", err=True)
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    cli()
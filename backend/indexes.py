@@ -0,0 +1,97 @@
+"""Indexes backing every query shape of the API (see tests/test_query_plans.py).
+
+Kept apart from server.py so tools building them (datagen.py) need not
+import the application.
+"""
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("user_type", ASCENDING), ("is_verified", ASCENDING)], name="user_type_verified"),
+        IndexModel([("is_premium", ASCENDING)], name="is_premium"),
+        # Admin user listing (newest first) and search; see UserRepository.search
+        IndexModel(
+            [("user_type", ASCENDING), ("is_premium", ASCENDING), ("is_verified", ASCENDING), ("_id", DESCENDING)],
+            name="admin_listing",
+        ),
+        IndexModel([("name_key", ASCENDING), ("id", ASCENDING)], name="name_key"),
+    ],
+    "pedagogical_sheets": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel(
+            [("level", ASCENDING), ("subject", ASCENDING), ("is_teacher_only", ASCENDING),
+             ("is_premium", ASCENDING), ("created_at", DESCENDING)],
+            name="catalog_level",
+        ),
+        IndexModel(
+            [("subject", ASCENDING), ("is_teacher_only", ASCENDING), ("is_premium", ASCENDING),
+             ("created_at", DESCENDING)],
+            name="catalog_subject",
+        ),
+        IndexModel(
+            [("is_teacher_only", ASCENDING), ("is_premium", ASCENDING), ("created_at", DESCENDING)],
+            name="catalog_tier",
+        ),
+        IndexModel([("is_premium", ASCENDING)], name="is_premium"),
+        # Storage reconciliation and download lookups by file
+        IndexModel([("file_url", ASCENDING)], name="file_url"),
+        # Full-text catalog search joins matching previews by content hash
+        IndexModel([("content_hash", ASCENDING)], name="content_hash"),
+    ],
+    "sheet_previews": [
+        # Full-text search over the bodies of uploaded PDFs
+        IndexModel([("text", TEXT)], default_language="french", name="text"),
+    ],
+    "password_resets": [
+        IndexModel([("token", ASCENDING)], name="token"),
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "teacher_verifications": [
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING)], name="user_status"),
+        # Review queue: oldest pending first, expired claims by status
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        # Storage reconciliation
+        IndexModel([("document_url", ASCENDING)], name="document_url"),
+        IndexModel([("original_url", ASCENDING)], sparse=True, name="original_url"),
+    ],
+    "uploads": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        # Garbage collection of abandoned sessions
+        IndexModel([("expires_at", ASCENDING)], sparse=True, name="expires_at"),
+        # Finished sessions are kept a week for inspection
+        IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=7 * 86400, name="finished_at_ttl"),
+    ],
+    "storage_reports": [
+        IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=30 * 86400, name="finished_at_ttl"),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="status_run_at"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease"),
+        # Only finished jobs carry finished_at; they are kept a week for inspection
+        IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=7 * 86400, name="finished_at_ttl"),
+    ],
+    "rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "dead_jobs": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    ],
+    "outbox": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease"),
+        IndexModel([("batch", ASCENDING)], sparse=True, name="batch"),
+        IndexModel([("sent_at", ASCENDING)], expireAfterSeconds=30 * 86400, name="sent_at_ttl"),
+    ],
+}
+
+# Indexes superseded by an entry of INDEXES, dropped before creating it
+OBSOLETE_INDEXES = {
+    "password_resets": ["email"],
+}
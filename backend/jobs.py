@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Background jobs: handlers, retry policy and the worker pool.
+
+Handlers enqueue side effects with `repos.jobs.enqueue(type, payload)` and
+return; a JobWorkerPool claims due jobs from the `jobs` collection under a
+lease, runs the registered handler and acks it. Failures are retried with
+exponential backoff and jitter; after `max_attempts` the job moves to
+`dead_jobs`. A worker that dies mid-job lets its lease expire and another
+worker re-runs it, so handlers must be idempotent (delivery is at least once).
+
+The pool runs inside each API worker (JOB_WORKERS > 0) or standalone:
+
+    python worker.py --concurrency 8
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+import uuid
+from typing import Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_BACKOFF_SECONDS = float(os.getenv("JOB_BACKOFF_SECONDS", "5"))
+JOB_BACKOFF_MAX_SECONDS = float(os.getenv("JOB_BACKOFF_MAX_SECONDS", "3600"))
+
+JOBS_PROCESSED = metrics.Counter(
+    "jobs_processed_total",
+    "Background job attempts by type and outcome (done, retry, dead).",
+    ("type", "result"),
+)
+JOB_DURATION = metrics.Histogram(
+    "job_duration_seconds",
+    "Background job run time by type.",
+    ("type",),
+)
+
+HANDLERS = {}
+# Job types allowed to run longer than the pool's lease
+LEASES = {}
+
+
+def handler(job_type: str, lease_seconds: Optional[float] = None):
+    """Register an async `handler(payload)` for a job type.
+
+    A handler that may run longer than JOB_LEASE_SECONDS passes its own
+    `lease_seconds`; the claim is extended to it before the handler runs.
+    """
+    def register(function):
+        HANDLERS[job_type] = function
+        if lease_seconds is not None:
+            LEASES[job_type] = lease_seconds
+        return function
+    return register
+
+
+def backoff_delay(attempts: int, base: float = JOB_BACKOFF_SECONDS, cap: float = JOB_BACKOFF_MAX_SECONDS) -> float:
+    # Jitter keeps a burst of failed jobs from retrying in lockstep
+    return random.uniform(0.5, 1.0) * min(cap, base * 2 ** (attempts - 1))
+
+
+class JobWorkerPool:
+    def __init__(self, repository, concurrency: int = JOB_WORKERS, lease_seconds: float = JOB_LEASE_SECONDS,
+                 poll_seconds: float = JOB_POLL_SECONDS):
+        self.repository = repository
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._tasks = []
+
+    def start(self):
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    def notify(self):
+        """Wake idle workers after a local enqueue instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    async def stop(self, timeout: float = 10.0):
+        # In-flight jobs get `timeout` to finish; cancelled ones are re-run
+        # elsewhere once their lease expires
+        self._stopping = True
+        self._wakeup.set()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                processed = await self.run_once()
+            except Exception:
+                logger.exception("Job worker iteration failed")
+                processed = False
+            if not processed and not self._stopping:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run_once(self) -> bool:
+        """Claim and run one due job; False when the queue had nothing due."""
+        job = await self.repository.claim(self.worker_id, self.lease_seconds)
+        if job is None:
+            return False
+        job_type = job["type"]
+        start = time.perf_counter()
+        try:
+            function = HANDLERS.get(job_type)
+            if function is None:
+                raise LookupError(f"no handler registered for job type {job_type!r}")
+            lease_seconds = LEASES.get(job_type, self.lease_seconds)
+            if lease_seconds > self.lease_seconds:
+                await self.repository.extend(job, lease_seconds)
+            await asyncio.wait_for(function(job["payload"]), lease_seconds)
+        except Exception as exc:
+            error = "".join(traceback.format_exception_only(type(exc), exc)).strip()
+            if job["attempts"] >= job["max_attempts"]:
+                logger.error("Job %s (%s) failed for good: %s", job["id"], job_type, error)
+                await self.repository.dead_letter(job, error)
+                JOBS_PROCESSED.inc(job_type, "dead")
+            else:
+                await self.repository.retry(job, error, backoff_delay(job["attempts"]))
+                JOBS_PROCESSED.inc(job_type, "retry")
+        else:
+            await self.repository.complete(job)
+            JOBS_PROCESSED.inc(job_type, "done")
+        finally:
+            JOB_DURATION.observe(time.perf_counter() - start, job_type)
+        return True
@@ -0,0 +1,136 @@
+"""Event-loop lag monitor.
+
+A coroutine sleeps for a fixed interval and measures how late it wakes up:
+that delay is the time other callbacks held the loop. A watchdog thread
+watches the coroutine's heartbeat and, as soon as the loop has been held
+longer than the threshold, captures the stack of the code holding it, so
+blocking calls show up with their file and line while they are running.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100"))
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+MAX_RECORDED_STALLS = 100
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LOOP_LAG = metrics.Histogram(
+    "event_loop_lag_seconds",
+    "Scheduling delay of the event loop, measured every LOOP_LAG_INTERVAL_MS.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+LOOP_LAG_CURRENT = metrics.Gauge(
+    "event_loop_lag_current_seconds",
+    "Most recent event loop scheduling delay.",
+)
+LOOP_STALLS = metrics.Counter(
+    "event_loop_stalls_total",
+    "Event loop stalls above the threshold, by innermost application frame.",
+    ("location",),
+)
+
+
+def _blocking_location(summary) -> str:
+    # Innermost frame from the backend's own code, else the innermost frame
+    for frame in reversed(summary):
+        if frame.filename.startswith(APP_DIR):
+            return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    if summary:
+        frame = summary[-1]
+        return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    return "unknown"
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_MS / 1000,
+                 threshold: float = LOOP_LAG_THRESHOLD_MS / 1000):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = deque(maxlen=MAX_RECORDED_STALLS)
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+        self._current_stall = None
+
+    def start(self):
+        """Start monitoring the running loop; call from inside the loop."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _measure(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_CURRENT.set(lag)
+            stall = self._current_stall
+            if stall is not None:
+                # The stall captured by the watchdog is over; record how long it lasted
+                stall["duration_ms"] = round(lag * 1000, 1)
+                self._current_stall = None
+                logger.warning(
+                    "Event loop blocked for %.0f ms at %s\n%s",
+                    lag * 1000, stall["location"], "".join(stall["stack"]),
+                )
+
+    def _watch(self):
+        poll = min(self.threshold / 2, 0.05)
+        while not self._stop.wait(poll):
+            held = time.monotonic() - self._heartbeat - self.interval
+            if held < self.threshold or self._current_stall is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            summary = traceback.extract_stack(frame)
+            del frame
+            stall = {
+                "detected_at": time.time(),
+                "held_ms_at_capture": round(held * 1000, 1),
+                "duration_ms": None,
+                "location": _blocking_location(summary),
+                "stack": summary.format(),
+            }
+            self._current_stall = stall
+            self.stalls.append(stall)
+            LOOP_STALLS.inc(stall["location"])
+
+    def report(self) -> dict:
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "current_lag_ms": round(LOOP_LAG_CURRENT.value() * 1000, 3),
+            "stalls": list(self.stalls),
+        }
+
+
+loop_monitor = LoopLagMonitor()
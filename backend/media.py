@@ -0,0 +1,173 @@
+"""Derived media for uploads, computed off the request path.
+
+Upload handlers store the file as received and enqueue a job. The job
+detects the real type from the file's magic bytes (never from its name or
+the client's Content-Type) and runs the CPU-heavy work in a process pool
+(MEDIA_WORKERS), so neither the event loop nor other jobs stall behind it.
+
+Verification photos become a review copy: orientation applied, metadata
+(EXIF, GPS, ICC) dropped, downscaled to REVIEW_MAX_SIDE and re-encoded as
+JPEG. The original moves to COLD_STORAGE_DIR, which can sit on cheaper
+storage, and reviewers only download the review copy. Documents that cannot
+be downscaled (PDF, HEIC) move there too and are reviewed from there.
+
+Pedagogical sheets get a preview: the text of a PDF (pypdf, for search) and
+a small first-page thumbnail (pdfium). Both depend only on the file's bytes,
+so they are cached by content hash and re-uploads of the same file reuse
+them.
+
+Pillow, pypdf and pypdfium2 are imported inside the pool functions only, so
+the API process never loads them (see tests/test_import_budget.py).
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import metrics
+
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+REVIEW_MAX_SIDE = int(os.getenv("REVIEW_MAX_SIDE", "1600"))
+REVIEW_JPEG_QUALITY = int(os.getenv("REVIEW_JPEG_QUALITY", "80"))
+COLD_STORAGE_DIR = os.getenv("COLD_STORAGE_DIR", "/tmp/cold_storage")
+PREVIEWS_DIR = os.getenv("PREVIEWS_DIR", "/tmp/previews")
+THUMBNAIL_SIDE = int(os.getenv("THUMBNAIL_SIDE", "320"))
+# Extracted text kept per document, far below Mongo's 16 MB document limit
+MAX_PREVIEW_TEXT_CHARS = 200_000
+# Decompression-bomb guard: refuse images above this many pixels
+MAX_IMAGE_PIXELS = 100_000_000
+
+MEDIA_BYTES = metrics.Counter(
+    "media_bytes_total",
+    "Bytes of processed uploads by kind, before (original) and after (derived) processing.",
+    ("kind", "stage"),
+)
+
+MAGIC_NUMBERS = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+    (b"%PDF-", "application/pdf"),
+]
+HEIF_BRANDS = {b"heic", b"heix", b"heif", b"mif1", b"msf1"}
+# Types Pillow decodes without plugins; others (HEIC, PDF) are kept as sent
+RESIZABLE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/tiff", "image/webp"}
+
+
+def detect_type(head: bytes) -> Optional[str]:
+    """Content type from the first bytes of a file, or None when unknown."""
+    for magic, content_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in HEIF_BRANDS:
+        return "image/heic"
+    return None
+
+
+def sniff(path: str) -> Optional[str]:
+    with open(path, "rb") as f:
+        return detect_type(f.read(16))
+
+
+def media_process_pool(workers: int = MEDIA_WORKERS) -> ProcessPoolExecutor:
+    # spawn, not fork: the parent runs an event loop and driver threads
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def downscale_image(source: str, destination: str, max_side: int = REVIEW_MAX_SIDE,
+                    quality: int = REVIEW_JPEG_QUALITY) -> dict:
+    """Write a metadata-free JPEG of `source` no larger than max_side; runs in a pool process."""
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    with Image.open(source) as original:
+        original.draft("RGB", (max_side, max_side))  # JPEG: decode at a reduced scale
+        # Bake the EXIF orientation into the pixels before the EXIF is dropped
+        image = ImageOps.exif_transpose(original)
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, "white")
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    size = _save_jpeg(image, destination, quality)
+    return {"width": image.width, "height": image.height, "bytes": size}
+
+
+def _save_jpeg(image, destination: str, quality: int) -> int:
+    # A name of its own, so concurrent writers of the same image never share a temp file
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(destination), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            # No exif= or icc_profile= argument: the file carries no metadata
+            image.save(f, "JPEG", quality=quality, optimize=True, progressive=True)
+        os.chmod(partial, 0o644)  # mkstemp creates it owner-only
+        os.replace(partial, destination)
+    except BaseException:
+        try:
+            os.remove(partial)
+        except FileNotFoundError:
+            pass
+        raise
+    return os.path.getsize(destination)
+
+
+def extract_pdf_text(source: str, max_chars: int = MAX_PREVIEW_TEXT_CHARS) -> tuple:
+    """(text, page_count) of a PDF; runs in a pool process."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(source)
+    parts, size = [], 0
+    for page in reader.pages:
+        if size >= max_chars:
+            break
+        text = page.extract_text() or ""
+        parts.append(text)
+        size += len(text)
+    return "\n".join(parts)[:max_chars], len(reader.pages)
+
+
+def render_pdf_thumbnail(source: str, destination: str, side: int = THUMBNAIL_SIDE) -> int:
+    """JPEG of the first page fitting in side x side; returns its size in bytes."""
+    import pypdfium2
+
+    document = pypdfium2.PdfDocument(source)
+    try:
+        page = document[0]
+        scale = side / max(page.get_size())
+        image = page.render(scale=scale).to_pil().convert("RGB")
+    finally:
+        document.close()
+    return _save_jpeg(image, destination, quality=75)
+
+
+def sheet_preview(source: str, content_type: Optional[str], thumbnail: str) -> dict:
+    """Text, page count and thumbnail for a sheet file; runs in a pool process."""
+    if content_type == "application/pdf":
+        text, page_count = extract_pdf_text(source)
+        return {"text": text, "page_count": page_count, "thumbnail_bytes": render_pdf_thumbnail(source, thumbnail)}
+    if content_type in RESIZABLE_TYPES:
+        review = downscale_image(source, thumbnail, THUMBNAIL_SIDE, quality=75)
+        return {"text": "", "page_count": 1, "thumbnail_bytes": review["bytes"]}
+    return {"text": "", "page_count": None, "thumbnail_bytes": 0}
+
+
+def cold_path(path: str, kind: str) -> str:
+    return os.path.join(COLD_STORAGE_DIR, kind, os.path.basename(path))
+
+
+def archive_original(path: str, kind: str) -> str:
+    """Move an original into cold storage; returns its new path."""
+    destination = cold_path(path, kind)
+    if path != destination:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.move(path, destination)
+    return destination
@@ -0,0 +1,523 @@
+"""In-memory stand-in for the subset of the Motor collection API the app uses.
+
+Documents live in plain dicts inside the process. Filters, updates, sorts,
+projections and unique indexes follow MongoDB semantics closely enough for
+the repositories, so handlers can be exercised without a database and the
+framework's own overhead can be measured apart from Mongo.
+"""
+import copy
+import re
+import unicodedata
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+_MISSING = object()
+
+
+def get_path(document, path: str):
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+
+def _set_path(document, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+
+def _unset_path(document, path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(parts[-1], None)
+
+
+def _type_rank(value) -> int:
+    # BSON comparison order for the types the app stores
+    if value is None or value is _MISSING:
+        return 0
+    if isinstance(value, bool):
+        return 6
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, ObjectId):
+        return 5
+    if isinstance(value, datetime):
+        return 7
+    return 8
+
+
+def sort_key(value):
+    rank = _type_rank(value)
+    if rank == 0:
+        return (0, 0)
+    if rank in (3, 4):
+        return (rank, repr(value))
+    return (rank, value)
+
+
+def _compare(value, operand, operator) -> bool:
+    if value is _MISSING or _type_rank(value) != _type_rank(operand):
+        return False
+    if operator == "$gt":
+        return value > operand
+    if operator == "$gte":
+        return value >= operand
+    if operator == "$lt":
+        return value < operand
+    return value <= operand
+
+
+def _equals(value, operand) -> bool:
+    if value is _MISSING:
+        return operand is None
+    if isinstance(value, list) and not isinstance(operand, list):
+        return any(_equals(item, operand) for item in value)
+    if isinstance(value, bool) != isinstance(operand, bool):
+        return False
+    return value == operand
+
+
+def _match_operators(value, condition: dict) -> bool:
+    for operator, operand in condition.items():
+        if operator == "$eq":
+            ok = _equals(value, operand)
+        elif operator == "$ne":
+            ok = not _equals(value, operand)
+        elif operator in ("$gt", "$gte", "$lt", "$lte"):
+            ok = _compare(value, operand, operator)
+        elif operator == "$in":
+            ok = any(_equals(value, item) for item in operand)
+        elif operator == "$nin":
+            ok = not any(_equals(value, item) for item in operand)
+        elif operator == "$exists":
+            ok = (value is not _MISSING) == bool(operand)
+        elif operator == "$regex":
+            flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+            ok = isinstance(value, str) and re.search(operand, value, flags) is not None
+        elif operator == "$options":
+            ok = True
+        elif operator == "$not":
+            ok = not _match_operators(value, operand)
+        else:
+            raise NotImplementedError(f"query operator {operator} is not supported in memory")
+        if not ok:
+            return False
+    return True
+
+
+def _words(text: str) -> set:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return set(re.findall(r"\w+", "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()))
+
+
+def _text_matches(document, search: str) -> bool:
+    # $text without stemming or stop words: any search word in any string field
+    words = set()
+    for value in document.values():
+        if isinstance(value, str):
+            words |= _words(value)
+    return bool(_words(search) & words)
+
+
+def matches(document, filter) -> bool:
+    for key, condition in (filter or {}).items():
+        if key == "$text":
+            if not _text_matches(document, condition["$search"]):
+                return False
+        elif key == "$and":
+            if not all(matches(document, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, part) for part in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, part) for part in condition):
+                return False
+        else:
+            value = get_path(document, key)
+            if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+                if not _match_operators(value, condition):
+                    return False
+            elif isinstance(condition, re.Pattern):
+                if not (isinstance(value, str) and condition.search(value)):
+                    return False
+            elif not _equals(value, condition):
+                return False
+    return True
+
+
+def apply_update(document, update, inserting: bool = False):
+    if not any(key.startswith("$") for key in update):
+        # Replacement document
+        kept_id = document.get("_id")
+        document.clear()
+        document.update(copy.deepcopy(update))
+        if kept_id is not None:
+            document["_id"] = kept_id
+        return
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            current = get_path(document, path)
+            if operator == "$set":
+                _set_path(document, path, copy.deepcopy(value))
+            elif operator == "$setOnInsert":
+                if inserting:
+                    _set_path(document, path, copy.deepcopy(value))
+            elif operator == "$unset":
+                _unset_path(document, path)
+            elif operator == "$inc":
+                _set_path(document, path, (0 if current is _MISSING else current) + value)
+            elif operator == "$min":
+                if current is _MISSING or sort_key(value) < sort_key(current):
+                    _set_path(document, path, value)
+            elif operator == "$max":
+                if current is _MISSING or sort_key(value) > sort_key(current):
+                    _set_path(document, path, value)
+            elif operator == "$push":
+                items = [] if current is _MISSING else current
+                if isinstance(value, dict) and "$each" in value:
+                    items.extend(copy.deepcopy(value["$each"]))
+                else:
+                    items.append(copy.deepcopy(value))
+                _set_path(document, path, items)
+            elif operator == "$pull":
+                if current is not _MISSING:
+                    _set_path(document, path, [item for item in current if not _equals(item, value)])
+            elif operator == "$currentDate":
+                _set_path(document, path, datetime.utcnow())
+            else:
+                raise NotImplementedError(f"update operator {operator} is not supported in memory")
+
+
+def project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        result = {}
+        for path in include:
+            value = get_path(document, path)
+            if value is not _MISSING:
+                _set_path(result, path, copy.deepcopy(value))
+        if projection.get("_id", 1) and "_id" in document:
+            result["_id"] = document["_id"]
+        return result
+    result = copy.deepcopy(document)
+    for path, value in projection.items():
+        if not value:
+            _unset_path(result, path)
+    return result
+
+
+def _normalize_sort(key_or_list, direction=None):
+    if key_or_list is None:
+        return []
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+
+def sort_documents(documents, sort):
+    for path, direction in reversed(_normalize_sort(sort)):
+        documents.sort(key=lambda doc: sort_key(get_path(doc, path)), reverse=direction == -1)
+    return documents
+
+
+class MemoryCursor:
+    def __init__(self, collection, filter, projection):
+        self._collection = collection
+        self._filter = filter
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _results(self):
+        documents = [doc for doc in self._collection._documents.values() if matches(doc, self._filter)]
+        sort_documents(documents, self._sort)
+        documents = documents[self._skip:]
+        if self._limit:
+            documents = documents[:self._limit]
+        return [project(doc, self._projection) for doc in documents]
+
+    async def to_list(self, length=None):
+        results = self._results()
+        return results if length is None else results[:length]
+
+    def __aiter__(self):
+        self._iterator = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class MemoryCollection:
+    def __init__(self, name: str):
+        self.name = name
+        # _id -> document, in insertion order
+        self._documents = {}
+        # index name -> (key paths, unique)
+        self._indexes = {}
+
+    # Indexes
+    async def create_indexes(self, models):
+        # All or nothing, as createIndexes: one unique index over duplicates fails the list
+        indexes = {}
+        for model in models:
+            document = model.document
+            paths, unique = tuple(document["key"].keys()), bool(document.get("unique"))
+            if unique:
+                self._check_existing_unique(document["name"], paths)
+            indexes[document["name"]] = (paths, unique)
+        self._indexes.update(indexes)
+        return list(indexes)
+
+    async def create_index(self, keys, **kwargs):
+        keys = _normalize_sort(keys)
+        name = kwargs.get("name") or "_".join(f"{path}_{direction}" for path, direction in keys)
+        self._indexes[name] = (tuple(path for path, _ in keys), bool(kwargs.get("unique")))
+        return name
+
+    async def drop_index(self, name: str):
+        if name not in self._indexes:
+            raise OperationFailure(f"index not found with name [{name}]", 27)
+        del self._indexes[name]
+
+    def _check_existing_unique(self, name: str, paths: tuple):
+        keys = []
+        for document in self._documents.values():
+            key = tuple(sort_key(get_path(document, path)) for path in paths)
+            if key in keys:
+                raise OperationFailure(
+                    f"Index build failed: E11000 duplicate key error collection: {self.name} index: {name}", 11000
+                )
+            keys.append(key)
+
+    def _check_unique(self, document, ignore_id=None):
+        for name, (paths, unique) in self._indexes.items():
+            if not unique:
+                continue
+            key = tuple(sort_key(get_path(document, path)) for path in paths)
+            for other_id, other in self._documents.items():
+                if other_id == ignore_id:
+                    continue
+                if tuple(sort_key(get_path(other, path)) for path in paths) == key:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.name} index: {name}",
+                        11000,
+                        {"keyPattern": {path: 1 for path in paths}},
+                    )
+
+    # Reads
+    def find(self, filter=None, projection=None, sort=None, limit=0):
+        cursor = MemoryCursor(self, filter or {}, projection)
+        if sort:
+            cursor.sort(sort)
+        if limit:
+            cursor.limit(limit)
+        return cursor
+
+    async def find_one(self, filter=None, projection=None, sort=None):
+        results = await self.find(filter, projection, sort=sort, limit=1).to_list(1)
+        return results[0] if results else None
+
+    async def count_documents(self, filter=None):
+        return sum(1 for doc in self._documents.values() if matches(doc, filter))
+
+    async def estimated_document_count(self):
+        return len(self._documents)
+
+    async def distinct(self, key, filter=None):
+        values = []
+        for doc in self._documents.values():
+            value = get_path(doc, key)
+            if value is not _MISSING and matches(doc, filter) and value not in values:
+                values.append(value)
+        return values
+
+    # Writes
+    def _insert(self, document):
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self._documents:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_", 11000)
+        self._check_unique(document)
+        self._documents[document["_id"]] = copy.deepcopy(document)
+        return document["_id"]
+
+    async def insert_one(self, document):
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents, ordered=True):
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted.append(self._insert(document))
+            except DuplicateKeyError as exc:
+                errors.append({"index": index, "code": 11000, "errmsg": str(exc), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({
+                "writeErrors": errors, "writeConcernErrors": [], "nInserted": len(inserted),
+                "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [],
+            })
+        return InsertManyResult(inserted, True)
+
+    def _upsert_document(self, filter, update):
+        document = {
+            key: value for key, value in filter.items()
+            if not key.startswith("$") and not (isinstance(value, dict) and any(k.startswith("$") for k in value))
+        }
+        apply_update(document, update, inserting=True)
+        return document
+
+    def _update(self, filter, update, upsert, many, sort=None):
+        candidates = [doc for doc in self._documents.values() if matches(doc, filter)]
+        sort_documents(candidates, sort)
+        if not many:
+            candidates = candidates[:1]
+        modified = 0
+        for document in candidates:
+            updated = copy.deepcopy(document)
+            apply_update(updated, update)
+            if updated != document:
+                self._check_unique(updated, ignore_id=document["_id"])
+                self._documents[document["_id"]] = updated
+                modified += 1
+        upserted_id = None
+        if not candidates and upsert:
+            upserted_id = self._insert(self._upsert_document(filter, update))
+        return candidates, modified, upserted_id
+
+    async def update_one(self, filter, update, upsert=False):
+        matched, modified, upserted_id = self._update(filter, update, upsert, many=False)
+        raw = {"n": len(matched) or int(upserted_id is not None), "nModified": modified}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    async def update_many(self, filter, update, upsert=False):
+        matched, modified, upserted_id = self._update(filter, update, upsert, many=True)
+        raw = {"n": len(matched) or int(upserted_id is not None), "nModified": modified}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    async def bulk_write(self, requests, ordered=True):
+        # Only UpdateOne is used by the repositories
+        matched = modified = 0
+        for request in requests:
+            if not isinstance(request, UpdateOne):
+                raise NotImplementedError(f"bulk_write does not support {type(request).__name__}")
+            found, changed, _ = self._update(request._filter, request._doc, request._upsert, many=False)
+            matched += len(found)
+            modified += changed
+        return BulkWriteResult({
+            "writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+            "nMatched": matched, "nModified": modified, "nRemoved": 0, "upserted": [],
+        }, True)
+
+    async def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE):
+        matched, _, upserted_id = self._update(filter, update, upsert, many=False, sort=sort)
+        if matched:
+            if return_document == ReturnDocument.AFTER:
+                return project(self._documents[matched[0]["_id"]], projection)
+            return project(matched[0], projection)
+        if upserted_id is not None and return_document == ReturnDocument.AFTER:
+            return project(self._documents[upserted_id], projection)
+        return None
+
+    async def find_one_and_delete(self, filter, projection=None, sort=None):
+        candidates = sort_documents(
+            [doc for doc in self._documents.values() if matches(doc, filter)], sort
+        )
+        if not candidates:
+            return None
+        document = self._documents.pop(candidates[0]["_id"])
+        return project(document, projection)
+
+    async def delete_one(self, filter):
+        for document_id, document in self._documents.items():
+            if matches(document, filter):
+                del self._documents[document_id]
+                return DeleteResult({"n": 1}, True)
+        return DeleteResult({"n": 0}, True)
+
+    async def delete_many(self, filter):
+        doomed = [doc_id for doc_id, doc in self._documents.items() if matches(doc, filter)]
+        for document_id in doomed:
+            del self._documents[document_id]
+        return DeleteResult({"n": len(doomed)}, True)
+
+    async def drop(self):
+        self._documents.clear()
+        self._indexes.clear()
+
+
+class MemoryDatabase:
+    """Dict of MemoryCollection objects, accessed like a Motor database."""
+
+    def __init__(self, name: str = "memory"):
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(name)
+        return collection
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self):
+        return list(self._collections)
+
+    async def command(self, command, *args, **kwargs):
+        if command in ("ping", {"ping": 1}):
+            return {"ok": 1.0}
+        raise NotImplementedError(f"command {command!r} is not supported in memory")
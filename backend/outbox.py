@@ -0,0 +1,342 @@
+"""Email outbox: templated messages queued in Mongo and delivered in batches.
+
+Request handlers render a message from a precompiled template and insert it
+into the `outbox` collection (one write, no network I/O to a mail server).
+An OutboxDispatcher claims due messages in batches, paces them to
+OUTBOX_RATE_PER_SECOND and hands them to a transport:
+
+- EMAIL_TRANSPORT=file (default, development): one .eml file per message
+  under EMAIL_LOG_DIR, never overwriting earlier ones
+- EMAIL_TRANSPORT=smtp: a pool of persistent SMTP connections (SMTP_POOL_SIZE)
+  reused across batches and reconnected when the server drops them
+
+Transient failures are retried with the job queue's backoff; permanent
+rejections (5xx) and messages out of attempts are marked failed.
+"""
+import asyncio
+import logging
+import os
+import queue
+import smtplib
+import string
+import textwrap
+import threading
+import time
+import uuid
+from datetime import datetime
+from email.message import EmailMessage
+from email.utils import format_datetime
+from typing import List, Optional
+
+import metrics
+from jobs import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "file")
+EMAIL_FROM = os.getenv("EMAIL_FROM", "L'École des Génies <no-reply@ecoledesgenies.fr>")
+EMAIL_LOG_DIR = os.getenv("EMAIL_LOG_DIR", "/tmp/email_logs")
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "25"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() == "true"
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true").lower() == "true"
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_RATE_PER_SECOND = float(os.getenv("OUTBOX_RATE_PER_SECOND", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+
+EMAILS = metrics.Counter(
+    "outbox_emails_total",
+    "Outbox delivery attempts by template and outcome (sent, retry, failed).",
+    ("template", "result"),
+)
+
+
+class EmailTemplate:
+    """Subject and body compiled once at import; render() only substitutes."""
+
+    def __init__(self, subject: str, body: str):
+        self.subject = string.Template(subject)
+        self.body = string.Template(textwrap.dedent(body).strip() + "\n")
+
+    def render(self, **context) -> tuple:
+        return self.subject.substitute(context), self.body.substitute(context)
+
+
+TEMPLATES = {
+    "password_reset": EmailTemplate(
+        "Réinitialisation de mot de passe - L'École des Génies",
+        """
+        Bonjour,
+
+        Vous avez demandé à réinitialiser votre mot de passe pour L'École des Génies.
+
+        Cliquez sur le lien suivant pour réinitialiser votre mot de passe :
+        ${reset_link}
+
+        Ce lien expirera dans 1 heure.
+
+        Si vous n'avez pas demandé cette réinitialisation, ignorez cet email.
+
+        Cordialement,
+        L'équipe de L'École des Génies
+        """,
+    ),
+}
+
+
+def render_message(template: str, to: str, max_attempts: int = OUTBOX_MAX_ATTEMPTS, **context) -> dict:
+    subject, body = TEMPLATES[template].render(**context)
+    now = datetime.utcnow()
+    return {
+        "id": str(uuid.uuid4()),
+        "template": template,
+        "to": to,
+        "subject": subject,
+        "body": body,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "next_attempt_at": now,
+        "created_at": now,
+    }
+
+
+def build_email(message: dict) -> EmailMessage:
+    email = EmailMessage()
+    email["From"] = EMAIL_FROM
+    email["To"] = message["to"]
+    email["Subject"] = message["subject"]
+    email["Date"] = format_datetime(message["created_at"])
+    # Stable across retries, so receivers can drop duplicate deliveries
+    email["Message-ID"] = f"<{message['id']}@ecoledesgenies.fr>"
+    email.set_content(message["body"])
+    return email
+
+
+class DeliveryError(Exception):
+    def __init__(self, reason: str, permanent: bool, broken: bool = False):
+        super().__init__(reason)
+        self.permanent = permanent
+        # The SMTP session itself failed, not just this message
+        self.broken = broken
+
+
+class FileSink:
+    """Development transport: writes each message to its own .eml file."""
+
+    concurrency = 1
+
+    def __init__(self, directory: str = EMAIL_LOG_DIR):
+        self.directory = directory
+
+    def send_batch(self, messages: List[dict]) -> List[Optional[DeliveryError]]:
+        os.makedirs(self.directory, exist_ok=True)
+        for message in messages:
+            filename = f"{message['created_at']:%Y%m%dT%H%M%S}_{message['template']}_{message['id']}.eml"
+            with open(os.path.join(self.directory, filename), "wb") as f:
+                f.write(build_email(message).as_bytes())
+        return [None] * len(messages)
+
+    def close(self):
+        pass
+
+
+class SMTPPool:
+    """Up to `size` persistent SMTP connections, one per concurrent batch chunk."""
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, username: str = SMTP_USERNAME,
+                 password: str = SMTP_PASSWORD, starttls: bool = SMTP_STARTTLS, size: int = SMTP_POOL_SIZE,
+                 timeout: float = SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.concurrency = size
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        with self._lock:
+            self.connections_opened += 1
+        return connection
+
+    def _acquire(self) -> smtplib.SMTP:
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            # Servers drop idle sessions; a NOOP is cheaper than a failed batch
+            try:
+                if connection.noop()[0] == 250:
+                    return connection
+            except (OSError, smtplib.SMTPException):
+                pass
+            self._discard(connection)
+
+    @staticmethod
+    def _discard(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def send_batch(self, messages: List[dict]) -> List[Optional[DeliveryError]]:
+        results = []
+        with self._slots:
+            try:
+                connection = self._acquire()
+            except (OSError, smtplib.SMTPException) as exc:
+                return [DeliveryError(f"connect failed: {exc}", permanent=False)] * len(messages)
+            for message in messages:
+                results.append(self._send(connection, message))
+                if isinstance(results[-1], DeliveryError) and results[-1].broken:
+                    # Drop the session and leave the rest of the chunk for the retry
+                    self._discard(connection)
+                    remaining = len(messages) - len(results)
+                    results.extend([DeliveryError("not attempted after connection error", False)] * remaining)
+                    return results
+            self._idle.put(connection)
+        return results
+
+    @staticmethod
+    def _send(connection, message: dict) -> Optional[DeliveryError]:
+        try:
+            refused = connection.send_message(build_email(message))
+        except smtplib.SMTPRecipientsRefused as exc:
+            code, reason = next(iter(exc.recipients.values()))
+            return DeliveryError(f"{code} {reason!r}", permanent=code >= 500)
+        except smtplib.SMTPResponseException as exc:
+            return DeliveryError(f"{exc.smtp_code} {exc.smtp_error!r}", permanent=exc.smtp_code >= 500)
+        except (OSError, smtplib.SMTPException) as exc:
+            return DeliveryError(str(exc) or type(exc).__name__, permanent=False, broken=True)
+        if refused:
+            return DeliveryError(f"refused: {refused}", permanent=True)
+        return None
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                connection.quit()
+            except Exception:
+                self._discard(connection)
+
+
+def build_transport():
+    if EMAIL_TRANSPORT == "smtp":
+        return SMTPPool()
+    return FileSink()
+
+
+class Throttle:
+    """Paces sends to `rate` messages per second (0 disables)."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next = time.monotonic()
+
+    async def acquire(self, count: int):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        start = max(self._next, now)
+        self._next = start + count / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class OutboxDispatcher:
+    def __init__(self, repository, transport, batch_size: int = OUTBOX_BATCH_SIZE,
+                 rate: float = OUTBOX_RATE_PER_SECOND, poll_seconds: float = OUTBOX_POLL_SECONDS,
+                 lease_seconds: float = OUTBOX_LEASE_SECONDS):
+        self.repository = repository
+        self.transport = transport
+        self.batch_size = batch_size
+        self.throttle = Throttle(rate)
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def stop(self, timeout: float = 10.0):
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                pass  # the claimed batch is re-sent once its lease expires
+            self._task = None
+        await asyncio.to_thread(self.transport.close)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                sent = await self.dispatch_once()
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+                sent = 0
+            if not sent and not self._stopping:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def dispatch_once(self) -> int:
+        """Deliver one batch; returns the number of messages claimed."""
+        messages = await self.repository.claim_batch(self.worker_id, self.batch_size, self.lease_seconds)
+        if not messages:
+            return 0
+        size = -(-len(messages) // max(self.transport.concurrency, 1))
+        chunks = [messages[i:i + size] for i in range(0, len(messages), size)]
+
+        async def deliver(chunk):
+            await self.throttle.acquire(len(chunk))
+            return await asyncio.to_thread(self.transport.send_batch, chunk)
+
+        results = await asyncio.gather(*(deliver(chunk) for chunk in chunks))
+        sent = []
+        for chunk, errors in zip(chunks, results):
+            for message, error in zip(chunk, errors):
+                if error is None:
+                    sent.append(message["id"])
+                    EMAILS.inc(message["template"], "sent")
+                elif error.permanent or message["attempts"] >= message["max_attempts"]:
+                    logger.warning("Email %s to %s failed: %s", message["id"], message["to"], error)
+                    await self.repository.fail(message, str(error))
+                    EMAILS.inc(message["template"], "failed")
+                else:
+                    await self.repository.retry(message, str(error), backoff_delay(message["attempts"]))
+                    EMAILS.inc(message["template"], "retry")
+        if sent:
+            await self.repository.mark_sent(messages[0]["batch"], sent)
+        return len(messages)
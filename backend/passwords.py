@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Password hashing policy: a bcrypt cost calibrated to the machine.
+
+bcrypt's cost is the log2 of its work, so each extra round doubles the time
+per hash. calibrate() times the lowest allowed cost and picks the highest
+cost whose predicted time stays within HASH_TARGET_MS (never below
+HASH_MIN_ROUNDS). BCRYPT_ROUNDS pins the cost and skips calibration.
+
+Every bcrypt hash embeds its cost (`$2b$<cost>$...`), so stored hashes carry
+their own parameters. The policy context flags hashes below the current
+cost, and login rehashes those with the password it has just verified.
+Hashes at a higher cost (e.g. from a faster machine) are left alone.
+
+    python passwords.py benchmark           # time per hash against cost
+    python passwords.py calibrate --target-ms 300
+"""
+import os
+import time
+from typing import List, Optional, Tuple
+
+import typer
+from passlib.context import CryptContext
+from passlib.hash import bcrypt
+
+import metrics
+
+HASH_TARGET_MS = float(os.getenv("HASH_TARGET_MS", "250"))
+HASH_MIN_ROUNDS = int(os.getenv("HASH_MIN_ROUNDS", "10"))
+HASH_MAX_ROUNDS = 16
+# passlib's default, used until calibration has run
+DEFAULT_ROUNDS = 12
+
+PASSWORD_HASH_COST = metrics.Gauge(
+    "password_hash_cost",
+    "bcrypt cost applied to new password hashes.",
+)
+PASSWORD_REHASHES = metrics.Counter(
+    "password_rehashes_total",
+    "Stored hashes upgraded to the current cost on login.",
+)
+
+cli = typer.Typer(help="Benchmark and calibrate the bcrypt cost on this machine.")
+
+
+def build_context(rounds: int) -> CryptContext:
+    # min_rounds drives needs_update(): only weaker hashes get upgraded
+    PASSWORD_HASH_COST.set(rounds)
+    return CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds)
+
+
+def context_rounds(context: CryptContext) -> int:
+    return context.handler().default_rounds
+
+
+def time_hash(rounds: int, samples: int = 3) -> float:
+    """Fastest of `samples` hashes at `rounds`, in seconds."""
+    handler = bcrypt.using(rounds=rounds)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        handler.hash("calibration password")
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def calibrate(target_ms: float = HASH_TARGET_MS, min_rounds: int = HASH_MIN_ROUNDS,
+              max_rounds: int = HASH_MAX_ROUNDS, samples: int = 3) -> int:
+    """Highest cost whose hash time stays within target_ms (at least min_rounds)."""
+    base = time_hash(min_rounds, samples)
+    rounds = min_rounds
+    while rounds < max_rounds and base * 2 ** (rounds + 1 - min_rounds) * 1000 <= target_ms:
+        rounds += 1
+    return rounds
+
+
+def benchmark(min_rounds: int, max_rounds: int, samples: int = 3) -> List[Tuple[int, float]]:
+    return [(rounds, time_hash(rounds, samples)) for rounds in range(min_rounds, max_rounds + 1)]
+
+
+@cli.command("benchmark")
+def benchmark_command(
+    min_rounds: int = typer.Option(8, help="Lowest cost to time."),
+    max_rounds: int = typer.Option(14, help="Highest cost to time."),
+    samples: int = typer.Option(3, help="Hashes per cost; the fastest is reported."),
+    target_ms: float = typer.Option(HASH_TARGET_MS, help="Target time per hash."),
+):
+    """Report hash time and single-core throughput per bcrypt cost."""
+    typer.echo(f"{'cost':>4} {'ms/hash':>9} {'hashes/s/core':>14}")
+    chosen: Optional[int] = None
+    for rounds, seconds in benchmark(min_rounds, max_rounds, samples):
+        if seconds * 1000 <= target_ms and rounds >= HASH_MIN_ROUNDS:
+            chosen = rounds
+        typer.echo(f"{rounds:>4} {seconds * 1000:>9.1f} {1 / seconds:>14.1f}")
+    if chosen is None:
+        typer.echo(f"\nno cost >= {HASH_MIN_ROUNDS} fits {target_ms:.0f} ms; the floor applies")
+    else:
+        typer.echo(f"\ncost {chosen} is the highest within {target_ms:.0f} ms")
+
+
+@cli.command("calibrate")
+def calibrate_command(
+    target_ms: float = typer.Option(HASH_TARGET_MS, help="Target time per hash."),
+):
+    """Print the BCRYPT_ROUNDS setting calibration picks on this machine."""
+    typer.echo(f"BCRYPT_ROUNDS={calibrate(target_ms)}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,371 @@
+"""Statistical sampling profiler for the API process.
+
+A background thread periodically reads the stack of the event-loop thread
+(CPU time spent in handlers) and of threads blocked inside PyMongo (time
+spent awaiting Mongo) and aggregates them as collapsed stacks, the input
+format of flamegraph tools. Samples are prefixed with ``cpu`` or ``mongo``
+and with the route template of the request they belong to.
+
+Per-request profiles attribute loop samples to the asyncio task serving the
+request and add up the Mongo command time seen through the command listener.
+"""
+import asyncio
+import html
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+import metrics
+
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+PROFILER_CONTINUOUS = os.getenv("PROFILER_CONTINUOUS", "false").lower() == "true"
+# Per-request profiling is only honoured when the header carries this token
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+PROFILE_HEADER = b"x-profile-token"
+MAX_REQUEST_PROFILES = 50
+MAX_STACK_DEPTH = 128
+
+_active_profile: ContextVar = ContextVar("active_profile", default=None)
+
+_IDLE_FUNCTIONS = {"run_forever", "run_until_complete"}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame) -> str:
+    """Return the stack ending at ``frame`` as ``outer;...;inner`` labels."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def _is_idle(frame) -> bool:
+    # The loop is waiting in the selector (or inside uvloop's C run loop)
+    code = frame.f_code
+    return code.co_filename.endswith("selectors.py") or code.co_name in _IDLE_FUNCTIONS
+
+
+def _is_mongo_wait(frame) -> bool:
+    in_pymongo = False
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if "periodic_executor" in filename:
+            # Server monitors and pool maintenance, not request work
+            return False
+        if f"{os.sep}pymongo{os.sep}" in filename:
+            in_pymongo = True
+        frame = frame.f_back
+    return in_pymongo
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.route = "-"
+        self.started_at = time.time()
+        self.wall_seconds = 0.0
+        self.mongo_seconds = 0.0
+        self.mongo_commands = 0
+        self.stacks = Counter()
+        self.samples = 0
+
+    def summary(self, interval: float) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "started_at": self.started_at,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "mongo_seconds": round(self.mongo_seconds, 6),
+            "mongo_commands": self.mongo_commands,
+            "cpu_samples": self.samples,
+            "estimated_cpu_seconds": round(self.samples * interval, 6),
+        }
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILER_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.continuous = False
+        self.started_at = None
+        self.stacks = Counter()
+        self.mongo_seconds_by_route = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._loop = None
+        self._loop_thread_id = None
+        self._thread = None
+        self._stop = None
+        self._lock = threading.Lock()
+        # asyncio task -> ASGI scope / RequestProfile for requests in flight
+        self._task_scopes = {}
+        self._task_profiles = {}
+        # worker thread ident -> route of the Mongo command it is running
+        self._thread_routes = {}
+        self.request_profiles = OrderedDict()
+
+    # Control
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = None):
+        """Start continuous profiling; must be called from the event loop."""
+        if interval:
+            self.interval = interval
+        self.bind_loop(asyncio.get_running_loop())
+        with self._lock:
+            self.stacks.clear()
+            self.mongo_seconds_by_route.clear()
+            self.samples = 0
+            self.idle_samples = 0
+        self.started_at = time.time()
+        self.continuous = True
+        self._ensure_thread()
+
+    def stop(self):
+        self.continuous = False
+        if not self._task_profiles:
+            self._stop_thread()
+
+    def _ensure_thread(self):
+        if self.running:
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(self._stop,), name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def _stop_thread(self):
+        if self._stop is not None:
+            self._stop.set()
+        self._thread = None
+
+    # Sampling
+    def _run(self, stop: threading.Event):
+        while not stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception:
+                # Never let a racy frame walk kill the sampler
+                pass
+
+    def _sample(self):
+        frames = sys._current_frames()
+        own_id = threading.get_ident()
+        loop_frame = frames.get(self._loop_thread_id)
+        task = asyncio.tasks._current_tasks.get(self._loop) if self._loop else None
+
+        with self._lock:
+            if loop_frame is not None:
+                if _is_idle(loop_frame):
+                    self.idle_samples += 1
+                else:
+                    stack = collapse_stack(loop_frame)
+                    if self.continuous:
+                        scope = self._task_scopes.get(task)
+                        route = metrics.route_template(scope) if scope is not None else "-"
+                        self.stacks[f"cpu;{route};{stack}"] += 1
+                        self.samples += 1
+                    profile = self._task_profiles.get(task)
+                    if profile is not None:
+                        profile.stacks[stack] += 1
+                        profile.samples += 1
+
+            if not self.continuous:
+                return
+            for thread_id, frame in frames.items():
+                if thread_id in (own_id, self._loop_thread_id) or not _is_mongo_wait(frame):
+                    continue
+                route = self._thread_routes.get(thread_id, "-")
+                self.stacks[f"mongo;{route};{collapse_stack(frame)}"] += 1
+                self.samples += 1
+
+    # Request tracking
+    def track_request(self, task, scope, profile=None):
+        if self.continuous:
+            self._task_scopes[task] = scope
+        if profile is not None:
+            self._task_profiles[task] = profile
+            self._ensure_thread()
+
+    def untrack_request(self, task, profile=None):
+        self._task_scopes.pop(task, None)
+        if profile is not None:
+            self._task_profiles.pop(task, None)
+            self.request_profiles[profile.id] = profile
+            while len(self.request_profiles) > MAX_REQUEST_PROFILES:
+                self.request_profiles.popitem(last=False)
+            if not self.continuous and not self._task_profiles:
+                self._stop_thread()
+
+    # Reports
+    def status(self) -> dict:
+        return {
+            "running": self.continuous,
+            "interval_ms": self.interval * 1000,
+            "started_at": self.started_at,
+            "samples": self.samples,
+            "idle_samples": self.idle_samples,
+            "mongo_seconds_by_route": {
+                route: round(seconds, 6) for route, seconds in self.mongo_seconds_by_route.most_common()
+            },
+            "request_profiles": [p.summary(self.interval) for p in self.request_profiles.values()],
+        }
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.stacks.items())
+
+    def request_stacks(self, profile: RequestProfile):
+        """Loop samples of a request plus its Mongo time expressed in samples."""
+        with self._lock:
+            stacks = [(f"cpu;{stack}", count) for stack, count in profile.stacks.items()]
+        mongo_samples = round(profile.mongo_seconds / self.interval)
+        if mongo_samples:
+            stacks.append(("mongo;awaiting mongo", mongo_samples))
+        return stacks
+
+
+def format_collapsed(stacks) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks))
+
+
+def _build_tree(stacks):
+    root = {"name": "all", "value": 0, "children": {}}
+    for stack, count in stacks:
+        root["value"] += count
+        node = root
+        for label in stack.split(";"):
+            child = node["children"].get(label)
+            if child is None:
+                child = node["children"][label] = {"name": label, "value": 0, "children": {}}
+            child["value"] += count
+            node = child
+    return root
+
+
+def _render_node(node, total) -> str:
+    percent = 100.0 * node["value"] / total if total else 0
+    title = html.escape(f'{node["name"]} — {node["value"]} samples ({percent:.1f}%)', quote=True)
+    children = sorted(node["children"].values(), key=lambda child: -child["value"])
+    inner = "".join(_render_node(child, node["value"]) for child in children)
+    return (
+        f'<div class="node" style="width:{percent:.3f}%">'
+        f'<div class="frame" title="{title}">{html.escape(node["name"])}</div>'
+        f'<div class="children">{inner}</div></div>'
+    )
+
+
+def flamegraph_html(stacks, title: str = "Profil CPU / Mongo") -> str:
+    """Render collapsed stacks as a self-contained icicle-style flamegraph page."""
+    root = _build_tree(list(stacks))
+    body = _render_node(root, root["value"]) if root["value"] else "<p>Aucun échantillon.</p>"
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>
+<style>
+body {{ font: 11px monospace; margin: 8px; }}
+.node {{ display: inline-block; vertical-align: top; overflow: hidden; }}
+.frame {{ background: #f5a25d; border: 1px solid #fff; padding: 1px 2px; white-space: nowrap;
+          overflow: hidden; text-overflow: ellipsis; cursor: default; }}
+.frame:hover {{ background: #e0662c; }}
+.children {{ display: flex; }}
+</style></head>
+<body><h3>{html.escape(title)}</h3><div style="display:flex">{body}</div></body></html>
+"""
+
+
+profiler = SamplingProfiler()
+
+
+class ProfilerCommandListener(monitoring.CommandListener):
+    """Attributes Mongo command time to routes and to per-request profiles."""
+
+    def started(self, event):
+        if profiler.continuous:
+            profiler._thread_routes[threading.get_ident()] = metrics.current_route()
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        seconds = event.duration_micros / 1e6
+        if profiler.continuous:
+            profiler._thread_routes.pop(threading.get_ident(), None)
+            profiler.mongo_seconds_by_route[metrics.current_route()] += seconds
+        profile = _active_profile.get()
+        if profile is not None:
+            profile.mongo_seconds += seconds
+            profile.mongo_commands += 1
+
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware tying requests to their asyncio task for the profiler.
+
+    A request carrying ``X-Profile-Token: <PROFILER_TOKEN>`` gets its own
+    profile, whose id is returned in the ``X-Profile-Id`` response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = None
+        if PROFILER_TOKEN:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER and value.decode("latin-1") == PROFILER_TOKEN:
+                    profile = RequestProfile(scope["method"], scope["path"])
+                    break
+
+        if profile is None and not profiler.continuous:
+            await self.app(scope, receive, send)
+            return
+
+        task = asyncio.current_task()
+        if profiler._loop is None:
+            profiler.bind_loop(asyncio.get_running_loop())
+        token = _active_profile.set(profile)
+        start = time.perf_counter()
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile.id.encode()))
+                message["headers"] = headers
+            await send(message)
+
+        profiler.track_request(task, scope, profile)
+        try:
+            await self.app(scope, receive, send_with_profile_id if profile is not None else send)
+        finally:
+            _active_profile.reset(token)
+            if profile is not None:
+                profile.wall_seconds = time.perf_counter() - start
+                profile.route = metrics.route_template(scope)
+            profiler.untrack_request(task, profile)
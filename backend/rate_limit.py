@@ -0,0 +1,209 @@
+"""Token-bucket rate limiting for the auth endpoints.
+
+Every limited route has buckets keyed by client IP and by the email in the
+JSON body. The IP is the ASGI client address, which uvicorn rewrites from
+X-Forwarded-For only for the proxies trusted by --forwarded-allow-ips
+(run.py); configure it when running behind a reverse proxy. The middleware reads the (small) request body itself, so an
+over-limit request gets a 429 with Retry-After before the handler runs:
+no database lookup, no bcrypt work, no reset record or email.
+
+Buckets live in process memory. With RATE_LIMIT_SYNC=true each worker
+periodically merges the tokens it consumed into a shared document per key
+in the `rate_limits` collection and adopts the merged balance, so limits
+hold across workers; between syncs a worker can overshoot by at most what
+it admits in one RATE_LIMIT_SYNC_SECONDS interval.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from starlette.responses import JSONResponse
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_SYNC = os.getenv("RATE_LIMIT_SYNC", "false").lower() == "true"
+RATE_LIMIT_SYNC_SECONDS = float(os.getenv("RATE_LIMIT_SYNC_SECONDS", "1"))
+MAX_BODY_BYTES = 16 * 1024
+
+RATE_LIMITED = metrics.Counter(
+    "rate_limited_requests_total",
+    "Requests rejected by the rate limiter, by path and bucket scope.",
+    ("path", "scope"),
+)
+
+
+class Limit(NamedTuple):
+    scope: str  # "ip" or "email"
+    capacity: float
+    per_second: float
+
+
+def per_minute(count: float) -> float:
+    return count / 60
+
+
+RULES = {
+    "/api/auth/login": (Limit("ip", 30, per_minute(30)), Limit("email", 10, per_minute(10))),
+    "/api/auth/register": (Limit("ip", 10, per_minute(10)), Limit("email", 5, per_minute(1))),
+    "/api/auth/forgot-password": (Limit("ip", 10, per_minute(10)), Limit("email", 3, per_minute(0.1))),
+}
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated", "unsynced")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+        # Tokens taken since the last merge into the shared state
+        self.unsynced = 0
+
+    def refill(self, limit: Limit, now: float):
+        self.tokens = min(limit.capacity, self.tokens + (now - self.updated) * limit.per_second)
+        self.updated = now
+
+    def wait(self, limit: Limit, now: float) -> float:
+        """Seconds until one token is available (0 when one is available now)."""
+        self.refill(limit, now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / limit.per_second
+
+    def take(self):
+        self.tokens -= 1
+        self.unsynced += 1
+
+
+class RateLimiter:
+    def __init__(self, rules: dict = RULES, max_keys: int = 100_000, clock=time.monotonic):
+        self.rules = rules
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> (limit, bucket), least recently used first
+        self.buckets = OrderedDict()
+
+    def _bucket(self, key: str, limit: Limit, now: float) -> TokenBucket:
+        entry = self.buckets.get(key)
+        if entry is None:
+            entry = self.buckets[key] = (limit, TokenBucket(limit.capacity, now))
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return entry[1]
+
+    def check(self, path: str, ip: str, email: Optional[str]) -> tuple:
+        """Take a token from every bucket of the route, or none of them.
+
+        Returns (retry_after_seconds, scope); retry_after is 0 when allowed.
+        """
+        now = self.clock()
+        identities = {"ip": ip, "email": email}
+        buckets = []
+        for limit in self.rules.get(path, ()):
+            identity = identities[limit.scope]
+            if not identity:
+                continue
+            bucket = self._bucket(f"{path}|{limit.scope}|{identity}", limit, now)
+            wait = bucket.wait(limit, now)
+            if wait > 0:
+                return wait, limit.scope
+            buckets.append(bucket)
+        for bucket in buckets:
+            bucket.take()
+        return 0.0, None
+
+    def clear(self):
+        self.buckets.clear()
+
+    async def sync(self, repository):
+        """Merge local consumption into the shared buckets and adopt the result."""
+        now = datetime.utcnow()
+        for key, (limit, bucket) in list(self.buckets.items()):
+            if not bucket.unsynced:
+                continue
+            consumed, bucket.unsynced = bucket.unsynced, 0
+            tokens = await repository.merge(key, consumed, limit.capacity, limit.per_second, now)
+            if tokens is None:
+                bucket.unsynced += consumed  # lost the race repeatedly; next round
+                continue
+            bucket.tokens = tokens - bucket.unsynced
+            bucket.updated = self.clock()
+
+    async def sync_forever(self, repository, interval: float = RATE_LIMIT_SYNC_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync(repository)
+            except Exception:
+                logger.exception("Rate limit sync failed")
+
+
+def request_email(body: bytes) -> Optional[str]:
+    try:
+        email = json.loads(body).get("email")
+    except (ValueError, AttributeError):
+        return None
+    return email.strip().lower() if isinstance(email, str) else None
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware applying a RateLimiter to POSTs on its routes."""
+
+    def __init__(self, app, limiter: RateLimiter, enabled: bool = RATE_LIMIT_ENABLED):
+        self.app = app
+        self.limiter = limiter
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if (not self.enabled or scope["type"] != "http" or scope["method"] != "POST"
+                or scope["path"] not in self.limiter.rules):
+            await self.app(scope, receive, send)
+            return
+
+        # Buffer up to MAX_BODY_BYTES to find the email; a longer body is
+        # replayed as read so far and the rest streams through unchanged
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body and size <= MAX_BODY_BYTES:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        client = scope.get("client")
+        retry_after, limited_scope = self.limiter.check(
+            scope["path"], client[0] if client else "", request_email(body[:MAX_BODY_BYTES])
+        )
+        if retry_after:
+            RATE_LIMITED.inc(scope["path"], limited_scope)
+            response = JSONResponse(
+                {"detail": "Trop de tentatives, veuillez réessayer plus tard"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+            await response(scope, receive, send)
+            return
+
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": more_body}
+            return await receive()
+
+        await self.app(scope, replay, send)
@@ -0,0 +1,734 @@
+"""Data-access layer used by the request handlers.
+
+Each repository wraps one collection and exposes the queries the handlers
+need. They only rely on the Motor collection API, so they run unchanged on
+a Motor database (production) or on memory_store.MemoryDatabase (tests and
+framework-overhead baselines).
+"""
+import base64
+import json
+import re
+import unicodedata
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from cache import MISSING, TTLCache, freeze
+
+# Catalog listing order, newest first
+CATALOG_SORT = [("created_at", DESCENDING)]
+NO_ID = {"_id": 0}
+USER_TYPES = ("parent", "teacher")
+# Admin listings: an inclusion projection, so hashes never leave the database
+USER_SUMMARY = {
+    field: 1 for field in (
+        "id", "email", "first_name", "last_name", "user_type", "is_premium", "is_verified", "is_admin",
+        "created_at",
+    )
+}
+
+
+def fold_name(text: str) -> str:
+    """Lower-case, accent-free, single-spaced: "  Élodie  LE GOFF" -> "elodie le goff"."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).casefold().split())
+
+
+# Sample sheet ids derive from their file so every worker seeds the same documents
+SAMPLE_NAMESPACE = uuid.UUID("2b1f7c1e-8d0a-4f65-9e0b-5c7d3a9e4f21")
+
+
+def sample_sheet_id(file_url: str) -> str:
+    return str(uuid.uuid5(SAMPLE_NAMESPACE, file_url))
+
+
+def name_key(first_name: str, last_name: str) -> str:
+    # Last name first: searches match a last-name prefix, optionally followed by the first name
+    return fold_name(f"{last_name} {first_name}")
+
+
+def encode_cursor(mode: str, values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps([mode, values]).encode()).decode()
+
+
+def decode_cursor(mode: str, cursor: str) -> list:
+    try:
+        cursor_mode, values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if cursor_mode != mode:
+        raise ValueError("cursor belongs to another search")
+    return values
+
+
+class UserRepository:
+    def __init__(self, collection, cache_ttl: float = 0):
+        self.collection = collection
+        # Backs get_current_user, i.e. every authenticated request
+        self.cache = TTLCache("users", cache_ttl)
+
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        user = self.cache.get(user_id)
+        if user is MISSING:
+            user = await self.collection.find_one({"id": user_id})
+            if user is not None:
+                self.cache.set(user_id, user)
+        return dict(user) if user is not None else None
+
+    async def recent(self, limit: int) -> list:
+        # _id is an ObjectId, so its default index orders by creation time
+        return await self.collection.find({}).sort([("_id", DESCENDING)]).to_list(length=limit)
+
+    def prime(self, users: list):
+        for user in users:
+            self.cache.set(user["id"], user)
+
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        return await self.collection.find_one({"email": email})
+
+    async def insert(self, user: dict):
+        # Raises DuplicateKeyError when the email is already registered
+        await self.collection.insert_one(user)
+
+    async def insert_many(self, users: list) -> list:
+        """Unordered bulk insert; returns the indexes rejected as duplicate emails."""
+        try:
+            await self.collection.insert_many(users, ordered=False)
+        except BulkWriteError as exc:
+            errors = exc.details["writeErrors"]
+            if any(error["code"] != 11000 for error in errors):
+                raise
+            return [error["index"] for error in errors]
+        return []
+
+    async def update_by_id(self, user_id: str, fields: dict) -> bool:
+        result = await self.collection.update_one({"id": user_id}, {"$set": fields})
+        self.cache.discard(user_id)
+        return result.matched_count > 0
+
+    async def update_by_email(self, email: str, fields: dict) -> bool:
+        result = await self.collection.update_one({"email": email}, {"$set": fields})
+        # The cache is keyed by id; email updates are rare enough to drop it all
+        self.cache.clear()
+        return result.matched_count > 0
+
+    async def count(self, filter: Optional[dict] = None) -> int:
+        if not filter:
+            return await self.collection.estimated_document_count()
+        return await self.collection.count_documents(filter)
+
+    async def search(self, user_type: Optional[str] = None, is_premium: Optional[bool] = None,
+                     is_verified: Optional[bool] = None, email_prefix: Optional[str] = None,
+                     name_prefix: Optional[str] = None, cursor: Optional[str] = None, limit: int = 50) -> tuple:
+        """One page of users and the cursor of the next one (None on the last page).
+
+        Keyset pagination: the cursor holds the sort key of the last user
+        returned, so each page is an index seek whatever its depth. Filters
+        left open become $in over every value, which keeps the newest-first
+        listing on the admin_listing index (one merged scan per combination)
+        instead of a sort. Registration and imports only accept USER_TYPES,
+        so the open user_type filter covers every user. Raises ValueError
+        for a malformed cursor.
+        """
+        query = {
+            "user_type": {"$in": [user_type] if user_type else list(USER_TYPES)},
+            "is_premium": {"$in": [is_premium] if is_premium is not None else [False, True]},
+            "is_verified": {"$in": [is_verified] if is_verified is not None else [False, True]},
+        }
+        if email_prefix:
+            mode, keys, sort = "email", ["email"], [("email", ASCENDING)]
+            query["email"] = {"$regex": f"^{re.escape(email_prefix)}"}
+            if cursor:
+                query["email"]["$gt"] = decode_cursor(mode, cursor)[0]
+        elif name_prefix:
+            mode, keys, sort = "name", ["name_key", "id"], [("name_key", ASCENDING), ("id", ASCENDING)]
+            query["name_key"] = {"$regex": f"^{re.escape(fold_name(name_prefix))}"}
+            if cursor:
+                last_key, last_id = decode_cursor(mode, cursor)
+                query["$or"] = [{"name_key": {"$gt": last_key}}, {"name_key": last_key, "id": {"$gt": last_id}}]
+        else:
+            mode, keys, sort = "recent", ["_id"], [("_id", DESCENDING)]
+            if cursor:
+                try:
+                    query["_id"] = {"$lt": ObjectId(decode_cursor(mode, cursor)[0])}
+                except InvalidId:
+                    raise ValueError("invalid cursor")
+
+        projection = {**USER_SUMMARY, "name_key": 1}
+        users = await self.collection.find(query, projection).sort(sort).to_list(length=limit + 1)
+        next_cursor = None
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = encode_cursor(mode, [str(users[-1][key]) for key in keys])
+        for user in users:
+            del user["_id"]
+            user.pop("name_key", None)
+        return users, next_cursor
+
+    async def backfill_name_keys(self, limit: int) -> int:
+        """Set name_key on up to `limit` users created before it existed."""
+        users = await self.collection.find(
+            {"name_key": {"$exists": False}}, {"id": 1, "first_name": 1, "last_name": 1}
+        ).to_list(length=limit)
+        if users:
+            await self.collection.bulk_write([
+                UpdateOne({"_id": user["_id"]},
+                          {"$set": {"name_key": name_key(user.get("first_name", ""), user.get("last_name", ""))}})
+                for user in users
+            ], ordered=False)
+        return len(users)
+
+
+class SheetRepository:
+    def __init__(self, collection, cache_ttl: float = 0):
+        self.collection = collection
+        # Catalog pages per (tier, level, subject) query
+        self.cache = TTLCache("catalog", cache_ttl, maxsize=1_000)
+
+    async def list(self, query: dict, limit: int, cached: bool = True) -> list:
+        """`cached=False` for one-off queries (searches) that would only crowd the cache."""
+        key = (freeze(query), limit)
+        sheets = self.cache.get(key) if cached else MISSING
+        if sheets is MISSING:
+            sheets = await self.collection.find(query, NO_ID).sort(CATALOG_SORT).to_list(length=limit)
+            if cached:
+                self.cache.set(key, sheets)
+        return list(sheets)
+
+    async def get(self, sheet_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": sheet_id}, NO_ID)
+
+    async def insert(self, sheet: dict):
+        await self.collection.insert_one(sheet)
+        self.cache.clear()
+
+    async def insert_many(self, sheets: list):
+        await self.collection.insert_many(sheets)
+        self.cache.clear()
+
+    async def insert_missing(self, sheets: list):
+        # Upsert by id so concurrent or repeated seeding never duplicates
+        for sheet in sheets:
+            fields = {key: value for key, value in sheet.items() if key != "id"}
+            await self.collection.update_one({"id": sheet["id"]}, {"$setOnInsert": fields}, upsert=True)
+        self.cache.clear()
+
+    async def update(self, sheet_id: str, fields: dict) -> Optional[dict]:
+        # Returns the updated sheet, or None when it does not exist
+        if not fields:
+            return await self.get(sheet_id)
+        sheet = await self.collection.find_one_and_update(
+            {"id": sheet_id}, {"$set": fields}, projection=NO_ID, return_document=ReturnDocument.AFTER
+        )
+        self.cache.clear()
+        return sheet
+
+    async def delete(self, sheet_id: str) -> bool:
+        result = await self.collection.delete_one({"id": sheet_id})
+        self.cache.clear()
+        return result.deleted_count > 0
+
+    async def has_file(self, file_url: str) -> bool:
+        return await self.collection.find_one({"file_url": file_url}, {"_id": 1}) is not None
+
+    async def referenced_files(self, file_urls: list) -> set:
+        # Which of these urls a sheet still points at
+        sheets = await self.collection.find(
+            {"file_url": {"$in": file_urls}}, {"_id": 0, "file_url": 1},
+        ).to_list(length=None)
+        return {sheet["file_url"] for sheet in sheets}
+
+    async def files(self):
+        """Stream (id, file_url) of every sheet."""
+        async for sheet in self.collection.find({}, {"_id": 0, "id": 1, "file_url": 1}):
+            yield sheet
+
+    async def count(self, filter: Optional[dict] = None) -> int:
+        if not filter:
+            return await self.collection.estimated_document_count()
+        return await self.collection.count_documents(filter)
+
+
+class PasswordResetRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def replace_for_email(self, record: dict):
+        # One record per email (unique index): only the latest reset link stays valid
+        fields = {key: value for key, value in record.items() if key != "email"}
+        try:
+            await self.collection.update_one({"email": record["email"]}, {"$set": fields}, upsert=True)
+        except DuplicateKeyError:
+            # A concurrent first request for this email won the upsert; overwrite it
+            await self.collection.update_one({"email": record["email"]}, {"$set": fields})
+
+    @staticmethod
+    def _valid(email: str, token: str, now: datetime) -> dict:
+        return {"email": email, "token": token, "used": False, "expires_at": {"$gt": now}}
+
+    async def is_valid(self, email: str, token: str, now: datetime) -> bool:
+        # A cheap read before hashing; consume() still decides who redeems it
+        return await self.collection.find_one(self._valid(email, token, now), {"_id": 1}) is not None
+
+    async def consume(self, email: str, token: str, now: datetime) -> Optional[dict]:
+        # Atomically marks a valid token used, so it can only be redeemed once
+        return await self.collection.find_one_and_update(
+            self._valid(email, token, now),
+            {"$set": {"used": True, "used_at": now}},
+        )
+
+
+class VerificationRepository:
+    """Teacher verification records and the review queue over them.
+
+    pending -> in_review (claimed by one reviewer under a lease) -> approved
+    or rejected. A claim whose lease expired goes back to the queue.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_pending(self, user_id: str) -> Optional[dict]:
+        # Still awaiting a decision, whether queued or being reviewed
+        return await self.collection.find_one({"user_id": user_id, "status": {"$in": ["pending", "in_review"]}})
+
+    async def insert(self, verification: dict):
+        await self.collection.insert_one(verification)
+
+    async def get(self, verification_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": verification_id}, NO_ID)
+
+    async def update(self, verification_id: str, fields: dict) -> bool:
+        result = await self.collection.update_one({"id": verification_id}, {"$set": fields})
+        return result.matched_count > 0
+
+    async def claim(self, reviewer: str, lease_seconds: float) -> Optional[dict]:
+        # Oldest pending record, or one whose reviewer let the lease expire
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "pending"},
+                {"status": "in_review", "lease_until": {"$lte": now}},
+            ]},
+            {"$set": {"status": "in_review", "reviewer": reviewer, "claimed_at": now,
+                      "lease_until": now + timedelta(seconds=lease_seconds)}},
+            projection=NO_ID,
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def release(self, verification_id: str, reviewer: str) -> bool:
+        result = await self.collection.update_one(
+            {"id": verification_id, "status": "in_review", "reviewer": reviewer},
+            {"$set": {"status": "pending"}, "$unset": {"reviewer": "", "claimed_at": "", "lease_until": ""}},
+        )
+        return result.matched_count > 0
+
+    async def decide(self, verification_id: str, reviewer: str, status: str,
+                     note: Optional[str] = None) -> Optional[dict]:
+        """Record the reviewer's decision on a record they hold; None if they don't.
+
+        Repeating the same decision matches again, so a reviewer can retry
+        after a failure between this write and the user update.
+        """
+        return await self.collection.find_one_and_update(
+            {"id": verification_id, "reviewer": reviewer, "status": {"$in": ["in_review", status]}},
+            {"$set": {"status": status, "review_note": note, "decided_at": datetime.utcnow()},
+             "$unset": {"lease_until": ""}},
+            projection=NO_ID,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def counts(self) -> dict:
+        return {status: await self.collection.count_documents({"status": status})
+                for status in ("pending", "in_review", "approved", "rejected")}
+
+    # Documents of rejected records are never read again, so they count as unreferenced
+    async def referenced_documents(self, paths: list) -> set:
+        # Rejected records are dropped here so the lookup stays on the url indexes
+        records = await self.collection.find(
+            {"$or": [{"document_url": {"$in": paths}}, {"original_url": {"$in": paths}}]},
+            {"_id": 0, "status": 1, "document_url": 1, "original_url": 1},
+        ).to_list(length=None)
+        return {record.get(key) for record in records if record["status"] != "rejected"
+                for key in ("document_url", "original_url")} & set(paths)
+
+    async def documents(self):
+        """Stream (id, document_url, original_url) of every record not rejected."""
+        async for record in self.collection.find(
+            {"status": {"$ne": "rejected"}}, {"_id": 0, "id": 1, "document_url": 1, "original_url": 1},
+        ):
+            yield record
+
+
+class PreviewRepository:
+    """Derived sheet artefacts (text, page count, thumbnail), keyed by content hash."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, content_hash: str) -> Optional[dict]:
+        return await self.collection.find_one({"_id": content_hash})
+
+    async def search(self, text: str, limit: int) -> list:
+        """Content hashes of the files whose text matches `text` (the French text index)."""
+        previews = await self.collection.find({"$text": {"$search": text}}, {"_id": 1}).to_list(length=limit)
+        return [preview["_id"] for preview in previews]
+
+    async def save(self, content_hash: str, fields: dict):
+        try:
+            await self.collection.update_one({"_id": content_hash}, {"$setOnInsert": fields}, upsert=True)
+        except DuplicateKeyError:
+            pass  # the same file was processed concurrently; either result will do
+
+
+class UploadRepository:
+    """Resumable upload sessions (see uploads.py).
+
+    uploading -> assembling (one finalize at a time, under a lease) ->
+    complete, or expired when abandoned. Appends are serialized by a short
+    lock and only ever advance the offset they started from.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, upload: dict):
+        await self.collection.insert_one(upload)
+
+    async def get(self, upload_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": upload_id}, NO_ID)
+
+    async def lock(self, upload_id: str, offset: int, lock_seconds: float) -> bool:
+        now = datetime.utcnow()
+        result = await self.collection.update_one(
+            {"id": upload_id, "status": "uploading", "offset": offset,
+             "$or": [{"lock_until": {"$exists": False}}, {"lock_until": {"$lte": now}}]},
+            {"$set": {"lock_until": now + timedelta(seconds=lock_seconds)}},
+        )
+        return result.matched_count > 0
+
+    async def unlock(self, upload_id: str):
+        await self.collection.update_one({"id": upload_id}, {"$unset": {"lock_until": ""}})
+
+    async def advance(self, upload_id: str, offset: int, end: int, checksum: str, expiry_seconds: float) -> bool:
+        # Only the last chunk is kept: a lost response can only be for it
+        now = datetime.utcnow()
+        result = await self.collection.update_one(
+            {"id": upload_id, "status": "uploading", "offset": offset},
+            {"$set": {"offset": end, "last_chunk": {"offset": offset, "checksum": checksum}, "updated_at": now,
+                      "expires_at": now + timedelta(seconds=expiry_seconds)},
+             "$unset": {"lock_until": ""}},
+        )
+        return result.matched_count > 0
+
+    async def begin_finalize(self, upload_id: str, size: int, lock_seconds: float) -> Optional[dict]:
+        # Fully received, and not being assembled (or its assembler died)
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"id": upload_id, "offset": size, "$or": [
+                {"status": "uploading"},
+                {"status": "assembling", "lock_until": {"$lte": now}},
+            ]},
+            {"$set": {"status": "assembling", "lock_until": now + timedelta(seconds=lock_seconds)}},
+            projection=NO_ID,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def finish(self, upload_id: str, status: str, fields: Optional[dict] = None):
+        # Finished sessions carry finished_at and are purged by TTL a week later
+        await self.collection.update_one(
+            {"id": upload_id},
+            {"$set": {"status": status, "finished_at": datetime.utcnow(), **(fields or {})},
+             "$unset": {"lock_until": "", "expires_at": ""}},
+        )
+
+    async def expired(self, now: datetime, limit: int) -> list:
+        # An assembling session is left alone while its finalize holds the lock
+        return await self.collection.find(
+            {"expires_at": {"$lte": now}, "$or": [
+                {"status": "uploading"},
+                {"status": "assembling", "lock_until": {"$lte": now}},
+            ]}, NO_ID,
+        ).to_list(length=limit)
+
+    async def mark_expired(self, upload_id: str):
+        await self.finish(upload_id, "expired")
+
+    async def active(self, upload_ids: list) -> set:
+        # Which of these sessions may still write to their part file
+        uploads = await self.collection.find(
+            {"id": {"$in": upload_ids}, "status": {"$in": ["uploading", "assembling"]}}, {"_id": 0, "id": 1},
+        ).to_list(length=None)
+        return {upload["id"] for upload in uploads}
+
+
+class StorageReportRepository:
+    """Reports of the storage reconciliation job, newest first."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, report: dict):
+        await self.collection.insert_one(report)
+
+    async def latest(self) -> Optional[dict]:
+        reports = await self.collection.find({}, NO_ID).sort([("finished_at", DESCENDING)]).limit(1).to_list(length=1)
+        return reports[0] if reports else None
+
+
+class LeaseRepository:
+    """Named, expiring locks; one document per lease keyed by its name."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = datetime.utcnow()
+        try:
+            # Matches a free, expired or already-owned lease; otherwise the
+            # upsert collides with the holder's _id and the lease stays taken
+            await self.collection.find_one_and_update(
+                {"_id": name, "$or": [{"expires_at": {"$lte": now}}, {"owner": owner}]},
+                {"$set": {"owner": owner, "acquired_at": now, "expires_at": now + timedelta(seconds=ttl)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def release(self, name: str, owner: str) -> bool:
+        result = await self.collection.delete_one({"_id": name, "owner": owner})
+        return result.deleted_count > 0
+
+    async def holder(self, name: str) -> Optional[dict]:
+        return await self.collection.find_one({"_id": name, "expires_at": {"$gt": datetime.utcnow()}})
+
+
+class StartupRepository:
+    """Which version of the shared startup tasks (indexes, seed data) has completed."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def completed(self, version: str) -> bool:
+        return await self.collection.find_one({"_id": "startup", "version": version}, {"_id": 1}) is not None
+
+    async def complete(self, version: str):
+        await self.collection.update_one(
+            {"_id": "startup"}, {"$set": {"version": version, "finished_at": datetime.utcnow()}}, upsert=True
+        )
+
+
+class RateLimitRepository:
+    """Token buckets shared by every worker; one document per bucket key."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def merge(self, key: str, consumed: int, capacity: float, per_second: float,
+                    now: datetime, attempts: int = 5) -> Optional[float]:
+        """Refill the shared bucket to `now`, take `consumed` tokens and return the balance.
+
+        Compare-and-set on a version field, so concurrent merges from other
+        workers are never lost. The balance may go negative when workers
+        together overshot; that debt delays the next admissions. Returns None
+        when every attempt lost the race.
+        """
+        for _ in range(attempts):
+            current = await self.collection.find_one({"_id": key})
+            if current is None:
+                tokens = capacity - consumed
+                version = 0
+            else:
+                elapsed = max(0.0, (now - current["updated_at"]).total_seconds())
+                tokens = min(capacity, current["tokens"] + elapsed * per_second) - consumed
+                version = current["version"] + 1
+            tokens = max(tokens, -capacity)
+            # A bucket left alone until it is full again carries no state
+            document = {
+                "tokens": tokens, "updated_at": now, "version": version,
+                "expires_at": now + timedelta(seconds=(capacity - tokens) / per_second),
+            }
+            if current is None:
+                try:
+                    await self.collection.insert_one({"_id": key, **document})
+                except DuplicateKeyError:
+                    continue
+                return tokens
+            result = await self.collection.update_one(
+                {"_id": key, "version": current["version"]}, {"$set": document}
+            )
+            if result.modified_count:
+                return tokens
+        return None
+
+
+class JobRepository:
+    """Durable job queue; a worker leases a job by claiming it and must ack it."""
+
+    def __init__(self, collection, dead_letters):
+        self.collection = collection
+        self.dead_letters = dead_letters
+
+    async def enqueue(self, job_type: str, payload: dict, max_attempts: int = 5,
+                      run_at: Optional[datetime] = None) -> str:
+        now = datetime.utcnow()
+        job_id = str(uuid.uuid4())
+        await self.collection.insert_one({
+            "id": job_id,
+            "type": job_type,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_at": run_at or now,
+            "created_at": now,
+        })
+        return job_id
+
+    async def claim(self, worker: str, lease_seconds: float) -> Optional[dict]:
+        # Due queued jobs, or running jobs whose worker let the lease expire
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lte": now}},
+            ]},
+            {
+                "$set": {"status": "running", "worker": worker, "lease_until": now + timedelta(seconds=lease_seconds)},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _owned(self, job: dict) -> dict:
+        # Guards acks against a worker whose lease expired and was re-claimed
+        return {"id": job["id"], "status": "running", "worker": job["worker"]}
+
+    async def extend(self, job: dict, lease_seconds: float) -> bool:
+        result = await self.collection.update_one(
+            self._owned(job), {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=lease_seconds)}},
+        )
+        return result.matched_count > 0
+
+    async def complete(self, job: dict) -> bool:
+        result = await self.collection.update_one(self._owned(job), {
+            "$set": {"status": "done", "finished_at": datetime.utcnow()},
+            "$unset": {"lease_until": ""},
+        })
+        return result.matched_count > 0
+
+    async def retry(self, job: dict, error: str, delay: float) -> bool:
+        result = await self.collection.update_one(self._owned(job), {
+            "$set": {"status": "queued", "run_at": datetime.utcnow() + timedelta(seconds=delay), "last_error": error},
+            "$unset": {"lease_until": "", "worker": ""},
+        })
+        return result.matched_count > 0
+
+    async def dead_letter(self, job: dict, error: str):
+        fields = {key: value for key, value in job.items() if key not in ("_id", "id")}
+        fields.update(status="dead", last_error=error, failed_at=datetime.utcnow())
+        # Upsert by id so a crash between the two writes cannot duplicate it
+        await self.dead_letters.update_one({"id": job["id"]}, {"$setOnInsert": fields}, upsert=True)
+        await self.collection.delete_one(self._owned(job))
+
+    async def requeue_dead(self, job_id: str) -> bool:
+        job = await self.dead_letters.find_one_and_delete({"id": job_id})
+        if job is None:
+            return False
+        await self.enqueue(job["type"], job["payload"], job["max_attempts"])
+        return True
+
+    async def is_queued(self, job_type: str) -> bool:
+        return await self.collection.find_one({"type": job_type, "status": "queued"}, {"_id": 1}) is not None
+
+    async def counts(self) -> dict:
+        counts = {status: await self.collection.count_documents({"status": status})
+                  for status in ("queued", "running")}
+        counts["dead"] = await self.dead_letters.estimated_document_count()
+        return counts
+
+
+class OutboxRepository:
+    """Queued emails; the dispatcher claims them in batches under a lease."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def enqueue(self, messages: list):
+        await self.collection.insert_many(messages, ordered=False)
+
+    @staticmethod
+    def _due(now: datetime) -> dict:
+        return {"$or": [
+            {"status": "queued", "next_attempt_at": {"$lte": now}},
+            {"status": "sending", "lease_until": {"$lte": now}},
+        ]}
+
+    async def claim_batch(self, worker: str, limit: int, lease_seconds: float) -> list:
+        # Three round trips per batch instead of one find_one_and_update per
+        # message; the update re-checks the filter, so racing dispatchers
+        # each keep only the messages tagged with their own batch id
+        now = datetime.utcnow()
+        candidates = await self.collection.find(self._due(now), {"id": 1, "_id": 0}) \
+            .sort([("next_attempt_at", 1)]).to_list(length=limit)
+        if not candidates:
+            return []
+        batch = f"{worker}:{uuid.uuid4()}"
+        await self.collection.update_many(
+            {"id": {"$in": [message["id"] for message in candidates]}, **self._due(now)},
+            {
+                "$set": {"status": "sending", "batch": batch, "lease_until": now + timedelta(seconds=lease_seconds)},
+                "$inc": {"attempts": 1},
+            },
+        )
+        return await self.collection.find({"batch": batch}, NO_ID).to_list(length=limit)
+
+    async def mark_sent(self, batch: str, message_ids: list):
+        # Only while the claim holds: a dispatcher whose lease expired must not
+        # mark messages another one has claimed since
+        await self.collection.update_many(
+            {"id": {"$in": message_ids}, "batch": batch},
+            {"$set": {"status": "sent", "sent_at": datetime.utcnow()}, "$unset": {"lease_until": "", "batch": ""}},
+        )
+
+    async def retry(self, message: dict, error: str, delay: float):
+        await self.collection.update_one({"id": message["id"], "batch": message["batch"]}, {
+            "$set": {"status": "queued", "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay),
+                     "last_error": error},
+            "$unset": {"lease_until": "", "batch": ""},
+        })
+
+    async def fail(self, message: dict, error: str):
+        await self.collection.update_one({"id": message["id"], "batch": message["batch"]}, {
+            "$set": {"status": "failed", "last_error": error, "failed_at": datetime.utcnow()},
+            "$unset": {"lease_until": "", "batch": ""},
+        })
+
+    async def counts(self) -> dict:
+        return {status: await self.collection.count_documents({"status": status})
+                for status in ("queued", "sending", "sent", "failed")}
+
+
+class Repositories:
+    def __init__(self, database, user_cache_ttl: float = 0, catalog_cache_ttl: float = 0):
+        self.database = database
+        self.users = UserRepository(database.users, user_cache_ttl)
+        self.sheets = SheetRepository(database.pedagogical_sheets, catalog_cache_ttl)
+        self.password_resets = PasswordResetRepository(database.password_resets)
+        self.verifications = VerificationRepository(database.teacher_verifications)
+        self.previews = PreviewRepository(database.sheet_previews)
+        self.uploads = UploadRepository(database.uploads)
+        self.storage_reports = StorageReportRepository(database.storage_reports)
+        self.leases = LeaseRepository(database.leases)
+        self.startup = StartupRepository(database.startup)
+        self.rate_limits = RateLimitRepository(database.rate_limits)
+        self.jobs = JobRepository(database.jobs, database.dead_jobs)
+        self.outbox = OutboxRepository(database.outbox)
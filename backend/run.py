@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Production entry point: N uvicorn workers (uvloop + httptools) on one socket.
+
+    python run.py --workers 4 --port 8001
+
+The supervisor binds the listening socket once and hands it to each worker
+process. SIGHUP performs a rolling reload: a new generation of workers is
+started, and only once every new worker has finished its startup are the
+old ones sent SIGTERM, so they stop accepting and drain in-flight requests
+(up to --graceful-timeout) while the new generation already serves.
+SIGTERM/SIGINT drain and stop everything. Workers that die are respawned.
+
+Startup work (indexes, seeding, warm-up) is coordinated between workers by a
+Mongo lease in server.run_startup_tasks, so it runs once per deploy. The
+bcrypt cost is calibrated once here (unless BCRYPT_ROUNDS is set) and passed
+to the workers, so they all hash at the same cost.
+
+Behind a reverse proxy, list its addresses in --forwarded-allow-ips (or
+FORWARDED_ALLOW_IPS, comma-separated; "*" trusts any peer). Requests from
+those peers take their client address from X-Forwarded-For, which the
+per-IP auth rate limits key on (see rate_limit.py). Left at 127.0.0.1, a
+proxy on another host makes every client share the proxy's buckets.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+import typer
+import uvicorn
+
+import passwords
+
+logger = logging.getLogger("run")
+
+cli = typer.Typer(help="Run the API with several uvicorn worker processes.")
+
+
+def _serve(options: dict, sock, ready):
+    config = uvicorn.Config("server:app", **options)
+    server = uvicorn.Server(config)
+    config.setup_event_loop()
+
+    async def serve():
+        task = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started and not task.done():
+            await asyncio.sleep(0.05)
+        if server.started:
+            ready.set()
+        await task
+
+    asyncio.run(serve())
+
+
+class Supervisor:
+    def __init__(self, options: dict, workers: int, startup_timeout: float, graceful_timeout: float):
+        self.options = options
+        self.workers = workers
+        self.startup_timeout = startup_timeout
+        self.graceful_timeout = graceful_timeout
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = []
+        self.reload_requested = False
+        self.exit_requested = False
+        self.socket = None
+
+    def spawn(self):
+        ready = self.context.Event()
+        process = self.context.Process(
+            target=_serve, args=(self.options, self.socket, ready), name="uvicorn-worker", daemon=False
+        )
+        process.start()
+        return process, ready
+
+    def spawn_generation(self):
+        generation = [self.spawn() for _ in range(self.workers)]
+        deadline = time.monotonic() + self.startup_timeout
+        for process, ready in generation:
+            if not ready.wait(max(0.0, deadline - time.monotonic())):
+                logger.error("Worker %s did not finish startup in %.0fs", process.pid, self.startup_timeout)
+                self.stop(generation)
+                return None
+        return generation
+
+    def stop(self, generation):
+        for process, _ in generation:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        for process, _ in generation:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Worker %s did not drain in time, killing it", process.pid)
+                process.kill()
+                process.join()
+
+    def reload(self):
+        logger.info("Reloading: starting %d new workers", self.workers)
+        generation = self.spawn_generation()
+        if generation is None:
+            logger.error("Reload aborted, keeping the current workers")
+            return
+        old, self.processes = self.processes, generation
+        logger.info("New workers ready, draining %d old workers", len(old))
+        self.stop(old)
+
+    def run(self):
+        config = uvicorn.Config("server:app", **self.options)
+        self.socket = config.bind_socket()
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, "reload_requested", True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "exit_requested", True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, "exit_requested", True))
+
+        self.processes = self.spawn_generation()
+        if self.processes is None:
+            raise typer.Exit(code=1)
+        logger.info("Serving on %s:%s with %d workers", self.options["host"], self.options["port"], self.workers)
+
+        while not self.exit_requested:
+            time.sleep(0.5)
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+                continue
+            for index, (process, ready) in enumerate(self.processes):
+                if not process.is_alive() and not self.exit_requested:
+                    logger.warning("Worker %s exited with code %s, respawning", process.pid, process.exitcode)
+                    self.processes[index] = self.spawn()
+
+        logger.info("Shutting down, draining workers")
+        self.stop(self.processes)
+        self.socket.close()
+
+
+@cli.command()
+def main(
+    host: str = typer.Option("0.0.0.0"),
+    port: int = typer.Option(8001),
+    workers: int = typer.Option(int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)), help="Worker processes."),
+    graceful_timeout: int = typer.Option(30, help="Seconds a worker may spend draining requests."),
+    startup_timeout: float = typer.Option(120.0, help="Seconds a new worker may spend in startup."),
+    log_level: str = typer.Option("info"),
+    forwarded_allow_ips: str = typer.Option(
+        os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        help="Comma-separated proxy addresses whose X-Forwarded-For is trusted.",
+    ),
+):
+    """Run the API with a supervised pool of uvicorn workers."""
+    logging.basicConfig(level=log_level.upper(), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if not os.getenv("BCRYPT_ROUNDS"):
+        # Spawned workers inherit the environment
+        os.environ["BCRYPT_ROUNDS"] = str(passwords.calibrate())
+        logger.info("Calibrated bcrypt cost %s", os.environ["BCRYPT_ROUNDS"])
+    options = {
+        "host": host,
+        "port": port,
+        "loop": "uvloop",
+        "http": "httptools",
+        "log_level": log_level,
+        "timeout_graceful_shutdown": graceful_timeout,
+        "proxy_headers": True,
+        "forwarded_allow_ips": forwarded_allow_ips,
+    }
+    Supervisor(options, workers, startup_timeout, graceful_timeout).run()
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,23 +1,53 @@
 #!/usr/bin/env python3
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form, status
+from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, HTMLResponse, JSONResponse
 from pydantic import BaseModel, EmailStr
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Literal, Optional, List
+from dataclasses import asdict
+import io
 import os
+import time
 import uuid
 import json
+import re
 import hashlib
+import shutil
+import socket
 import jwt
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import asyncio
-from passlib.hash import bcrypt
+import logging
+
+import metrics
+import admission
+import jobs
+import media
+import outbox
+import passwords
+import rate_limit
+import storage
+import uploads
+import user_import
+from indexes import INDEXES, OBSOLETE_INDEXES
+from repositories import Repositories, CATALOG_SORT, USER_SUMMARY, USER_TYPES, name_key, sample_sheet_id
+from loop_monitor import loop_monitor, LOOP_MONITOR_ENABLED
+from slow_queries import SlowQueryRecorder
+from tokens import JWT_ALGORITHM, JWT_SECRET, create_jwt_token, create_reset_token
+from profiler import profiler, ProfilerCommandListener, ProfilerMiddleware, PROFILER_CONTINUOUS, format_collapsed, flamegraph_html
 
 # Initialize FastAPI app
 app = FastAPI(title="L'École des Génies API")
 
+# Auth rate limits, checked before the handlers touch the database or bcrypt
+# (innermost, so 429s still carry CORS headers)
+rate_limiter = rate_limit.RateLimiter()
+app.add_middleware(rate_limit.RateLimitMiddleware, limiter=rate_limiter)
+# Merges buckets across workers when RATE_LIMIT_SYNC is on
+rate_limit_sync = None
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -27,15 +57,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Sampling profiler request tracking (runs inside the metrics middleware)
+app.add_middleware(ProfilerMiddleware)
+
+# Request metrics (outermost middleware so it also times CORS handling)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Database connection
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.ecole_des_genies
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+slow_query_recorder = SlowQueryRecorder(MONGO_URL)
+# REPOSITORY_BACKEND=memory serves from process memory (framework-overhead baseline).
+# Each backend imports its driver only when selected; see importtime.py
+REPOSITORY_BACKEND = os.getenv("REPOSITORY_BACKEND", "mongo")
+if REPOSITORY_BACKEND == "memory":
+    from memory_store import MemoryDatabase
+    client = None
+    db = MemoryDatabase()
+else:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(
+        MONGO_URL,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        event_listeners=[metrics.MongoCommandMetrics(), ProfilerCommandListener(), slow_query_recorder]
+    )
+    db = client[os.getenv("MONGO_DB_NAME", "ecole_des_genies")]
+# Per-worker read caches in seconds (0 disables). Writes only invalidate the
+# worker that made them, so other workers serve stale entries for up to the
+# TTL: the user cache (is_admin, is_premium, is_verified) is opt-in, and the
+# catalog is kept for a few seconds only
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "0"))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "5"))
+repos = Repositories(db, USER_CACHE_TTL, CATALOG_CACHE_TTL)
+
+def use_database(database):
+    """Point the handlers at another database (e.g. a MemoryDatabase in tests)."""
+    global db, repos
+    db = database
+    repos = Repositories(database, USER_CACHE_TTL, CATALOG_CACHE_TTL)
 
-# JWT Configuration
-JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
-JWT_ALGORITHM = "HS256"
-JWT_EXPIRATION_HOURS = 24 * 7  # 7 days
+logger = logging.getLogger(__name__)
+
+# Catalog listing
+CATALOG_PAGE_SIZE = 100
+
+
+# Password hashing: BCRYPT_ROUNDS pins the bcrypt cost, otherwise it is
+# calibrated on startup to HASH_TARGET_MS per hash (see passwords.py)
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")
+password_context = passwords.build_context(int(BCRYPT_ROUNDS or passwords.DEFAULT_ROUNDS))
 
 # Security
 security = HTTPBearer()
@@ -46,7 +116,8 @@ class UserRegister(BaseModel):
     password: str
     first_name: str
     last_name: str
-    user_type: str  # "parent", "teacher"
+    # One of USER_TYPES: the admin listing only searches those
+    user_type: Literal["parent", "teacher"]
 
 class UserLogin(BaseModel):
     email: EmailStr
@@ -82,6 +153,11 @@ class PedagogicalSheetCreate(BaseModel):
     is_premium: bool = False
     is_teacher_only: bool = False
 
+class ResumableUploadCreate(PedagogicalSheetCreate):
+    filename: str
+    size: int
+    sha256: Optional[str] = None  # of the whole file, checked on finalize
+
 class PedagogicalSheetUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
@@ -111,65 +187,246 @@ async def get_admin_user(credentials: HTTPAuthorizationCredentials = Depends(sec
     return user
 
 # Helper functions
+# Request handlers hash through the admission controller (bounded, off the loop)
+hash_admission = admission.HashAdmission()
+
+@app.exception_handler(admission.Overloaded)
+async def overloaded_handler(request, exc: admission.Overloaded):
+    return JSONResponse(
+        {"detail": "Service surchargé, veuillez réessayer dans quelques instants"},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 def hash_password(password: str) -> str:
-    return bcrypt.hash(password)
+    start = time.perf_counter()
+    hashed = password_context.hash(password)
+    metrics.PASSWORD_HASH_DURATION.observe(time.perf_counter() - start, "hash")
+    return hashed
 
 def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.verify(password, hashed)
-
-def create_jwt_token(user_data: dict) -> str:
-    payload = {
-        "user_id": user_data["id"],
-        "email": user_data["email"],
-        "user_type": user_data["user_type"],
-        "exp": datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
+    start = time.perf_counter()
+    valid = password_context.verify(password, hashed)
+    metrics.PASSWORD_HASH_DURATION.observe(time.perf_counter() - start, "verify")
+    return valid
+
+def verify_and_update_password(password: str, hashed: str) -> tuple:
+    # (valid, new_hash); new_hash is set when the stored cost is below the policy
+    start = time.perf_counter()
+    valid, new_hash = password_context.verify_and_update(password, hashed)
+    metrics.PASSWORD_HASH_DURATION.observe(time.perf_counter() - start, "verify")
+    return valid, new_hash
+
+# Bulk user imports hash on a process pool, started on first use. It is kept
+# small: imports bypass the hash admission control, and a pool per API worker
+# sized to the cores would starve logins on the same host (the CLI uses them all)
+IMPORT_HASH_WORKERS = int(os.getenv("API_IMPORT_HASH_WORKERS", "1"))
+import_pool = None
+
+def get_import_pool():
+    global import_pool
+    if import_pool is None:
+        import_pool = user_import.hash_process_pool(IMPORT_HASH_WORKERS)
+    return import_pool
+
+# Upload post-processing (see media.py) runs on its own process pool
+media_pool = None
+
+def get_media_pool():
+    global media_pool
+    if media_pool is None:
+        media_pool = media.media_process_pool()
+    return media_pool
+
+async def calibrate_password_hashing():
+    global password_context
+    rounds = await asyncio.to_thread(passwords.calibrate)
+    password_context = passwords.build_context(rounds)
+    logger.info("Password hashing calibrated to bcrypt cost %d", rounds)
+
+# Background jobs (see jobs.py); the in-process pool is started on startup
+job_pool = None
+
+async def enqueue_job(job_type: str, payload: dict) -> str:
+    job_id = await repos.jobs.enqueue(job_type, payload)
+    if job_pool is not None:
+        job_pool.notify()
+    return job_id
+
+# Verification uploads; photos are replaced by a review copy (see media.py)
+VERIFICATIONS_DIR = "/tmp/verifications"
+
+@jobs.handler("process_verification_document")
+async def process_verification_document(payload: dict):
+    verification = await repos.verifications.get(payload["verification_id"])
+    if verification is None or "content_type" in verification:
+        return  # gone, or already processed
+    source = verification["document_url"]
+    archived = media.cold_path(source, "verifications")
+    if not os.path.exists(source) and os.path.exists(archived):
+        source = archived  # an earlier attempt moved it before failing
+    # File I/O in threads: cold storage may be another disk, making the archive a full copy
+    content_type = await asyncio.to_thread(media.sniff, source)
+    original_bytes = await asyncio.to_thread(os.path.getsize, source)
+    fields = {"content_type": content_type or "application/octet-stream", "original_bytes": original_bytes}
+    media.MEDIA_BYTES.inc("verification", "original", amount=original_bytes)
+    if content_type in media.RESIZABLE_TYPES:
+        review_path = f"{VERIFICATIONS_DIR}/{verification['id']}_review.jpg"
+        loop = asyncio.get_running_loop()
+        review = await loop.run_in_executor(get_media_pool(), media.downscale_image, source, review_path)
+        media.MEDIA_BYTES.inc("verification", "derived", amount=review["bytes"])
+        fields.update(document_url=review_path, review_content_type="image/jpeg", review_bytes=review["bytes"])
+    # Every original moves to cold storage; those without a review copy (PDF,
+    # HEIC) are reviewed from there
+    fields["original_url"] = await asyncio.to_thread(media.archive_original, source, "verifications")
+    fields.setdefault("document_url", fields["original_url"])
+    await repos.verifications.update(verification["id"], fields)
+
+# Uploaded sheet files, and their previews (see media.py)
+UPLOADS_DIR = "/tmp/uploaded_files"
+PREVIEW_NAME = re.compile(r"^[0-9a-f]{64}\.jpg$")
+
+def preview_url(content_hash: str) -> str:
+    return f"/api/previews/{content_hash}.jpg"
+
+@jobs.handler("process_sheet_document")
+async def process_sheet_document(payload: dict):
+    sheet = await repos.sheets.get(payload["sheet_id"])
+    if sheet is None or "preview" in sheet:
+        return  # gone, or already processed
+    content_hash = sheet["content_hash"]
+    artefacts = await repos.previews.get(content_hash)
+    if artefacts is None:
+        source = os.path.join(UPLOADS_DIR, os.path.basename(sheet["file_url"]))
+        content_type = await asyncio.to_thread(media.sniff, source)
+        os.makedirs(media.PREVIEWS_DIR, exist_ok=True)
+        thumbnail = os.path.join(media.PREVIEWS_DIR, f"{content_hash}.jpg")
+        loop = asyncio.get_running_loop()
+        artefacts = await loop.run_in_executor(get_media_pool(), media.sheet_preview, source, content_type, thumbnail)
+        artefacts["content_type"] = content_type or "application/octet-stream"
+        artefacts["created_at"] = datetime.utcnow()
+        await repos.previews.save(content_hash, artefacts)
+    # Listings carry only this small summary; the text stays in sheet_previews
+    await repos.sheets.update(sheet["id"], {"preview": {
+        "url": preview_url(content_hash) if artefacts["thumbnail_bytes"] else None,
+        "page_count": artefacts["page_count"],
+        "content_type": artefacts["content_type"],
+    }})
+
+async def add_sheet(sheet_id: str, fields: dict, filename: str, content_hash: str) -> dict:
+    """Insert the record for a sheet file stored in UPLOADS_DIR and queue its preview."""
+    new_sheet = {
+        "id": sheet_id,
+        **fields,
+        "file_url": f"/api/files/{filename}",
+        "content_hash": content_hash,
+        "created_at": datetime.utcnow()
     }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    await repos.sheets.insert(new_sheet)
+    await enqueue_job("process_sheet_document", {"sheet_id": sheet_id})
+    return new_sheet
 
-def create_reset_token(email: str) -> str:
-    payload = {
-        "email": email,
-        "type": "password_reset",
-        "exp": datetime.utcnow() + timedelta(hours=1)  # 1 hour expiration
+def sheet_response(sheet: dict) -> dict:
+    # A clean version without datetime serialization issues
+    return {
+        "id": sheet["id"],
+        "title": sheet["title"],
+        "description": sheet["description"],
+        "level": sheet["level"],
+        "subject": sheet["subject"],
+        "is_premium": sheet["is_premium"],
+        "is_teacher_only": sheet["is_teacher_only"],
+        "file_url": sheet["file_url"],
+        "created_at": sheet["created_at"].isoformat()
     }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+# Periodic maintenance runs as a job that queues its own next run
+async def schedule_job(job_type: str, delay: float):
+    if not await repos.jobs.is_queued(job_type):
+        await repos.jobs.enqueue(job_type, {}, run_at=datetime.utcnow() + timedelta(seconds=delay))
+
+@jobs.handler("collect_upload_garbage")
+async def collect_upload_garbage(payload: dict):
+    expired = await uploads.collect_garbage(repos.uploads)
+    if expired:
+        logger.info("Expired %d abandoned uploads", expired)
+    await schedule_job("collect_upload_garbage", uploads.UPLOAD_GC_INTERVAL_SECONDS)
+
+# Placeholder content for sheets without an uploaded file (the seeded samples)
+SAMPLE_FILES_DIR = "/tmp/sample_files"
+
+def is_sample_sheet(sheet: dict) -> bool:
+    return sheet["id"] == sample_sheet_id(sheet["file_url"])
+
+# Storage reconciliation: orphaned files and references to missing ones (see storage.py)
+async def referenced_sheet_files(names: list) -> set:
+    file_urls = await repos.sheets.referenced_files([f"/api/files/{name}" for name in names])
+    return {os.path.basename(file_url) for file_url in file_urls}
+
+def referenced_documents(directory: str):
+    async def referenced(names: list) -> set:
+        paths = await repos.verifications.referenced_documents([os.path.join(directory, name) for name in names])
+        return {os.path.basename(path) for path in paths}
+    return referenced
+
+async def active_upload_parts(names: list) -> set:
+    upload_ids = await repos.uploads.active([name[:-len(".part")] for name in names if name.endswith(".part")])
+    return {f"{upload_id}.part" for upload_id in upload_ids}
+
+async def sheet_files():
+    async for sheet in repos.sheets.files():
+        if not is_sample_sheet(sheet):  # their placeholder is written on first download
+            yield sheet["id"], (os.path.join(UPLOADS_DIR, os.path.basename(sheet["file_url"])),)
+
+async def verification_files():
+    async for record in repos.verifications.documents():
+        # An original the processing job archived before updating the record
+        yield record["id"], (record["document_url"], media.cold_path(record["document_url"], "verifications"))
+        if record.get("original_url"):
+            yield record["id"], (record["original_url"],)
+
+def storage_areas() -> list:
+    return [
+        storage.Area("sheets", UPLOADS_DIR, referenced_sheet_files),
+        storage.Area("sample_files", SAMPLE_FILES_DIR, referenced_sheet_files),
+        storage.Area("verifications", VERIFICATIONS_DIR, referenced_documents(VERIFICATIONS_DIR)),
+        storage.Area("verification_originals", os.path.join(media.COLD_STORAGE_DIR, "verifications"),
+                     referenced_documents(os.path.join(media.COLD_STORAGE_DIR, "verifications"))),
+        storage.Area("upload_parts", uploads.UPLOAD_PARTS_DIR, active_upload_parts),
+    ]
+
+def storage_references() -> list:
+    return [
+        storage.References("sheets", sheet_files),
+        storage.References("verifications", verification_files),
+    ]
+
+@jobs.handler("reconcile_storage", lease_seconds=storage.RECONCILE_LEASE_SECONDS)
+async def reconcile_storage(payload: dict):
+    report = await storage.reconcile(storage_areas(), storage_references())
+    await repos.storage_reports.insert(asdict(report))
+    await schedule_job("reconcile_storage", storage.RECONCILE_INTERVAL_SECONDS)
+
+# Users created before name_key existed, a batch per job
+NAME_KEY_BATCH = 5000
+
+@jobs.handler("backfill_name_keys")
+async def backfill_name_keys(payload: dict):
+    if await repos.users.backfill_name_keys(NAME_KEY_BATCH) == NAME_KEY_BATCH:
+        await enqueue_job("backfill_name_keys", {})
+
+# Emails are queued in the outbox and delivered in batches (see outbox.py)
+FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
+outbox_dispatcher = None
+
+async def queue_emails(messages: list):
+    await repos.outbox.enqueue(messages)
+    if outbox_dispatcher is not None:
+        outbox_dispatcher.notify()
 
 async def send_password_reset_email(email: str, reset_token: str):
-    # In production, use a real email service like SendGrid, Amazon SES, etc.
-    # For now, we'll simulate by logging
-    reset_link = f"http://localhost:3000/reset-password?token={reset_token}"
-    
-    email_content = f"""
-    Bonjour,
-    
-    Vous avez demandé à réinitialiser votre mot de passe pour L'École des Génies.
-    
-    Cliquez sur le lien suivant pour réinitialiser votre mot de passe :
-    {reset_link}
-    
-    Ce lien expirera dans 1 heure.
-    
-    Si vous n'avez pas demandé cette réinitialisation, ignorez cet email.
-    
-    Cordialement,
-    L'équipe de L'École des Génies
-    """
-    
-    # Simulate email sending by writing to a log file
-    log_dir = "/tmp/email_logs"
-    os.makedirs(log_dir, exist_ok=True)
-    
-    with open(f"{log_dir}/password_reset_{email.replace('@', '_')}.txt", "w") as f:
-        f.write(f"TO: {email}\n")
-        f.write(f"SUBJECT: Réinitialisation de mot de passe - L'École des Génies\n")
-        f.write(f"DATE: {datetime.utcnow()}\n")
-        f.write(f"RESET_TOKEN: {reset_token}\n")
-        f.write(f"RESET_LINK: {reset_link}\n\n")
-        f.write(email_content)
-    
-    print(f"📧 Password reset email simulated for {email}")
-    print(f"🔗 Reset link: {reset_link}")
-    return True
+    reset_link = f"{FRONTEND_URL}/reset-password?token={reset_token}"
+    await queue_emails([outbox.render_message("password_reset", email, reset_link=reset_link)])
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
@@ -178,27 +435,53 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        user = await db.users.find_one({"id": user_id})
+        user = await repos.users.get_by_id(user_id)
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
         
         return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# Indexes this worker's startup could not build, by collection (see ensure_indexes)
+missing_indexes = {}
+
+async def ensure_indexes() -> dict:
+    """Build INDEXES; returns the names of those that could not be built, by collection."""
+    for collection_name, names in OBSOLETE_INDEXES.items():
+        for name in names:
+            try:
+                await db[collection_name].drop_index(name)
+            except OperationFailure:
+                pass  # already dropped
+    failed = {}
+    for collection_name, indexes in INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(indexes)
+        except OperationFailure:
+            # One failing index fails the whole list: build the others one at a time
+            for index in indexes:
+                try:
+                    await db[collection_name].create_indexes([index])
+                except OperationFailure as exc:
+                    # e.g. existing duplicates preventing a unique index; keep serving
+                    logger.error("Could not create index %s on %s: %s", index.document["name"], collection_name, exc)
+                    failed.setdefault(collection_name, []).append(index.document["name"])
+    return failed
+
 # Initialize sample data
 async def init_sample_data():
     # Check if sample data already exists
-    existing_sheets = await db.pedagogical_sheets.count_documents({})
+    existing_sheets = await repos.sheets.count()
     if existing_sheets > 0:
         return
     
     # Sample pedagogical sheets
     sample_sheets = [
         {
-            "id": str(uuid.uuid4()),
+            "id": sample_sheet_id("/api/files/sample_couleurs.pdf"),
             "title": "Apprendre les couleurs - Maternelle",
             "description": "Fiche pédagogique pour découvrir et mémoriser les couleurs primaires avec des activités ludiques.",
             "level": "PS",
@@ -209,7 +492,7 @@ async def init_sample_data():
             "created_at": datetime.utcnow()
         },
         {
-            "id": str(uuid.uuid4()),
+            "id": sample_sheet_id("/api/files/sample_additions.pdf"),
             "title": "Les additions simples - CP",
             "description": "Initiation aux additions avec des exercices progressifs et des supports visuels.",
             "level": "CP",
@@ -220,7 +503,7 @@ async def init_sample_data():
             "created_at": datetime.utcnow()
         },
         {
-            "id": str(uuid.uuid4()),
+            "id": sample_sheet_id("/api/files/sample_grammaire.pdf"),
             "title": "Grammaire : Le verbe et le sujet",
             "description": "Exercices pour identifier le verbe et le sujet dans une phrase simple.",
             "level": "CE1",
@@ -231,7 +514,7 @@ async def init_sample_data():
             "created_at": datetime.utcnow()
         },
         {
-            "id": str(uuid.uuid4()),
+            "id": sample_sheet_id("/api/files/sample_fractions.pdf"),
             "title": "Les fractions - Niveau avancé",
             "description": "Comprendre et manipuler les fractions avec des exemples concrets.",
             "level": "CM2",
@@ -242,7 +525,7 @@ async def init_sample_data():
             "created_at": datetime.utcnow()
         },
         {
-            "id": str(uuid.uuid4()),
+            "id": sample_sheet_id("/api/files/sample_eau.pdf"),
             "title": "Sciences : Le cycle de l'eau",
             "description": "Découvrir le cycle de l'eau avec expériences et schémas explicatifs.",
             "level": "CE2",
@@ -254,27 +537,154 @@ async def init_sample_data():
         }
     ]
     
-    await db.pedagogical_sheets.insert_many(sample_sheets)
+    await repos.sheets.insert_missing(sample_sheets)
+
+# Startup work shared by all workers; the lease makes exactly one run it at a time
+STARTUP_LEASE = "startup"
+STARTUP_LEASE_SECONDS = float(os.getenv("STARTUP_LEASE_SECONDS", "600"))
+# Recorded once every index and the seed data are in place, so later workers skip them.
+# Bump it whenever INDEXES, OBSOLETE_INDEXES or the sample sheets change.
+STARTUP_VERSION = "1"
+
+async def renew_lease(name: str, owner: str, ttl: float):
+    """Keep holding a lease while long work runs under it (cancel to stop)."""
+    while True:
+        await asyncio.sleep(ttl / 3)
+        if not await repos.leases.acquire(name, owner, ttl):
+            logger.warning("Lost the %s lease to another worker", name)
+            return
+
+async def run_startup_tasks(poll_interval: float = 0.5):
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4()}"
+    while not await repos.leases.acquire(STARTUP_LEASE, owner, STARTUP_LEASE_SECONDS):
+        # Another worker is on it; every task is idempotent, so once its lease
+        # is released (or expires after a crash) the checks below are no-ops
+        await asyncio.sleep(poll_interval)
+    renewal = asyncio.create_task(renew_lease(STARTUP_LEASE, owner, STARTUP_LEASE_SECONDS))
+    try:
+        if not await repos.startup.completed(STARTUP_VERSION):
+            global missing_indexes
+            missing_indexes = await ensure_indexes()
+            await init_sample_data()
+            if missing_indexes:
+                # Not recorded, so the next worker or restart retries once the data is fixed
+                logger.error("Startup incomplete, indexes missing: %s", missing_indexes)
+            else:
+                await repos.startup.complete(STARTUP_VERSION)
+        if (await repos.users.count({"name_key": {"$exists": False}})
+                and not await repos.jobs.is_queued("backfill_name_keys")):
+            await enqueue_job("backfill_name_keys", {})
+        await schedule_job("collect_upload_garbage", uploads.UPLOAD_GC_INTERVAL_SECONDS)
+        await schedule_job("reconcile_storage", storage.RECONCILE_INTERVAL_SECONDS)
+    finally:
+        renewal.cancel()
+        await repos.leases.release(STARTUP_LEASE, owner)
+
+# Warm-up: every worker pays its cold-start costs before reporting ready
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_USERS = int(os.getenv("WARMUP_USERS", "500"))
+# One user per distinct catalog query (unverified teachers share the free tier)
+WARMUP_TIERS = [
+    {"user_type": "parent", "is_premium": False, "is_verified": True},
+    {"user_type": "parent", "is_premium": True, "is_verified": True},
+    {"user_type": "teacher", "is_premium": False, "is_verified": True},
+]
+readiness = {"ready": False, "warmup": {}}
+
+async def warm_up():
+    timings = readiness["warmup"]
+
+    start = time.perf_counter()
+    # Concurrent pings force the pool open up to its minimum size
+    await asyncio.gather(*(db.command("ping") for _ in range(max(MONGO_MIN_POOL_SIZE, 1))))
+    timings["mongo_pool"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    repos.users.prime(await repos.users.recent(WARMUP_USERS))
+    timings["user_cache"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for tier in WARMUP_TIERS:
+        await repos.sheets.list(build_sheet_query(tier), CATALOG_PAGE_SIZE)
+    timings["catalog_cache"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # Loads the bcrypt backend and the JWT/crypto code paths once
+    verify_password("warm-up", hash_password("warm-up"))
+    token = create_jwt_token({"id": "warm-up", "email": "warm-up@example.com", "user_type": "parent"})
+    jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    timings["crypto"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    UserRegister.model_validate({
+        "email": "warm-up@example.com", "password": "warm-up", "first_name": "A",
+        "last_name": "B", "user_type": "parent",
+    })
+    UserLogin.model_validate({"email": "warm-up@example.com", "password": "warm-up"})
+    PedagogicalSheetUpdate.model_validate({"title": "warm-up"})
+    timings["models"] = time.perf_counter() - start
 
 # API Routes
 @app.on_event("startup")
 async def startup_event():
-    await init_sample_data()
+    global job_pool, outbox_dispatcher, rate_limit_sync
+    await run_startup_tasks()
+    if not BCRYPT_ROUNDS:
+        await calibrate_password_hashing()
+    if WARMUP_ENABLED:
+        await warm_up()
+    readiness["ready"] = True
+    if jobs.JOB_WORKERS > 0:
+        job_pool = jobs.JobWorkerPool(repos.jobs)
+        job_pool.start()
+    if outbox.OUTBOX_ENABLED:
+        outbox_dispatcher = outbox.OutboxDispatcher(repos.outbox, outbox.build_transport())
+        outbox_dispatcher.start()
+    if PROFILER_CONTINUOUS:
+        profiler.start()
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    if rate_limit.RATE_LIMIT_ENABLED and rate_limit.RATE_LIMIT_SYNC:
+        rate_limit_sync = asyncio.create_task(rate_limiter.sync_forever(repos.rate_limits))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    readiness["ready"] = False
+    loop_monitor.stop()
+    if job_pool is not None:
+        await job_pool.stop()
+    if outbox_dispatcher is not None:
+        await outbox_dispatcher.stop()
+    if rate_limit_sync is not None:
+        rate_limit_sync.cancel()
+    if import_pool is not None:
+        import_pool.shutdown(wait=False, cancel_futures=True)
+    if media_pool is not None:
+        media_pool.shutdown(wait=False, cancel_futures=True)
 
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy", "message": "L'École des Génies API is running"}
 
+@app.get("/api/ready")
+async def readiness_check():
+    # Load balancer probe: 503 until startup and warm-up have finished
+    if not readiness["ready"]:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return {"status": "ready", "warmup": readiness["warmup"]}
+
+@app.get("/api/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.post("/api/auth/register")
 async def register(user_data: UserRegister):
-    # Check if user already exists
-    existing_user = await db.users.find_one({"email": user_data.email})
-    if existing_user:
+    # Create new user; the unique email index rejects duplicates atomically.
+    # Until startup could build it (existing duplicates), check first instead
+    if "email_unique" in missing_indexes.get("users", ()) and await repos.users.get_by_email(user_data.email):
         raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Create new user
     user_id = str(uuid.uuid4())
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_admission.run(hash_password, user_data.password)
     
     new_user = {
         "id": user_id,
@@ -282,6 +692,7 @@ async def register(user_data: UserRegister):
         "password": hashed_password,
         "first_name": user_data.first_name,
         "last_name": user_data.last_name,
+        "name_key": name_key(user_data.first_name, user_data.last_name),
         "user_type": user_data.user_type,
         "is_premium": False,
         "is_verified": user_data.user_type != "teacher",  # Teachers need verification
@@ -289,7 +700,10 @@ async def register(user_data: UserRegister):
         "created_at": datetime.utcnow()
     }
     
-    await db.users.insert_one(new_user)
+    try:
+        await repos.users.insert(new_user)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create JWT token
     token = create_jwt_token(new_user)
@@ -311,9 +725,17 @@ async def register(user_data: UserRegister):
 @app.post("/api/auth/login")
 async def login(login_data: UserLogin):
     # Find user
-    user = await db.users.find_one({"email": login_data.email})
-    if not user or not verify_password(login_data.password, user["password"]):
+    user = await repos.users.get_by_email(login_data.email)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    valid, new_hash = await hash_admission.run(verify_and_update_password, login_data.password, user["password"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    if new_hash:
+        # Stored with a weaker cost than the current policy: upgrade it now
+        # that the plain password is at hand
+        await repos.users.update_by_id(user["id"], {"password": new_hash})
+        passwords.PASSWORD_REHASHES.inc()
     
     # Create JWT token
     token = create_jwt_token(user)
@@ -335,7 +757,7 @@ async def login(login_data: UserLogin):
 @app.post("/api/auth/forgot-password")
 async def forgot_password(request_data: PasswordResetRequest):
     # Check if user exists
-    user = await db.users.find_one({"email": request_data.email})
+    user = await repos.users.get_by_email(request_data.email)
     if not user:
         # Don't reveal if email exists or not for security
         return {"message": "Si cet email existe, vous recevrez un lien de réinitialisation"}
@@ -353,13 +775,10 @@ async def forgot_password(request_data: PasswordResetRequest):
         "expires_at": datetime.utcnow() + timedelta(hours=1)
     }
     
-    # Clean up old reset tokens for this email
-    await db.password_resets.delete_many({"email": request_data.email})
-    
-    # Insert new reset token
-    await db.password_resets.insert_one(reset_record)
+    # Replace any older reset token for this email
+    await repos.password_resets.replace_for_email(reset_record)
     
-    # Send email (simulated)
+    # Queue the email; the outbox dispatcher delivers it
     await send_password_reset_email(request_data.email, reset_token)
     
     return {"message": "Si cet email existe, vous recevrez un lien de réinitialisation"}
@@ -377,40 +796,30 @@ async def reset_password(reset_data: PasswordReset):
         if not email:
             raise HTTPException(status_code=400, detail="Token invalide")
         
-        # Check if token exists in database and is not used
-        reset_record = await db.password_resets.find_one({
-            "email": email,
-            "token": reset_data.token,
-            "used": False,
-            "expires_at": {"$gt": datetime.utcnow()}
-        })
+        # Used, replaced or expired tokens are refused before paying for a hash
+        if not await repos.password_resets.is_valid(email, reset_data.token, datetime.utcnow()):
+            raise HTTPException(status_code=400, detail="Token invalide ou expiré")
+        
+        # Hash before consuming: if admission control sheds the request (503),
+        # the token is still unused and the same link can be retried
+        hashed_password = await hash_admission.run(hash_password, reset_data.new_password)
+        
+        # Consume the token: it must exist, be unused and unexpired, and only
+        # one concurrent request can redeem it
+        reset_record = await repos.password_resets.consume(email, reset_data.token, datetime.utcnow())
         
         if not reset_record:
             raise HTTPException(status_code=400, detail="Token invalide ou expiré")
         
-        # Find user
-        user = await db.users.find_one({"email": email})
-        if not user:
-            raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-        
         # Update password
-        hashed_password = hash_password(reset_data.new_password)
-        await db.users.update_one(
-            {"email": email},
-            {"$set": {"password": hashed_password}}
-        )
-        
-        # Mark token as used
-        await db.password_resets.update_one(
-            {"id": reset_record["id"]},
-            {"$set": {"used": True}}
-        )
+        if not await repos.users.update_by_email(email, {"password": hashed_password}):
+            raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
         
         return {"message": "Mot de passe réinitialisé avec succès"}
         
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=400, detail="Token expiré")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=400, detail="Token invalide")
 
 @app.get("/api/user/profile")
@@ -426,12 +835,7 @@ async def get_profile(current_user = Depends(get_current_user)):
         "is_admin": current_user.get("is_admin", False)
     }
 
-@app.get("/api/pedagogical-sheets")
-async def get_pedagogical_sheets(
-    level: Optional[str] = None,
-    subject: Optional[str] = None,
-    current_user = Depends(get_current_user)
-):
+def build_sheet_query(user: dict, level: Optional[str] = None, subject: Optional[str] = None) -> dict:
     # Build query based on user permissions
     query = {}
     
@@ -441,15 +845,15 @@ async def get_pedagogical_sheets(
         query["subject"] = subject
     
     # Filter based on user type and permissions
-    if current_user["user_type"] == "parent":
-        if current_user["is_premium"]:
+    if user["user_type"] == "parent":
+        if user["is_premium"]:
             # Premium parents can see all non-teacher-only sheets
             query["is_teacher_only"] = False
         else:
             # Free parents can only see free, non-teacher-only sheets
             query["is_premium"] = False
             query["is_teacher_only"] = False
-    elif current_user["user_type"] == "teacher" and current_user["is_verified"]:
+    elif user["user_type"] == "teacher" and user["is_verified"]:
         # Verified teachers can see everything
         pass
     else:
@@ -457,7 +861,24 @@ async def get_pedagogical_sheets(
         query["is_premium"] = False
         query["is_teacher_only"] = False
     
-    sheets = await db.pedagogical_sheets.find(query, {"_id": 0}).to_list(length=100)
+    return query
+
+# Files matched by one full-text search, before the catalog filters apply
+SEARCH_MATCH_LIMIT = 1000
+
+@app.get("/api/pedagogical-sheets")
+async def get_pedagogical_sheets(
+    level: Optional[str] = None,
+    subject: Optional[str] = None,
+    q: Optional[str] = None,
+    current_user = Depends(get_current_user)
+):
+    query = build_sheet_query(current_user, level, subject)
+    if q and q.strip():
+        # Search the text extracted from the sheets' PDFs (see media.py)
+        query["content_hash"] = {"$in": await repos.previews.search(q.strip(), SEARCH_MATCH_LIMIT)}
+    
+    sheets = await repos.sheets.list(query, CATALOG_PAGE_SIZE, cached="content_hash" not in query)
     
     return {
         "sheets": sheets,
@@ -476,21 +897,20 @@ async def submit_teacher_verification(
         raise HTTPException(status_code=400, detail="Teacher already verified")
     
     # Check if verification already pending
-    existing_verification = await db.teacher_verifications.find_one({
-        "user_id": current_user["id"],
-        "status": "pending"
-    })
+    existing_verification = await repos.verifications.find_pending(current_user["id"])
     if existing_verification:
         raise HTTPException(status_code=400, detail="Verification already pending")
     
     # Save uploaded file (in production, use cloud storage)
     file_id = str(uuid.uuid4())
-    file_path = f"/tmp/verifications/{file_id}_{file.filename}"
-    os.makedirs("/tmp/verifications", exist_ok=True)
+    file_path = f"{VERIFICATIONS_DIR}/{file_id}_{file.filename}"
+    os.makedirs(VERIFICATIONS_DIR, exist_ok=True)
     
     with open(file_path, "wb") as buffer:
         content = await file.read()
         buffer.write(content)
+    metrics.UPLOADS.inc("verification")
+    metrics.UPLOAD_BYTES.inc("verification", amount=len(content))
     
     # Create verification record
     verification = {
@@ -501,7 +921,8 @@ async def submit_teacher_verification(
         "created_at": datetime.utcnow()
     }
     
-    await db.teacher_verifications.insert_one(verification)
+    await repos.verifications.insert(verification)
+    await enqueue_job("process_verification_document", {"verification_id": verification["id"]})
     
     return {"message": "Verification document submitted successfully", "status": "pending"}
 
@@ -511,10 +932,7 @@ async def simulate_subscription(current_user = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Only parents can subscribe to premium")
     
     # Simulate successful payment
-    await db.users.update_one(
-        {"id": current_user["id"]},
-        {"$set": {"is_premium": True}}
-    )
+    await repos.users.update_by_id(current_user["id"], {"is_premium": True})
     
     return {
         "message": "Subscription successful (simulated)",
@@ -522,14 +940,29 @@ async def simulate_subscription(current_user = Depends(get_current_user)):
         "is_premium": True
     }
 
+@app.get("/api/previews/{name}")
+async def get_preview(name: str):
+    # Named by content hash, so a preview never changes once written
+    path = os.path.join(media.PREVIEWS_DIR, name)
+    if not PREVIEW_NAME.match(name) or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Aperçu introuvable")
+    return FileResponse(path, media_type="image/jpeg",
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
 @app.get("/api/files/{filename}")
 async def download_file(filename: str, current_user = Depends(get_current_user)):
     # In a real implementation, check if user has access to this specific file
-    file_path = f"/tmp/sample_files/{filename}"
+    filename = os.path.basename(filename)
+    uploaded_path = os.path.join(UPLOADS_DIR, filename)
+    if os.path.exists(uploaded_path):
+        return FileResponse(uploaded_path, filename=filename)
+    file_path = os.path.join(SAMPLE_FILES_DIR, filename)
     
-    # Create sample file if it doesn't exist
-    os.makedirs("/tmp/sample_files", exist_ok=True)
+    # Create a placeholder for a sheet's missing file, never for arbitrary names
     if not os.path.exists(file_path):
+        if not await repos.sheets.has_file(f"/api/files/{filename}"):
+            raise HTTPException(status_code=404, detail="Fichier non trouvé")
+        os.makedirs(SAMPLE_FILES_DIR, exist_ok=True)
         with open(file_path, "w") as f:
             f.write(f"Sample PDF content for {filename}")
     
@@ -542,7 +975,7 @@ async def download_file(filename: str, current_user = Depends(get_current_user))
 # Admin Routes
 @app.get("/api/admin/pedagogical-sheets")
 async def get_all_pedagogical_sheets_admin(admin_user = Depends(get_admin_user)):
-    sheets = await db.pedagogical_sheets.find({}, {"_id": 0}).to_list(length=1000)
+    sheets = await repos.sheets.list({}, 1000)
     return {"sheets": sheets, "total": len(sheets)}
 
 @app.post("/api/admin/pedagogical-sheets")
@@ -560,44 +993,173 @@ async def create_pedagogical_sheet(
     file_id = str(uuid.uuid4())
     file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'pdf'
     new_filename = f"{file_id}.{file_extension}"
-    file_path = f"/tmp/uploaded_files/{new_filename}"
+    file_path = f"{UPLOADS_DIR}/{new_filename}"
     
-    os.makedirs("/tmp/uploaded_files", exist_ok=True)
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
     
     with open(file_path, "wb") as buffer:
         content = await file.read()
         buffer.write(content)
+    # Previews are cached by content, so re-uploading a file reuses them
+    content_hash = hashlib.sha256(content).hexdigest()
+    metrics.UPLOADS.inc("sheet")
+    metrics.UPLOAD_BYTES.inc("sheet", amount=len(content))
     
     # Create pedagogical sheet record
-    sheet_id = str(uuid.uuid4())
-    new_sheet = {
-        "id": sheet_id,
+    new_sheet = await add_sheet(str(uuid.uuid4()), {
         "title": title,
         "description": description,
         "level": level,
         "subject": subject,
         "is_premium": is_premium,
         "is_teacher_only": is_teacher_only,
-        "file_url": f"/api/files/{new_filename}",
-        "created_at": datetime.utcnow()
-    }
+    }, new_filename, content_hash)
     
-    await db.pedagogical_sheets.insert_one(new_sheet)
-    
-    # Return a clean version without datetime serialization issues
-    return_sheet = {
-        "id": new_sheet["id"],
-        "title": new_sheet["title"],
-        "description": new_sheet["description"],
-        "level": new_sheet["level"],
-        "subject": new_sheet["subject"],
-        "is_premium": new_sheet["is_premium"],
-        "is_teacher_only": new_sheet["is_teacher_only"],
-        "file_url": new_sheet["file_url"],
-        "created_at": new_sheet["created_at"].isoformat()
+    return {"message": "Fiche pédagogique créée avec succès", "sheet": sheet_response(new_sheet)}
+
+# Resumable uploads for large sheet files (see uploads.py)
+def upload_response(upload: dict, status_code: int = 200) -> JSONResponse:
+    return JSONResponse({
+        "id": upload["id"],
+        "filename": upload["filename"],
+        "size": upload["size"],
+        "offset": upload["offset"],
+        "status": upload["status"],
+        "sheet_id": upload.get("sheet_id"),
+        "max_chunk_bytes": uploads.MAX_CHUNK_BYTES,
+    }, status_code=status_code, headers={
+        "Upload-Offset": str(upload["offset"]),
+        "Upload-Length": str(upload["size"]),
+        "Cache-Control": "no-store",
+    })
+
+def offset_conflict(detail: str, offset: int) -> HTTPException:
+    # The client resumes from the offset in the header
+    return HTTPException(status_code=409, detail=detail, headers={"Upload-Offset": str(offset)})
+
+async def get_upload_or_404(upload_id: str) -> dict:
+    upload = await repos.uploads.get(upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+@app.post("/api/admin/uploads")
+async def create_upload(upload_data: ResumableUploadCreate, admin_user = Depends(get_admin_user)):
+    if upload_data.size <= 0:
+        raise HTTPException(status_code=400, detail="size must be positive")
+    if upload_data.size > uploads.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    now = datetime.utcnow()
+    upload = {
+        "id": str(uuid.uuid4()),
+        "admin_id": admin_user["id"],
+        "filename": upload_data.filename,
+        "size": upload_data.size,
+        "sha256": upload_data.sha256.lower() if upload_data.sha256 else None,
+        "sheet": upload_data.model_dump(include=set(PedagogicalSheetCreate.model_fields)),
+        "offset": 0,
+        "status": "uploading",
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + timedelta(seconds=uploads.UPLOAD_EXPIRY_SECONDS),
     }
-    
-    return {"message": "Fiche pédagogique créée avec succès", "sheet": return_sheet}
+    # The part file first: a session never points at a missing file
+    await asyncio.to_thread(uploads.create_part, upload["id"])
+    await repos.uploads.insert(upload)
+    return upload_response(upload, status_code=201)
+
+@app.api_route("/api/admin/uploads/{upload_id}", methods=["GET", "HEAD"])
+async def get_upload(upload_id: str, admin_user = Depends(get_admin_user)):
+    return upload_response(await get_upload_or_404(upload_id))
+
+@app.patch("/api/admin/uploads/{upload_id}")
+async def append_upload_chunk(upload_id: str, request: Request, admin_user = Depends(get_admin_user)):
+    try:
+        offset = int(request.headers["Upload-Offset"])
+        digest = uploads.parse_checksum(request.headers.get("Upload-Checksum"))
+    except KeyError:
+        raise HTTPException(status_code=400, detail="Upload-Offset header required")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if int(request.headers.get("content-length") or 0) > uploads.MAX_CHUNK_BYTES:
+        raise HTTPException(status_code=413, detail="Chunk too large")
+    upload = await get_upload_or_404(upload_id)
+    if upload["status"] in ("expired", "failed"):
+        raise HTTPException(status_code=410, detail=f"Upload {upload['status']}")
+
+    # Streamed: a chunked request has no Content-Length and stops here as soon as it is too large
+    sha256, parts, size = hashlib.sha256(), [], 0
+    async for part in request.stream():
+        size += len(part)
+        if size > uploads.MAX_CHUNK_BYTES:
+            raise HTTPException(status_code=413, detail="Chunk too large")
+        sha256.update(part)
+        parts.append(part)
+    if sha256.digest() != digest:
+        raise HTTPException(status_code=400, detail="Checksum mismatch")
+    data = b"".join(parts)
+    checksum = digest.hex()
+    end = offset + len(data)
+    if end == upload["offset"] and upload.get("last_chunk") == {"offset": offset, "checksum": checksum}:
+        # A retry of the chunk just stored (its response was lost)
+        return Response(status_code=204, headers={"Upload-Offset": str(upload["offset"])})
+    if upload["status"] != "uploading":
+        raise HTTPException(status_code=409, detail=f"Upload is {upload['status']}")
+    if offset != upload["offset"]:
+        raise offset_conflict("Offset mismatch", upload["offset"])
+    if end > upload["size"]:
+        raise HTTPException(status_code=400, detail="Chunk extends past the declared size")
+
+    if not await repos.uploads.lock(upload_id, offset, uploads.UPLOAD_LOCK_SECONDS):
+        raise offset_conflict("Another chunk is being written", upload["offset"])
+    try:
+        await asyncio.to_thread(uploads.write_chunk, uploads.part_path(upload_id), offset, data)
+    except BaseException:
+        await repos.uploads.unlock(upload_id)
+        raise
+    if not await repos.uploads.advance(upload_id, offset, end, checksum, uploads.UPLOAD_EXPIRY_SECONDS):
+        # The lock expired mid-write and another append or the GC moved on
+        current = await get_upload_or_404(upload_id)
+        raise offset_conflict("Offset mismatch", current["offset"])
+    return Response(status_code=204, headers={"Upload-Offset": str(end)})
+
+@app.post("/api/admin/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, admin_user = Depends(get_admin_user)):
+    upload = await get_upload_or_404(upload_id)
+    if upload["status"] == "complete":
+        sheet = await repos.sheets.get(upload["sheet_id"])
+        return {"message": "Fiche pédagogique créée avec succès", "sheet": sheet and sheet_response(sheet)}
+    if upload["status"] in ("expired", "failed"):
+        raise HTTPException(status_code=410, detail=f"Upload {upload['status']}")
+    if upload["offset"] < upload["size"]:
+        raise offset_conflict("Upload incomplete", upload["offset"])
+    upload = await repos.uploads.begin_finalize(upload_id, upload["size"], uploads.UPLOAD_LOCK_SECONDS)
+    if upload is None:
+        raise HTTPException(status_code=409, detail="Upload is being finalized")
+
+    extension = upload["filename"].split('.')[-1] if '.' in upload["filename"] else 'pdf'
+    new_filename = f"{upload_id}.{extension}"
+    destination = os.path.join(UPLOADS_DIR, new_filename)
+    part = uploads.part_path(upload_id)
+    # A finalize that died after the move resumes from the moved file
+    source = part if os.path.exists(part) else destination
+    content_hash = await asyncio.to_thread(uploads.file_sha256, source)
+    if upload["sha256"] and content_hash != upload["sha256"]:
+        await asyncio.to_thread(os.remove, source)
+        await repos.uploads.finish(upload_id, "failed", {"error": "checksum mismatch"})
+        raise HTTPException(status_code=400, detail="Checksum mismatch")
+    if source == part:
+        os.makedirs(UPLOADS_DIR, exist_ok=True)
+        await asyncio.to_thread(shutil.move, part, destination)
+
+    # The sheet takes the upload's id, so a resumed finalize finds its own record
+    sheet = await repos.sheets.get(upload_id)
+    if sheet is None:
+        sheet = await add_sheet(upload_id, upload["sheet"], new_filename, content_hash)
+        metrics.UPLOADS.inc("sheet")
+        metrics.UPLOAD_BYTES.inc("sheet", amount=upload["size"])
+    await repos.uploads.finish(upload_id, "complete", {"sheet_id": upload_id})
+    return {"message": "Fiche pédagogique créée avec succès", "sheet": sheet_response(sheet)}
 
 @app.put("/api/admin/pedagogical-sheets/{sheet_id}")
 async def update_pedagogical_sheet(
@@ -605,22 +1167,12 @@ async def update_pedagogical_sheet(
     sheet_data: PedagogicalSheetUpdate,
     admin_user = Depends(get_admin_user)
 ):
-    # Find existing sheet
-    existing_sheet = await db.pedagogical_sheets.find_one({"id": sheet_id})
-    if not existing_sheet:
-        raise HTTPException(status_code=404, detail="Fiche non trouvée")
-    
-    # Update only provided fields
+    # Update only provided fields and read the result back in the same operation
     update_data = {k: v for k, v in sheet_data.dict().items() if v is not None}
     
-    if update_data:
-        await db.pedagogical_sheets.update_one(
-            {"id": sheet_id},
-            {"$set": update_data}
-        )
-    
-    # Get updated sheet
-    updated_sheet = await db.pedagogical_sheets.find_one({"id": sheet_id}, {"_id": 0})
+    updated_sheet = await repos.sheets.update(sheet_id, update_data)
+    if not updated_sheet:
+        raise HTTPException(status_code=404, detail="Fiche non trouvée")
     
     return {"message": "Fiche mise à jour avec succès", "sheet": updated_sheet}
 
@@ -630,9 +1182,9 @@ async def delete_pedagogical_sheet(
     admin_user = Depends(get_admin_user)
 ):
     # Find and delete sheet
-    result = await db.pedagogical_sheets.delete_one({"id": sheet_id})
+    deleted = await repos.sheets.delete(sheet_id)
     
-    if result.deleted_count == 0:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Fiche non trouvée")
     
     return {"message": "Fiche supprimée avec succès"}
@@ -646,36 +1198,199 @@ async def admin_reset_user_password(
     """Admin endpoint to directly reset a user's password"""
     
     # Find user
-    user = await db.users.find_one({"email": email})
+    user = await repos.users.get_by_email(email)
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     
     # Hash new password
-    hashed_password = hash_password(new_password)
+    hashed_password = await hash_admission.run(hash_password, new_password)
     
     # Update password
-    await db.users.update_one(
-        {"email": email},
-        {"$set": {"password": hashed_password}}
-    )
+    await repos.users.update_by_email(email, {"password": hashed_password})
     
     return {
         "message": f"Mot de passe réinitialisé avec succès pour {email}",
         "new_password": new_password  # Only for admin convenience - remove in production
     }
 
+@app.get("/api/admin/users")
+async def admin_list_users(
+    email: Optional[str] = None,
+    name: Optional[str] = None,
+    user_type: Optional[str] = None,
+    is_premium: Optional[bool] = None,
+    is_verified: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    admin_user = Depends(get_admin_user),
+):
+    """Newest users first, or search by email prefix or name prefix; pass next_cursor for the next page"""
+    if email and name:
+        raise HTTPException(status_code=400, detail="Recherche par email ou par nom, pas les deux")
+    if user_type is not None and user_type not in USER_TYPES:
+        raise HTTPException(status_code=400, detail="user_type inconnu")
+    if not 1 <= limit <= 200:
+        raise HTTPException(status_code=400, detail="limit doit être entre 1 et 200")
+    try:
+        users, next_cursor = await repos.users.search(
+            user_type, is_premium, is_verified, email, name, cursor, limit
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"users": users, "next_cursor": next_cursor}
+
+@app.post("/api/admin/users/import")
+async def admin_import_users(file: UploadFile = File(...), admin_user = Depends(get_admin_user)):
+    """Import users from a CSV upload (see user_import.py for the format)"""
+    lines = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        report = await user_import.import_users(
+            repos.users, lines, passwords.context_rounds(password_context), get_import_pool(),
+            workers=IMPORT_HASH_WORKERS,
+        )
+    except ValueError as exc:
+        # Bad header or undecodable text; batches already written stay imported
+        raise HTTPException(status_code=400, detail=str(exc))
+    return asdict(report)
+
+# Teacher verification review queue: each reviewer holds one claimed record
+# at a time under a lease; abandoned claims return to the queue on expiry
+REVIEW_LEASE_SECONDS = float(os.getenv("REVIEW_LEASE_SECONDS", "900"))
+
+@app.get("/api/admin/verifications")
+async def get_verification_counts(admin_user = Depends(get_admin_user)):
+    return await repos.verifications.counts()
+
+@app.post("/api/admin/verifications/claim")
+async def claim_verification(admin_user = Depends(get_admin_user)):
+    verification = await repos.verifications.claim(admin_user["id"], REVIEW_LEASE_SECONDS)
+    if verification is None:
+        return {"verification": None, "teacher": None}
+    teacher = await repos.users.get_by_id(verification["user_id"]) or {}
+    return {
+        "verification": verification,
+        "teacher": {key: value for key, value in teacher.items() if key in USER_SUMMARY},
+    }
+
+@app.get("/api/admin/verifications/{verification_id}/document")
+async def get_verification_document(verification_id: str, original: bool = False,
+                                    admin_user = Depends(get_admin_user)):
+    verification = await repos.verifications.get(verification_id)
+    if verification is None:
+        raise HTTPException(status_code=404, detail="Document introuvable")
+    # The review copy by default; the untouched upload from cold storage on
+    # request (uploads that were not downscaled are their own original)
+    path = verification["document_url"]
+    if original:
+        path = verification.get("original_url", path)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Document introuvable")
+    # Streamed from disk in chunks rather than read into memory
+    return FileResponse(path, filename=os.path.basename(path))
+
+async def decide_verification(verification_id: str, reviewer: dict, status: str, note: Optional[str]):
+    verification = await repos.verifications.decide(verification_id, reviewer["id"], status, note)
+    if verification is None:
+        raise HTTPException(status_code=409, detail="Vérification non réservée par cet administrateur")
+    # Idempotent, so retrying the decision repairs a failure between the two writes
+    await repos.users.update_by_id(verification["user_id"], {"is_verified": status == "approved"})
+    return {"verification": verification}
+
+@app.post("/api/admin/verifications/{verification_id}/approve")
+async def approve_verification(verification_id: str, note: Optional[str] = Form(None),
+                               admin_user = Depends(get_admin_user)):
+    return await decide_verification(verification_id, admin_user, "approved", note)
+
+@app.post("/api/admin/verifications/{verification_id}/reject")
+async def reject_verification(verification_id: str, note: Optional[str] = Form(None),
+                              admin_user = Depends(get_admin_user)):
+    return await decide_verification(verification_id, admin_user, "rejected", note)
+
+@app.post("/api/admin/verifications/{verification_id}/release")
+async def release_verification(verification_id: str, admin_user = Depends(get_admin_user)):
+    if not await repos.verifications.release(verification_id, admin_user["id"]):
+        raise HTTPException(status_code=409, detail="Vérification non réservée par cet administrateur")
+    return {"message": "Vérification remise dans la file"}
+
+@app.get("/api/admin/loop-stalls")
+async def get_loop_stalls(admin_user = Depends(get_admin_user)):
+    return loop_monitor.report()
+
+@app.get("/api/admin/slow-queries")
+async def get_slow_queries(admin_user = Depends(get_admin_user)):
+    return slow_query_recorder.report()
+
+def profile_response(stacks, format: str, title: str):
+    if format == "collapsed":
+        return PlainTextResponse(format_collapsed(stacks))
+    if format == "html":
+        return HTMLResponse(flamegraph_html(stacks, title))
+    raise HTTPException(status_code=400, detail="Format inconnu (collapsed ou html)")
+
+@app.get("/api/admin/jobs")
+async def get_job_counts(admin_user = Depends(get_admin_user)):
+    return await repos.jobs.counts()
+
+@app.get("/api/admin/storage")
+async def get_storage_report(admin_user = Depends(get_admin_user)):
+    report = await repos.storage_reports.latest()
+    if report is None:
+        raise HTTPException(status_code=404, detail="No reconciliation has run yet")
+    return report
+
+@app.get("/api/admin/outbox")
+async def get_outbox_counts(admin_user = Depends(get_admin_user)):
+    return await repos.outbox.counts()
+
+@app.post("/api/admin/jobs/{job_id}/requeue")
+async def requeue_dead_job(job_id: str, admin_user = Depends(get_admin_user)):
+    if not await repos.jobs.requeue_dead(job_id):
+        raise HTTPException(status_code=404, detail="Job not found in dead letters")
+    return {"message": "Job requeued"}
+
+@app.post("/api/admin/profiler/start")
+async def start_profiler(interval_ms: float = 10.0, admin_user = Depends(get_admin_user)):
+    if not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="interval_ms doit être entre 1 et 1000")
+    profiler.start(interval_ms / 1000)
+    return {"message": "Profilage démarré", "status": profiler.status()}
+
+@app.post("/api/admin/profiler/stop")
+async def stop_profiler(admin_user = Depends(get_admin_user)):
+    profiler.stop()
+    return {"message": "Profilage arrêté", "status": profiler.status()}
+
+@app.get("/api/admin/profiler/status")
+async def get_profiler_status(admin_user = Depends(get_admin_user)):
+    return profiler.status()
+
+@app.get("/api/admin/profiler/profile")
+async def get_profile_output(format: str = "html", admin_user = Depends(get_admin_user)):
+    return profile_response(profiler.snapshot(), format, "Profil continu")
+
+@app.get("/api/admin/profiler/requests/{profile_id}")
+async def get_request_profile(profile_id: str, format: str = "html", admin_user = Depends(get_admin_user)):
+    profile = profiler.request_profiles.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profil non trouvé")
+    if format == "json":
+        return profile.summary(profiler.interval)
+    return profile_response(
+        profiler.request_stacks(profile), format, f"{profile.method} {profile.path}"
+    )
+
 @app.get("/api/admin/stats")
 async def get_admin_stats(admin_user = Depends(get_admin_user)):
     # Get statistics for admin dashboard
-    total_users = await db.users.count_documents({})
-    total_parents = await db.users.count_documents({"user_type": "parent"})
-    total_teachers = await db.users.count_documents({"user_type": "teacher"})
-    premium_users = await db.users.count_documents({"is_premium": True})
-    verified_teachers = await db.users.count_documents({"user_type": "teacher", "is_verified": True})
-    
-    total_sheets = await db.pedagogical_sheets.count_documents({})
-    premium_sheets = await db.pedagogical_sheets.count_documents({"is_premium": True})
-    teacher_sheets = await db.pedagogical_sheets.count_documents({"is_teacher_only": True})
+    total_users = await repos.users.count()
+    total_parents = await repos.users.count({"user_type": "parent"})
+    total_teachers = await repos.users.count({"user_type": "teacher"})
+    premium_users = await repos.users.count({"is_premium": True})
+    verified_teachers = await repos.users.count({"user_type": "teacher", "is_verified": True})
+    
+    total_sheets = await repos.sheets.count()
+    premium_sheets = await repos.sheets.count({"is_premium": True})
+    teacher_sheets = await repos.sheets.count({"is_teacher_only": True})
     
     return {
         "users": {
@@ -0,0 +1,236 @@
+"""Slow MongoDB command capture with automatic explain plans.
+
+A PyMongo command listener records every command slower than SLOW_QUERY_MS
+with its collection, caller route and filter shape (the filter with values
+replaced by their types). The first time a shape is seen, the command is
+explained on a background thread and plans containing a COLLSCAN stage are
+flagged, so unindexed query shapes surface under real traffic.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from pymongo import MongoClient, monitoring
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+MAX_RECENT_SLOW_QUERIES = 200
+
+SLOW_QUERIES = metrics.Counter(
+    "mongo_slow_commands_total",
+    "MongoDB commands slower than SLOW_QUERY_MS, by collection and command.",
+    ("collection", "command"),
+)
+COLLSCAN_SHAPES = metrics.Gauge(
+    "mongo_collscan_shapes",
+    "Distinct slow query shapes whose explain plan uses a collection scan.",
+)
+
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Session, transaction and write-concern fields are rejected inside explain
+_UNEXPLAINABLE_FIELDS = {
+    "lsid", "$db", "$clusterTime", "txnNumber", "autocommit", "startTransaction",
+    "$readPreference", "writeConcern", "readConcern", "apiVersion", "apiStrict",
+    "apiDeprecationErrors",
+}
+
+
+def command_filter(command_name: str, command) -> dict:
+    """Return the query filter carried by a command, or an empty dict."""
+    if command_name in ("find", "findAndModify"):
+        return command.get("filter" if command_name == "find" else "query") or {}
+    if command_name in ("count", "distinct"):
+        return command.get("query") or {}
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline") or []
+        if pipeline and "$match" in pipeline[0]:
+            return pipeline[0]["$match"]
+        return {}
+    if command_name == "update":
+        updates = command.get("updates") or []
+        return updates[0].get("q", {}) if updates else {}
+    if command_name == "delete":
+        deletes = command.get("deletes") or []
+        return deletes[0].get("q", {}) if deletes else {}
+    return {}
+
+
+def query_shape(value):
+    """Replace the values of a filter by their type names, keeping operators."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return type(value).__name__
+
+
+def plan_stages(plan) -> list:
+    """Flatten a winning plan into its stage names, outermost first."""
+    stages = []
+    pending = [plan]
+    while pending:
+        node = pending.pop(0)
+        if not isinstance(node, dict):
+            continue
+        if "stage" in node:
+            stages.append(node["stage"])
+        if "queryPlan" in node:
+            pending.append(node["queryPlan"])
+        if "inputStage" in node:
+            pending.append(node["inputStage"])
+        pending.extend(node.get("inputStages", []))
+    return stages
+
+
+def winning_plan(explain: dict) -> dict:
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        # Aggregations report the planner inside their first stage
+        for stage in explain.get("stages", []):
+            if "$cursor" in stage:
+                planner = stage["$cursor"].get("queryPlanner")
+                break
+    return (planner or {}).get("winningPlan", {})
+
+
+class SlowQueryRecorder(monitoring.CommandListener):
+    def __init__(self, mongo_url: str, threshold_ms: float = SLOW_QUERY_MS, explain: bool = SLOW_QUERY_EXPLAIN):
+        self.mongo_url = mongo_url
+        self.threshold = threshold_ms / 1000
+        self.explain_enabled = explain
+        self.recent = deque(maxlen=MAX_RECENT_SLOW_QUERIES)
+        # (database, collection, command, shape) -> aggregated record
+        self.shapes = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._explain_queue = queue.Queue()
+        self._explain_thread = None
+        self._explain_client = None
+
+    # Listener
+    def started(self, event):
+        self._pending[(event.connection_id, event.request_id)] = (event.command, metrics.current_route())
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        seconds = event.duration_micros / 1e6
+        if pending is None or seconds < self.threshold:
+            return
+        command, route = pending
+        command_name = event.command_name
+        collection = command.get(command_name)
+        if command_name == "getMore":
+            collection = command.get("collection")
+        collection = collection if isinstance(collection, str) else ""
+        shape = json.dumps(query_shape(command_filter(command_name, command)), sort_keys=True)
+
+        SLOW_QUERIES.inc(collection, command_name)
+        entry = {
+            "at": time.time(),
+            "database": event.database_name,
+            "collection": collection,
+            "command": command_name,
+            "shape": shape,
+            "route": route,
+            "duration_ms": round(seconds * 1000, 2),
+            "failed": failed,
+        }
+        key = (event.database_name, collection, command_name, shape)
+        with self._lock:
+            self.recent.append(entry)
+            record = self.shapes.get(key)
+            first_seen = record is None
+            if first_seen:
+                record = self.shapes[key] = {
+                    "database": event.database_name,
+                    "collection": collection,
+                    "command": command_name,
+                    "shape": shape,
+                    "routes": [],
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "plan": None,
+                    "collscan": None,
+                }
+            record["count"] += 1
+            record["total_ms"] = round(record["total_ms"] + entry["duration_ms"], 2)
+            record["max_ms"] = max(record["max_ms"], entry["duration_ms"])
+            if route not in record["routes"]:
+                record["routes"].append(route)
+
+        logger.warning(
+            "Slow Mongo %s on %s (%.1f ms) from %s, shape %s",
+            command_name, collection, entry["duration_ms"], route, shape,
+        )
+        if first_seen and self.explain_enabled and command_name in EXPLAINABLE_COMMANDS:
+            self._schedule_explain(key, event.database_name, command)
+
+    # Explain
+    def _schedule_explain(self, key, database: str, command):
+        explainable = {name: value for name, value in command.items() if name not in _UNEXPLAINABLE_FIELDS}
+        self._explain_queue.put((key, database, explainable))
+        # Under the lock, so two first-seen shapes cannot both start a worker
+        with self._lock:
+            if self._explain_thread is None:
+                self._explain_thread = threading.Thread(
+                    target=self._explain_worker, name="slow-query-explain", daemon=True
+                )
+                self._explain_thread.start()
+
+    def _explain_worker(self):
+        while True:
+            key, database, command = self._explain_queue.get()
+            try:
+                if self._explain_client is None:
+                    # Separate client without listeners so explains are not recorded
+                    self._explain_client = MongoClient(self.mongo_url)
+                result = self._explain_client[database].command(
+                    {"explain": command, "verbosity": "queryPlanner"}
+                )
+                stages = plan_stages(winning_plan(result))
+                collscan = "COLLSCAN" in stages
+                with self._lock:
+                    record = self.shapes[key]
+                    record["plan"] = stages
+                    record["collscan"] = collscan
+                    COLLSCAN_SHAPES.set(sum(1 for r in self.shapes.values() if r["collscan"]))
+                    routes = ", ".join(record["routes"])
+                if collscan:
+                    logger.warning(
+                        "COLLSCAN plan for %s on %s.%s, shape %s (routes: %s)",
+                        key[2], database, key[1], key[3], routes,
+                    )
+            except Exception as exc:
+                logger.warning("Could not explain slow %s on %s: %s", key[2], key[1], exc)
+
+    def report(self) -> dict:
+        with self._lock:
+            # Copied under the lock: the listener appends routes as queries arrive
+            shapes = [dict(record, routes=list(record["routes"]))
+                      for record in sorted(self.shapes.values(), key=lambda r: -r["total_ms"])]
+            recent = list(self.recent)
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "shapes": shapes,
+            "recent": recent[-50:],
+        }
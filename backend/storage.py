@@ -0,0 +1,230 @@
+"""Storage reconciliation: files on disk against the records that refer to them.
+
+Files outlive their records: a deleted sheet leaves its upload behind,
+rejected verification documents are never read again, and download
+placeholders stay after their sheet is gone. The reconcile_storage job
+(every RECONCILE_INTERVAL_SECONDS) walks each storage Area and each set
+of References:
+
+- Orphans. The directory is read as a stream (os.scandir), RECONCILE_BATCH
+  entries at a time. Each batch's names are looked up with one indexed
+  `$in` query, and the unreferenced files are quarantined (or deleted,
+  RECONCILE_ACTION=delete). Memory stays bounded by the batch, never by
+  the directory or the collection. Files changed within
+  RECONCILE_GRACE_SECONDS are skipped, since a file is written before
+  the record that refers to it. ctime is part of that age, so a file
+  just renamed into place counts as new.
+- Missing files. Referencing records are streamed from a cursor and their
+  paths checked in batches; those pointing at nothing are counted and
+  reported (storage_missing_files, the job's report and the log).
+
+Quarantined files move to QUARANTINE_DIR/<area>/ and are purged after
+QUARANTINE_RETENTION_SECONDS, so a wrong call can be undone meanwhile.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("RECONCILE_INTERVAL_SECONDS", str(24 * 3600)))
+RECONCILE_GRACE_SECONDS = float(os.getenv("RECONCILE_GRACE_SECONDS", str(24 * 3600)))
+RECONCILE_ACTION = os.getenv("RECONCILE_ACTION", "quarantine")  # or "delete"
+RECONCILE_BATCH = int(os.getenv("RECONCILE_BATCH", "1000"))
+# Job lease: a pass over large directories outlasts the default job lease
+RECONCILE_LEASE_SECONDS = float(os.getenv("RECONCILE_LEASE_SECONDS", "3600"))
+QUARANTINE_DIR = os.getenv("QUARANTINE_DIR", "/tmp/quarantine")
+QUARANTINE_RETENTION_SECONDS = float(os.getenv("QUARANTINE_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# Missing references listed in a report; the rest are only counted
+MAX_REPORTED_MISSING = 100
+
+ORPHANED_FILES = metrics.Counter(
+    "storage_orphaned_files_total",
+    "Unreferenced files removed from storage, by area and action (quarantine, delete).",
+    ("area", "action"),
+)
+ORPHANED_BYTES = metrics.Counter(
+    "storage_orphaned_bytes_total",
+    "Bytes of unreferenced files removed from storage, by area.",
+    ("area",),
+)
+MISSING_FILES = metrics.Gauge(
+    "storage_missing_files",
+    "Records referring to a file that does not exist, at the last reconciliation.",
+    ("references",),
+)
+
+
+@dataclass
+class Area:
+    """A directory and the lookup returning which of its file names are referenced."""
+    name: str
+    directory: str
+    referenced: Callable[[List[str]], Awaitable[Set[str]]]
+
+
+@dataclass
+class References:
+    """Records pointing at files: (record id, candidate paths), any of which may hold it."""
+    name: str
+    records: Callable[[], AsyncIterator[Tuple[str, Tuple[str, ...]]]]
+
+
+@dataclass
+class AreaReport:
+    scanned: int = 0
+    orphaned: int = 0
+    orphaned_bytes: int = 0
+
+
+@dataclass
+class MissingReport:
+    checked: int = 0
+    missing: int = 0
+    examples: List[dict] = field(default_factory=list)
+
+
+@dataclass
+class ReconcileReport:
+    action: str
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    areas: Dict[str, AreaReport] = field(default_factory=dict)
+    quarantine_purged: int = 0
+    missing: Dict[str, MissingReport] = field(default_factory=dict)
+
+
+def _scan(entries, limit: int, cutoff: float) -> tuple:
+    """(entries read, [(name, size)] of files unchanged since cutoff) from the next `limit` entries."""
+    count, old = 0, []
+    for entry in itertools.islice(entries, limit):
+        count += 1
+        try:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue  # removed while we were listing
+        if max(stat.st_mtime, stat.st_ctime) < cutoff:
+            old.append((entry.name, stat.st_size))
+    return count, old
+
+
+async def _old_files(directory: str, cutoff: float, batch_size: int):
+    """Batches of (entries read, old files) over a directory, read as a stream."""
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    with entries:
+        while True:
+            count, old = await asyncio.to_thread(_scan, entries, batch_size, cutoff)
+            yield count, old
+            if count < batch_size:
+                return
+
+
+def _dispose(area: str, directory: str, names: List[str], action: str):
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if action == "delete":
+                os.remove(path)
+            else:
+                destination = os.path.join(QUARANTINE_DIR, area)
+                os.makedirs(destination, exist_ok=True)
+                shutil.move(path, os.path.join(destination, name))
+        except FileNotFoundError:
+            pass
+
+
+async def reconcile_area(area: Area, now: float, grace: float = RECONCILE_GRACE_SECONDS,
+                         action: str = RECONCILE_ACTION, batch_size: int = RECONCILE_BATCH) -> AreaReport:
+    """Quarantine or delete the files of `area` that no record refers to."""
+    report = AreaReport()
+    async for count, old in _old_files(area.directory, now - grace, batch_size):
+        report.scanned += count
+        if not old:
+            continue
+        referenced = await area.referenced([name for name, _ in old])
+        orphans = [(name, size) for name, size in old if name not in referenced]
+        if not orphans:
+            continue
+        await asyncio.to_thread(_dispose, area.name, area.directory, [name for name, _ in orphans], action)
+        size = sum(size for _, size in orphans)
+        report.orphaned += len(orphans)
+        report.orphaned_bytes += size
+        ORPHANED_FILES.inc(area.name, action, amount=len(orphans))
+        ORPHANED_BYTES.inc(area.name, amount=size)
+    return report
+
+
+async def purge_quarantine(now: float, retention: float = QUARANTINE_RETENTION_SECONDS,
+                           batch_size: int = RECONCILE_BATCH) -> int:
+    """Delete quarantined files older than the retention; returns how many."""
+    try:
+        areas = [entry.name for entry in os.scandir(QUARANTINE_DIR) if entry.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return 0
+    purged = 0
+    for area in areas:
+        directory = os.path.join(QUARANTINE_DIR, area)
+        async for _, old in _old_files(directory, now - retention, batch_size):
+            await asyncio.to_thread(_dispose, area, directory, [name for name, _ in old], "delete")
+            purged += len(old)
+    return purged
+
+
+def _missing(batch: list) -> list:
+    return [(record_id, paths[0]) for record_id, paths in batch
+            if not any(os.path.exists(path) for path in paths)]
+
+
+async def find_missing(references: References, batch_size: int = RECONCILE_BATCH) -> MissingReport:
+    """Count (and list a sample of) records whose file exists at none of its paths."""
+    report = MissingReport()
+
+    async def check(batch):
+        for record_id, path in await asyncio.to_thread(_missing, batch):
+            report.missing += 1
+            if len(report.examples) < MAX_REPORTED_MISSING:
+                report.examples.append({"id": record_id, "path": path})
+
+    batch = []
+    async for record in references.records():
+        report.checked += 1
+        batch.append(record)
+        if len(batch) >= batch_size:
+            await check(batch)
+            batch = []
+    if batch:
+        await check(batch)
+    MISSING_FILES.set(report.missing, references.name)
+    return report
+
+
+async def reconcile(areas: List[Area], references: List[References], action: str = RECONCILE_ACTION,
+                    grace: float = RECONCILE_GRACE_SECONDS, batch_size: int = RECONCILE_BATCH) -> ReconcileReport:
+    """One pass: orphans in every area, the quarantine, then missing files."""
+    if action not in ("quarantine", "delete"):
+        raise ValueError(f"RECONCILE_ACTION must be quarantine or delete, not {action!r}")
+    report = ReconcileReport(action=action, started_at=datetime.utcnow())
+    now = time.time()
+    for area in areas:
+        report.areas[area.name] = await reconcile_area(area, now, grace, action, batch_size)
+    report.quarantine_purged = await purge_quarantine(now, batch_size=batch_size)
+    for reference in references:
+        missing = report.missing[reference.name] = await find_missing(reference, batch_size)
+        if missing.missing:
+            logger.warning("%d %s refer to missing files, e.g. %s",
+                           missing.missing, reference.name, missing.examples[:5])
+    report.finished_at = datetime.utcnow()
+    return report
@@ -0,0 +1,28 @@
+"""JWTs: session tokens and password reset links."""
+import os
+from datetime import datetime, timedelta
+
+import jwt
+
+JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
+JWT_ALGORITHM = "HS256"
+JWT_EXPIRATION_HOURS = 24 * 7  # 7 days
+
+
+def create_jwt_token(user_data: dict) -> str:
+    payload = {
+        "user_id": user_data["id"],
+        "email": user_data["email"],
+        "user_type": user_data["user_type"],
+        "exp": datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+
+def create_reset_token(email: str) -> str:
+    payload = {
+        "email": email,
+        "type": "password_reset",
+        "exp": datetime.utcnow() + timedelta(hours=1)  # 1 hour expiration
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
@@ -0,0 +1,97 @@
+"""Resumable uploads for large sheet files (a tus-style protocol).
+
+    POST  /api/admin/uploads                 sheet metadata, filename, size, optional sha256
+    HEAD  /api/admin/uploads/{id}            Upload-Offset: bytes stored so far
+    PATCH /api/admin/uploads/{id}            one chunk: Upload-Offset, Upload-Checksum: sha256 <base64>
+    POST  /api/admin/uploads/{id}/finalize   assembles the file and creates the sheet
+
+Chunks are appended to a part file under UPLOAD_PARTS_DIR. A chunk is
+accepted only at the current offset and only if it matches its checksum;
+the new offset and the checksum of that last chunk are then recorded in
+the `uploads` document, which stays the same size however many chunks
+arrive. After a dropped connection the client asks for the offset and
+resumes from there. Resending the last stored chunk (its response was
+lost) is acknowledged again rather than rejected, so chunk retries are
+idempotent. Finalize is idempotent as well.
+
+Uploads not touched for UPLOAD_EXPIRY_SECONDS are expired by a periodic
+garbage collection that deletes their part files.
+"""
+import base64
+import binascii
+import hashlib
+import os
+from datetime import datetime
+
+UPLOAD_PARTS_DIR = os.getenv("UPLOAD_PARTS_DIR", "/tmp/upload_parts")
+MAX_CHUNK_BYTES = int(os.getenv("UPLOAD_MAX_CHUNK_BYTES", str(16 * 1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(4 * 1024 ** 3)))
+UPLOAD_EXPIRY_SECONDS = float(os.getenv("UPLOAD_EXPIRY_SECONDS", str(24 * 3600)))
+UPLOAD_GC_INTERVAL_SECONDS = float(os.getenv("UPLOAD_GC_INTERVAL_SECONDS", "3600"))
+# How long one append or finalize may hold an upload before another may take over
+UPLOAD_LOCK_SECONDS = 120
+
+
+class ChecksumError(ValueError):
+    pass
+
+
+def parse_checksum(header: str) -> bytes:
+    """Digest from an `Upload-Checksum: sha256 <base64 digest>` header."""
+    algorithm, _, value = (header or "").partition(" ")
+    if algorithm != "sha256":
+        raise ChecksumError("Upload-Checksum must be 'sha256 <base64 digest>'")
+    try:
+        digest = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise ChecksumError("Upload-Checksum is not valid base64")
+    if len(digest) != hashlib.sha256().digest_size:
+        raise ChecksumError("Upload-Checksum is not a SHA-256 digest")
+    return digest
+
+
+def part_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_PARTS_DIR, f"{upload_id}.part")
+
+
+def create_part(upload_id: str):
+    os.makedirs(UPLOAD_PARTS_DIR, exist_ok=True)
+    open(part_path(upload_id), "wb").close()
+
+
+def write_chunk(path: str, offset: int, data: bytes):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+        # Drop any tail left by an earlier attempt that failed its checksum
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def remove_part(upload_id: str):
+    try:
+        os.remove(part_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+
+async def collect_garbage(repository, now: datetime = None, batch_size: int = 500) -> int:
+    """Expire abandoned uploads and delete their part files; returns how many."""
+    count = 0
+    while True:
+        expired = await repository.expired(now or datetime.utcnow(), batch_size)
+        for upload in expired:
+            remove_part(upload["id"])
+            await repository.mark_expired(upload["id"])
+        count += len(expired)
+        if len(expired) < batch_size:
+            return count
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Bulk user import from a CSV file, for onboarding a whole school at once.
+
+    python user_import.py ecole.csv --workers 8 --report report.json
+
+The CSV needs the columns email, first_name, last_name, user_type ("parent"
+or "teacher") and password. Rows are read as a stream and validated in a
+thread, off the event loop, and the valid ones are grouped in batches of
+--batch-size. Each batch is hashed across a process pool (bcrypt at the
+server's current cost) and written with one unordered insert_many. The
+next batch hashes while the previous one is written. The unique email index rejects already-registered
+accounts, and each rejection is reported against its CSV line alongside
+the validation errors.
+
+The same import is served by POST /api/admin/users/import; very large files
+are better run through this CLI than through one HTTP request.
+"""
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+import typer
+from passlib.hash import bcrypt
+from pydantic.networks import validate_email
+
+from repositories import USER_TYPES, UserRepository, name_key
+
+REQUIRED_COLUMNS = ("email", "first_name", "last_name", "user_type", "password")
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_HASH_WORKERS = int(os.getenv("IMPORT_HASH_WORKERS", str(os.cpu_count() or 2)))
+# Row errors kept in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 10_000
+
+cli = typer.Typer(help="Import users from a CSV file.")
+
+
+@dataclass
+class RowError:
+    line: int
+    email: str
+    error: str
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    imported: int = 0
+    failed: int = 0
+    errors: List[RowError] = field(default_factory=list)
+
+    def add_error(self, line: int, email: str, error: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(line, email, error))
+
+
+def hash_process_pool(workers: int = IMPORT_HASH_WORKERS) -> ProcessPoolExecutor:
+    # spawn, not fork: the parent runs an event loop and driver threads
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def hash_passwords(passwords: List[str], rounds: int) -> List[str]:
+    # Runs in a pool process
+    handler = bcrypt.using(rounds=rounds)
+    return [handler.hash(password) for password in passwords]
+
+
+def validate_row(row: dict) -> tuple:
+    """(fields, None) for a valid row, (None, error) otherwise."""
+    values = {column: (row.get(column) or "").strip() for column in REQUIRED_COLUMNS}
+    empty = [column for column in REQUIRED_COLUMNS if not values[column]]
+    if empty:
+        return None, f"missing {', '.join(empty)}"
+    try:
+        _, values["email"] = validate_email(values["email"])
+    except ValueError:
+        return None, "invalid email"
+    if values["user_type"] not in USER_TYPES:
+        return None, f"user_type must be one of {', '.join(USER_TYPES)}"
+    return values, None
+
+
+def build_user(values: dict, hashed_password: str, now: datetime) -> dict:
+    # Same document as /api/auth/register; imports never grant admin rights
+    return {
+        "id": str(uuid.uuid4()),
+        "email": values["email"],
+        "password": hashed_password,
+        "first_name": values["first_name"],
+        "last_name": values["last_name"],
+        "name_key": name_key(values["first_name"], values["last_name"]),
+        "user_type": values["user_type"],
+        "is_premium": False,
+        "is_verified": values["user_type"] != "teacher",  # Teachers need verification
+        "is_admin": False,
+        "created_at": now,
+    }
+
+
+async def _hash_batch(batch: list, rounds: int, pool: Executor, workers: int) -> List[str]:
+    loop = asyncio.get_running_loop()
+    passwords = [values["password"] for _, values in batch]
+    size = -(-len(passwords) // max(workers, 1))
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(pool, hash_passwords, passwords[i:i + size], rounds)
+        for i in range(0, len(passwords), size)
+    ))
+    return [hashed for chunk in chunks for hashed in chunk]
+
+
+async def _write_batch(repository, batch: list, users: list, report: ImportReport):
+    duplicates = set(await repository.insert_many(users))
+    report.imported += len(users) - len(duplicates)
+    for index in sorted(duplicates):
+        line, values = batch[index]
+        report.add_error(line, values["email"], "email already registered")
+
+
+def _read_batch(reader: csv.DictReader, seen: set, batch_size: int) -> tuple:
+    """(rows read, next `batch_size` valid rows, rejected rows) from the CSV.
+
+    Runs in a thread: decoding, parsing and validating a large file would
+    otherwise hold the event loop between batches.
+    """
+    rows, batch, errors = 0, [], []
+    for row in reader:
+        rows += 1
+        values, error = validate_row(row)
+        if error is None and values["email"].lower() in seen:
+            error = "duplicate email in file"
+        if error is not None:
+            errors.append((reader.line_num, (row.get("email") or "").strip(), error))
+            continue
+        seen.add(values["email"].lower())
+        batch.append((reader.line_num, values))
+        if len(batch) >= batch_size:
+            break
+    return rows, batch, errors
+
+
+async def import_users(repository, lines: Iterable[str], rounds: int, pool: Executor,
+                       batch_size: int = IMPORT_BATCH_SIZE, workers: int = IMPORT_HASH_WORKERS) -> ImportReport:
+    """Import CSV `lines` into a UserRepository; raises ValueError on a bad header."""
+    reader = csv.DictReader(lines)
+    fieldnames = await asyncio.to_thread(getattr, reader, "fieldnames")
+    missing = [column for column in REQUIRED_COLUMNS if column not in (fieldnames or ())]
+    if missing:
+        raise ValueError(f"missing CSV columns: {', '.join(missing)}")
+
+    report = ImportReport()
+    seen = set()
+    writing: Optional[asyncio.Task] = None
+
+    async def flush(batch):
+        nonlocal writing
+        now = datetime.utcnow()
+        hashed = await _hash_batch(batch, rounds, pool, workers)
+        users = [build_user(values, password, now) for (_, values), password in zip(batch, hashed)]
+        if writing is not None:
+            await writing
+        writing = asyncio.create_task(_write_batch(repository, batch, users, report))
+
+    try:
+        while True:
+            rows, batch, errors = await asyncio.to_thread(_read_batch, reader, seen, batch_size)
+            report.rows += rows
+            for line, email, error in errors:
+                report.add_error(line, email, error)
+            if batch:
+                await flush(batch)
+            if len(batch) < batch_size:
+                break
+        if writing is not None:
+            await writing
+    finally:
+        # Reading failed (e.g. undecodable text): stop the pending write too
+        if writing is not None and not writing.done():
+            writing.cancel()
+            await asyncio.gather(writing, return_exceptions=True)
+    return report
+
+
+async def _run(path: str, options: dict) -> ImportReport:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    import passwords
+
+    client = AsyncIOMotorClient(options["mongo_url"])
+    rounds = int(os.getenv("BCRYPT_ROUNDS") or passwords.calibrate())
+    typer.echo(f"Hashing at bcrypt cost {rounds} on {options['workers']} processes")
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as f, hash_process_pool(options["workers"]) as pool:
+            return await import_users(
+                UserRepository(client[options["db_name"]].users), f, rounds, pool,
+                options["batch_size"], options["workers"],
+            )
+    finally:
+        client.close()
+
+
+@cli.command()
+def main(
+    path: str = typer.Argument(..., help="CSV file to import."),
+    batch_size: int = typer.Option(IMPORT_BATCH_SIZE, help="Accounts per insert_many."),
+    workers: int = typer.Option(IMPORT_HASH_WORKERS, help="Hashing processes."),
+    report_path: Optional[str] = typer.Option(None, "--report", help="Write the full report as JSON."),
+    mongo_url: str = typer.Option(os.getenv("MONGO_URL", "mongodb://localhost:27017")),
+    db_name: str = typer.Option(os.getenv("MONGO_DB_NAME", "ecole_des_genies")),
+):
+    """Import users from a CSV file and report rejected rows."""
+    options = dict(locals())
+    start = time.perf_counter()
+    try:
+        report = asyncio.run(_run(path, options))
+    except ValueError as exc:
+        typer.echo(str(exc), err=True)
+        raise typer.Exit(code=1)
+    typer.echo(f"{report.imported:,} of {report.rows:,} rows imported in {time.perf_counter() - start:.1f}s")
+    for error in report.errors[:20]:
+        typer.echo(f"  line {error.line}: {error.email or '-'}: {error.error}")
+    if report.failed > 20:
+        typer.echo(f"  ... {report.failed - 20:,} more")
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(asdict(report), f, indent=2)
+
+
+if __name__ == "__main__":
+    cli()
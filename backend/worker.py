@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Standalone background job worker.
+
+    python worker.py --concurrency 8
+
+Runs the same JobWorkerPool and email OutboxDispatcher as the API workers
+(see jobs.py and outbox.py) without serving HTTP, for deployments that set
+JOB_WORKERS=0 / OUTBOX_ENABLED=false on the API and scale background work
+separately. SIGTERM lets in-flight jobs finish.
+"""
+import asyncio
+import logging
+import signal
+
+import typer
+
+from jobs import JOB_LEASE_SECONDS, JobWorkerPool
+from outbox import OutboxDispatcher, build_transport
+
+logger = logging.getLogger("worker")
+
+cli = typer.Typer(help="Run background job workers.")
+
+
+@cli.command()
+def main(
+    concurrency: int = typer.Option(8, help="Jobs run concurrently by this process."),
+    emails: bool = typer.Option(True, help="Also deliver the email outbox."),
+    log_level: str = typer.Option("info"),
+):
+    """Run a standalone job worker against the configured database."""
+    logging.basicConfig(level=log_level.upper(), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    # Importing the app registers its job handlers and connects the database
+    import server
+
+    async def serve():
+        pool = JobWorkerPool(server.repos.jobs, concurrency)
+        pool.start()
+        dispatcher = OutboxDispatcher(server.repos.outbox, build_transport()) if emails else None
+        if dispatcher is not None:
+            dispatcher.start()
+        logger.info("Job worker %s running %d slots", pool.worker_id, concurrency)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        await stop.wait()
+        await pool.stop(timeout=JOB_LEASE_SECONDS)
+        if dispatcher is not None:
+            await dispatcher.stop()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""Async load generator for L'École des Génies API.
+
+Starts the backend locally (uvicorn + a throw-away database on a local
+mongod) unless --base-url is given, seeds accounts through the API, then
+drives a weighted mix of scenarios through a ramp schedule and writes
+per-endpoint latency percentiles, throughput and error rates as JSON.
+
+    python load_harness.py run --mix login=1,catalog=6,download=2,upload=1 \\
+        --ramp 10x30,50x60,100x60 --output results/$(git rev-parse --short HEAD).json
+    python load_harness.py compare results/base.json results/head.json --threshold 10
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+
+import httpx
+import typer
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+ADMIN_EMAIL = "marine.alves1995@gmail.com"
+PASSWORD = "LoadTest123!"
+LEVELS = ["PS", "MS", "GS", "CP", "CE1", "CE2", "CM1", "CM2"]
+SUBJECTS = ["mathématiques", "français", "sciences", "découverte du monde"]
+UPLOAD_SIZE = 100 * 1024
+
+cli = typer.Typer(help="Async load testing harness for the backend API.")
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    # Nearest-rank percentile; rounding keeps float noise (0.57 * 100 = 56.999...) off the rank
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(round(fraction * len(sorted_values), 9)) - 1))
+    return sorted_values[index]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise typer.BadParameter(f"unknown scenario {name!r}, expected one of {sorted(SCENARIOS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def parse_ramp(ramp: str) -> list:
+    # "10x30,50x60" -> [(10 users, 30 s), (50 users, 60 s)]
+    stages = []
+    for item in ramp.split(","):
+        users, _, seconds = item.partition("x")
+        stages.append((int(users), float(seconds)))
+    return stages
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.stage = 0
+        self.stage_counts = defaultdict(lambda: [0, 0])
+
+    def record(self, endpoint: str, seconds: float, status: Optional[int]):
+        self.samples[endpoint].append(seconds)
+        self.statuses[endpoint][str(status) if status else "error"] += 1
+        failed = status is None or status >= 400
+        if failed:
+            self.errors[endpoint] += 1
+        counts = self.stage_counts[self.stage]
+        counts[0] += 1
+        counts[1] += failed
+
+    def report(self, duration: float) -> dict:
+        endpoints = {}
+        all_samples = []
+        for endpoint, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            all_samples.extend(ordered)
+            endpoints[endpoint] = {
+                "count": len(ordered),
+                "errors": self.errors[endpoint],
+                "error_rate": round(self.errors[endpoint] / len(ordered), 4),
+                "throughput_rps": round(len(ordered) / duration, 2),
+                "latency_ms": _latency_summary(ordered),
+                "statuses": dict(self.statuses[endpoint]),
+            }
+        all_samples.sort()
+        total_errors = sum(self.errors.values())
+        return {
+            "totals": {
+                "requests": len(all_samples),
+                "errors": total_errors,
+                "error_rate": round(total_errors / len(all_samples), 4) if all_samples else 0.0,
+                "throughput_rps": round(len(all_samples) / duration, 2),
+                "latency_ms": _latency_summary(all_samples),
+            },
+            "endpoints": endpoints,
+        }
+
+
+def _latency_summary(ordered) -> dict:
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "p50": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99": round(percentile(ordered, 0.99) * 1000, 2),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+class LoadSession:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder):
+        self.client = client
+        self.recorder = recorder
+        self.accounts = []
+        self.admin_token = None
+        self.file_names = []
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(endpoint, time.perf_counter() - start, None)
+            return None
+        self.recorder.record(endpoint, time.perf_counter() - start, response.status_code)
+        return response
+
+    async def seed(self, users: int):
+        # Accounts are created through the API so hashes use the server's policy
+        run_id = uuid.uuid4().hex[:8]
+        for i in range(users):
+            user_type = "teacher" if i % 4 == 0 else "parent"
+            email = f"load_{run_id}_{i}@test.com"
+            response = await self.client.post("/api/auth/register", json={
+                "email": email, "password": PASSWORD, "first_name": "Charge",
+                "last_name": f"Test{i}", "user_type": user_type,
+            })
+            response.raise_for_status()
+            token = response.json()["token"]
+            if user_type == "parent" and i % 3 == 0:
+                await self.client.post("/api/subscription/simulate", headers=_auth(token))
+            self.accounts.append({"email": email, "token": token})
+
+        response = await self.client.post("/api/auth/login", json={"email": ADMIN_EMAIL, "password": PASSWORD})
+        if response.status_code == 401:
+            response = await self.client.post("/api/auth/register", json={
+                "email": ADMIN_EMAIL, "password": PASSWORD, "first_name": "Marine",
+                "last_name": "Admin", "user_type": "parent",
+            })
+        if response.status_code == 200:
+            self.admin_token = response.json()["token"]
+
+        response = await self.client.get("/api/pedagogical-sheets", headers=_auth(self.accounts[0]["token"]))
+        self.file_names = [sheet["file_url"].rsplit("/", 1)[-1] for sheet in response.json().get("sheets", [])]
+        if not self.file_names:
+            self.file_names = ["sample_couleurs.pdf"]
+
+    # Scenarios
+    async def login(self):
+        account = random.choice(self.accounts)
+        await self.request("POST /api/auth/login", "POST", "/api/auth/login",
+                           json={"email": account["email"], "password": PASSWORD})
+
+    async def catalog(self):
+        headers = _auth(random.choice(self.accounts)["token"])
+        params = {}
+        if random.random() < 0.5:
+            params["level"] = random.choice(LEVELS)
+        if random.random() < 0.3:
+            params["subject"] = random.choice(SUBJECTS)
+        await self.request("GET /api/pedagogical-sheets", "GET", "/api/pedagogical-sheets",
+                           params=params, headers=headers)
+        await self.request("GET /api/user/profile", "GET", "/api/user/profile", headers=headers)
+
+    async def download(self):
+        headers = _auth(random.choice(self.accounts)["token"])
+        await self.request("GET /api/files/{filename}", "GET",
+                           f"/api/files/{random.choice(self.file_names)}", headers=headers)
+
+    async def upload(self):
+        if not self.admin_token:
+            return
+        headers = _auth(self.admin_token)
+        response = await self.request(
+            "POST /api/admin/pedagogical-sheets", "POST", "/api/admin/pedagogical-sheets",
+            headers=headers,
+            data={"title": "Fiche de charge", "description": "Test de charge",
+                  "level": random.choice(LEVELS), "subject": random.choice(SUBJECTS)},
+            files={"file": ("charge.pdf", os.urandom(UPLOAD_SIZE), "application/pdf")},
+        )
+        if response is not None and response.status_code == 200:
+            sheet_id = response.json()["sheet"]["id"]
+            await self.request("DELETE /api/admin/pedagogical-sheets/{sheet_id}", "DELETE",
+                               f"/api/admin/pedagogical-sheets/{sheet_id}", headers=headers)
+
+
+SCENARIOS = {
+    "login": LoadSession.login,
+    "catalog": LoadSession.catalog,
+    "download": LoadSession.download,
+    "upload": LoadSession.upload,
+}
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def _virtual_user(session: LoadSession, weights: dict, stop: asyncio.Event):
+    names = list(weights)
+    values = [weights[name] for name in names]
+    while not stop.is_set():
+        scenario = random.choices(names, values)[0]
+        await SCENARIOS[scenario](session)
+
+
+async def run_load(base_url: str, weights: dict, stages: list, users: int, timeout: float) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=max(s[0] for s in stages) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        session = LoadSession(client, recorder)
+        print(f"🌱 Seeding {users} accounts...")
+        await session.seed(users)
+
+        workers = []
+        # Stopped workers finish their current scenario; awaited with the rest
+        retired = []
+        stage_reports = []
+        started = time.perf_counter()
+        for index, (concurrency, seconds) in enumerate(stages):
+            recorder.stage = index
+            # Grow or shrink the pool of virtual users to the stage's level
+            while len(workers) < concurrency:
+                stop = asyncio.Event()
+                workers.append((stop, asyncio.create_task(_virtual_user(session, weights, stop))))
+            while len(workers) > concurrency:
+                stop, task = workers.pop()
+                stop.set()
+                retired.append(task)
+            print(f"📈 Stage {index + 1}/{len(stages)}: {concurrency} virtual users for {seconds:.0f}s")
+            await asyncio.sleep(seconds)
+            requests_done, errors = recorder.stage_counts[index]
+            stage_reports.append({
+                "concurrency": concurrency,
+                "duration_s": seconds,
+                "requests": requests_done,
+                "errors": errors,
+                "throughput_rps": round(requests_done / seconds, 2),
+            })
+
+        for stop, _ in workers:
+            stop.set()
+        await asyncio.gather(*(task for _, task in workers), *retired, return_exceptions=True)
+        duration = time.perf_counter() - started
+
+    report = recorder.report(duration)
+    report["stages"] = stage_reports
+    report["duration_s"] = round(duration, 2)
+    return report
+
+
+def start_local_server(port: int, mongo_url: str, db_name: str, extra_env: dict) -> subprocess.Popen:
+    # Every virtual user comes from 127.0.0.1, so the per-IP auth limits would
+    # fail the seeding and turn the login mix into 429s; --server-env
+    # RATE_LIMIT_ENABLED=true measures the limiter instead
+    env = dict(os.environ, MONGO_URL=mongo_url, MONGO_DB_NAME=db_name, RATE_LIMIT_ENABLED="false")
+    env.update(extra_env)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/ready", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("server did not become ready within 30s")
+
+
+@cli.command()
+def run(
+    mix: str = typer.Option("login=1,catalog=6,download=2,upload=1", help="Scenario weights."),
+    ramp: str = typer.Option("10x20,50x40,100x40", help="Stages as <virtual users>x<seconds>."),
+    users: int = typer.Option(50, help="Accounts to register before the run."),
+    base_url: Optional[str] = typer.Option(None, help="Target an already running server."),
+    port: int = typer.Option(8011, help="Port of the locally started server."),
+    mongo_url: str = typer.Option("mongodb://localhost:27017", help="Local mongod for the started server."),
+    keep_db: bool = typer.Option(False, help="Keep the throw-away database after the run."),
+    server_env: list[str] = typer.Option([], help="Extra KEY=VALUE env for the started server."),
+    timeout: float = typer.Option(30.0, help="Per-request timeout in seconds."),
+    seed: int = typer.Option(42, help="Random seed for scenario choices."),
+    label: Optional[str] = typer.Option(None, help="Label stored in the report (default: git commit)."),
+    output: Optional[str] = typer.Option(None, help="Write the JSON report to this file."),
+):
+    """Run a load test and report per-endpoint latency, throughput and errors."""
+    random.seed(seed)
+    weights = parse_mix(mix)
+    stages = parse_ramp(ramp)
+    process = None
+    db_name = f"loadtest_{uuid.uuid4().hex[:8]}"
+    if base_url is None:
+        extra_env = dict(item.split("=", 1) for item in server_env)
+        print(f"🚀 Starting local server on port {port} (database {db_name})")
+        process = start_local_server(port, mongo_url, db_name, extra_env)
+        base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        report = asyncio.run(run_load(base_url, weights, stages, users, timeout))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+            if not keep_db:
+                from pymongo import MongoClient
+                MongoClient(mongo_url).drop_database(db_name)
+
+    report = {
+        "label": label or git_commit(),
+        "commit": git_commit(),
+        "started_at": datetime.utcnow().isoformat(),
+        "config": {"mix": weights, "ramp": stages, "users": users, "base_url": base_url},
+        **report,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            f.write(text)
+        print(f"📊 Report written to {output}")
+    else:
+        print(text)
+    totals = report["totals"]
+    print(f"✅ {totals['requests']} requests, {totals['throughput_rps']} req/s, "
+          f"p95 {totals['latency_ms']['p95']} ms, error rate {totals['error_rate']:.2%}")
+
+
+@cli.command()
+def compare(
+    baseline: str,
+    candidate: str,
+    threshold: float = typer.Option(10.0, help="Allowed p95 regression in percent."),
+):
+    """Compare two reports; exit 1 if an endpoint's p95 regressed beyond the threshold."""
+    with open(baseline) as f:
+        base = json.load(f)
+    with open(candidate) as f:
+        head = json.load(f)
+
+    regressions = 0
+    print(f"{'endpoint':45} {'p95 base':>10} {'p95 head':>10} {'delta':>8} {'rps base':>9} {'rps head':>9}")
+    for endpoint, stats in sorted(head["endpoints"].items()):
+        before = base["endpoints"].get(endpoint)
+        if before is None:
+            print(f"{endpoint:45} {'-':>10} {stats['latency_ms']['p95']:>10} {'new':>8}")
+            continue
+        p95_base = before["latency_ms"]["p95"]
+        p95_head = stats["latency_ms"]["p95"]
+        delta = (p95_head - p95_base) / p95_base * 100 if p95_base else 0.0
+        flag = " ❌" if delta > threshold else ""
+        regressions += delta > threshold
+        print(f"{endpoint:45} {p95_base:>10} {p95_head:>10} {delta:>+7.1f}% "
+              f"{before['throughput_rps']:>9} {stats['throughput_rps']:>9}{flag}")
+    if regressions:
+        print(f"⚠️  {regressions} endpoint(s) regressed by more than {threshold}%")
+        raise typer.Exit(code=1)
+    print("🎉 No p95 regression above threshold")
+
+
+if __name__ == "__main__":
+    cli()
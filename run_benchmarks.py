@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Run and compare the backend microbenchmarks (tests/benchmarks).
+
+    python run_benchmarks.py run                 # saves .benchmarks/<machine>/NNNN_<commit>.json
+    python run_benchmarks.py compare <base> [<head>] --threshold 10
+"""
+import glob
+import json
+import os
+import subprocess
+import sys
+from typing import Optional
+
+import typer
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+STORAGE_DIR = os.path.join(ROOT_DIR, ".benchmarks")
+
+cli = typer.Typer(help="Backend microbenchmarks stored per commit.")
+
+
+def _git(*args) -> str:
+    return subprocess.check_output(["git", *args], cwd=ROOT_DIR, text=True).strip()
+
+
+def current_commit() -> str:
+    commit = _git("rev-parse", "--short", "HEAD")
+    # Uncommitted changes must not overwrite the commit's own baseline
+    if _git("status", "--porcelain", "--untracked-files=no"):
+        commit += "-dirty"
+    return commit
+
+
+def load_run(commit: str) -> dict:
+    matches = sorted(
+        glob.glob(os.path.join(STORAGE_DIR, "*", f"*_{commit}.json")),
+        key=os.path.basename,
+    )
+    if not matches:
+        raise typer.BadParameter(f"no saved benchmark run for commit {commit!r} in {STORAGE_DIR}")
+    with open(matches[-1]) as f:
+        return json.load(f)
+
+
+@cli.command()
+def run(
+    keyword: Optional[str] = typer.Option(None, "-k", help="Only run benchmarks matching this expression."),
+    save: bool = typer.Option(True, help="Store the results under the current commit."),
+):
+    """Run the benchmarks and store the results for the current commit."""
+    command = [
+        sys.executable, "-m", "pytest", "tests/benchmarks", "-q",
+        f"--benchmark-storage=file://{STORAGE_DIR}",
+        "--benchmark-sort=fullname",
+    ]
+    if save:
+        command.append(f"--benchmark-save={current_commit()}")
+    if keyword:
+        command += ["-k", keyword]
+    result = subprocess.run(command, cwd=ROOT_DIR, env=dict(os.environ, RUN_BENCHMARKS="1"))
+    raise typer.Exit(code=result.returncode)
+
+
+@cli.command()
+def compare(
+    base: str,
+    head: Optional[str] = typer.Argument(None, help="Defaults to the current commit."),
+    threshold: float = typer.Option(10.0, help="Allowed slowdown in percent."),
+    stat: str = typer.Option("median", help="Statistic to compare (min, mean, median)."),
+):
+    """Compare two stored runs; exit 1 if any benchmark slowed down beyond the threshold."""
+    base_run = {b["fullname"]: b["stats"] for b in load_run(base)["benchmarks"]}
+    head_run = {b["fullname"]: b["stats"] for b in load_run(head or current_commit())["benchmarks"]}
+
+    regressions = []
+    typer.echo(f"{'benchmark':70} {'base (µs)':>12} {'head (µs)':>12} {'delta':>8}")
+    for name in sorted(head_run):
+        if name not in base_run:
+            typer.echo(f"{name:70} {'-':>12} {head_run[name][stat] * 1e6:>12.1f} {'new':>8}")
+            continue
+        before = base_run[name][stat]
+        after = head_run[name][stat]
+        delta = (after - before) / before * 100
+        flag = " REGRESSION" if delta > threshold else ""
+        if flag:
+            regressions.append(name)
+        typer.echo(f"{name:70} {before * 1e6:>12.1f} {after * 1e6:>12.1f} {delta:>+7.1f}%{flag}")
+
+    if regressions:
+        typer.echo(f"{len(regressions)} benchmark(s) slower than {base} by more than {threshold}% ({stat})")
+        raise typer.Exit(code=1)
+    typer.echo(f"No regression above {threshold}% ({stat})")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,16 @@
+import os
+
+import pytest
+
+# Benchmarks are slow (bcrypt) and only meaningful on a quiet machine, so the
+# regular suite skips them; run_benchmarks.py sets RUN_BENCHMARKS=1.
+RUN_BENCHMARKS = os.getenv("RUN_BENCHMARKS") == "1"
+
+
+def pytest_collection_modifyitems(config, items):
+    if RUN_BENCHMARKS:
+        return
+    skip = pytest.mark.skip(reason="set RUN_BENCHMARKS=1 (or use run_benchmarks.py) to run benchmarks")
+    for item in items:
+        if "benchmark" in getattr(item, "fixturenames", ()):
+            item.add_marker(skip)
@@ -0,0 +1,81 @@
+"""Microbenchmarks for the backend's hot functions (pytest-benchmark)."""
+import uuid
+from datetime import datetime
+
+import jwt
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import server
+
+USER = {
+    "id": str(uuid.uuid4()),
+    "email": "parent@example.fr",
+    "user_type": "parent",
+    "is_premium": False,
+    "is_verified": True,
+}
+LEVELS = ["PS", "MS", "GS", "CP", "CE1", "CE2", "CM1", "CM2"]
+
+
+def make_sheets(count: int) -> list:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "title": f"Fiche pédagogique {i}",
+            "description": "Exercices progressifs avec des supports visuels pour la classe.",
+            "level": LEVELS[i % len(LEVELS)],
+            "subject": "mathématiques",
+            "is_premium": i % 3 == 0,
+            "is_teacher_only": i % 5 == 0,
+            "file_url": f"/api/files/{uuid.uuid4()}.pdf",
+            "created_at": datetime(2024, 9, 1, 8, 30),
+        }
+        for i in range(count)
+    ]
+
+
+def test_create_jwt_token(benchmark):
+    token = benchmark(server.create_jwt_token, USER)
+    assert token
+
+
+def test_decode_jwt_token(benchmark):
+    # Same decode call get_current_user makes before its user lookup
+    token = server.create_jwt_token(USER)
+    payload = benchmark(jwt.decode, token, server.JWT_SECRET, algorithms=[server.JWT_ALGORITHM])
+    assert payload["user_id"] == USER["id"]
+
+
+@pytest.mark.parametrize("tier", [
+    {"user_type": "parent", "is_premium": False, "is_verified": True},
+    {"user_type": "parent", "is_premium": True, "is_verified": True},
+    {"user_type": "teacher", "is_premium": False, "is_verified": True},
+], ids=["free_parent", "premium_parent", "verified_teacher"])
+def test_build_sheet_query(benchmark, tier):
+    query = benchmark(server.build_sheet_query, tier, "CP", "mathématiques")
+    assert query["level"] == "CP"
+
+
+@pytest.mark.parametrize("count", [100, 1000, 10000])
+def test_serialize_sheet_listing(benchmark, count):
+    # What FastAPI does with the dict returned by get_pedagogical_sheets
+    sheets = make_sheets(count)
+
+    def serialize():
+        return JSONResponse(content=jsonable_encoder({"sheets": sheets, "total": len(sheets)})).body
+
+    body = benchmark(serialize)
+    assert body.startswith(b'{"sheets":')
+
+
+def test_hash_password(benchmark):
+    hashed = benchmark.pedantic(server.hash_password, args=("MotDePasse123!",), rounds=5, iterations=1)
+    assert hashed.startswith("$2")
+
+
+def test_verify_password(benchmark):
+    hashed = server.hash_password("MotDePasse123!")
+    valid = benchmark.pedantic(server.verify_password, args=("MotDePasse123!", hashed), rounds=5, iterations=1)
+    assert valid
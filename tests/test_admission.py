@@ -0,0 +1,81 @@
+"""Admission control for password hashing."""
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+import admission
+import server
+from memory_store import MemoryDatabase
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def gate():
+    gate = threading.Event()
+    yield gate
+    gate.set()
+
+
+async def test_runs_on_a_hashing_thread():
+    controller = admission.HashAdmission(workers=1)
+
+    name = await controller.run(lambda: threading.current_thread().name)
+
+    assert name.startswith("hash")
+
+
+async def test_rejects_immediately_when_queue_is_full(gate):
+    controller = admission.HashAdmission(workers=1, max_pending=1, wait_seconds=5)
+    running = asyncio.ensure_future(controller.run(gate.wait))
+    queued = asyncio.ensure_future(controller.run(gate.wait))
+    await asyncio.sleep(0.05)
+
+    with pytest.raises(admission.Overloaded) as rejected:
+        await controller.run(gate.wait)
+
+    assert rejected.value.reason == "queue_full" and rejected.value.retry_after >= 1
+    gate.set()
+    await asyncio.gather(running, queued)
+    assert controller.pending == controller.running == 0
+
+
+async def test_withdraws_hashes_that_wait_past_the_deadline(gate):
+    controller = admission.HashAdmission(workers=1, max_pending=5, wait_seconds=0.05)
+    running = asyncio.ensure_future(controller.run(gate.wait))
+    await asyncio.sleep(0.01)
+    calls = []
+
+    with pytest.raises(admission.Overloaded) as rejected:
+        await controller.run(calls.append, "hashed")
+
+    assert rejected.value.reason == "deadline"
+    gate.set()
+    assert await running is True
+    assert calls == [] and controller.pending == 0
+
+
+async def test_auth_storm_gets_503_while_catalog_keeps_serving(monkeypatch):
+    previous = server.db
+    server.use_database(MemoryDatabase())
+    await server.init_sample_data()
+    monkeypatch.setattr(server, "hash_admission", admission.HashAdmission(workers=1, max_pending=0))
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/api/auth/register", json={
+                "email": "storm@test.com", "password": "x", "first_name": "A", "last_name": "B",
+                "user_type": "parent",
+            })
+            assert response.status_code == 503
+            assert int(response.headers["Retry-After"]) >= 1
+            assert (await client.get("/api/health")).status_code == 200
+    finally:
+        server.use_database(previous)
@@ -0,0 +1,432 @@
+"""In-process API scenarios (ported from backend_test.py).
+
+The app runs on an httpx ASGI transport against the in-memory repository
+backend, so the whole flow needs neither a server nor MongoDB.
+"""
+import asyncio
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+import admission
+import passwords
+import server
+from memory_store import MemoryDatabase
+
+pytestmark = pytest.mark.anyio
+
+ADMIN_EMAIL = "marine.alves1995@gmail.com"
+PASSWORD = "TestPass123!"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def client(monkeypatch):
+    # Minimum bcrypt cost keeps the suite in milliseconds
+    monkeypatch.setattr(server, "password_context", passwords.build_context(4))
+    previous = server.db
+    server.use_database(MemoryDatabase())
+    await server.ensure_indexes()
+    await server.init_sample_data()
+    # Every scenario posts from the same client address
+    server.rate_limiter.clear()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+    server.use_database(previous)
+
+
+async def register(client, email, user_type="parent", password=PASSWORD):
+    response = await client.post("/api/auth/register", json={
+        "email": email,
+        "password": password,
+        "first_name": "Prénom",
+        "last_name": "Test",
+        "user_type": user_type,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def sheet_titles(client, token, **params):
+    response = await client.get("/api/pedagogical-sheets", params=params, headers=auth(token))
+    assert response.status_code == 200
+    return {sheet["title"] for sheet in response.json()["sheets"]}
+
+
+async def test_health_check(client):
+    response = await client.get("/api/health")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "healthy"
+
+
+async def test_register_login_and_profile(client):
+    registered = await register(client, "parent@test.com")
+    assert registered["user"]["is_verified"] is True
+    assert registered["user"]["is_admin"] is False
+
+    response = await client.post("/api/auth/login", json={"email": "parent@test.com", "password": PASSWORD})
+    assert response.status_code == 200
+    token = response.json()["token"]
+
+    response = await client.get("/api/user/profile", headers=auth(token))
+    assert response.status_code == 200
+    assert response.json()["email"] == "parent@test.com"
+
+
+async def test_duplicate_registration_is_rejected(client):
+    await register(client, "twice@test.com")
+
+    response = await client.post("/api/auth/register", json={
+        "email": "twice@test.com", "password": PASSWORD, "first_name": "A",
+        "last_name": "B", "user_type": "parent",
+    })
+
+    assert response.status_code == 400
+
+
+async def test_duplicates_are_rejected_while_the_email_index_is_missing(client, monkeypatch):
+    monkeypatch.setattr(server, "missing_indexes", {})
+    database = MemoryDatabase()
+    await database.users.insert_many([{"id": f"u{i}", "email": "twice@test.com"} for i in range(2)])
+    server.use_database(database)
+    await server.run_startup_tasks()
+    assert "email_unique" in server.missing_indexes["users"]
+
+    response = await client.post("/api/auth/register", json={
+        "email": "twice@test.com", "password": PASSWORD, "first_name": "A",
+        "last_name": "B", "user_type": "parent",
+    })
+
+    assert response.status_code == 400
+    assert await database.users.count_documents({"email": "twice@test.com"}) == 2
+    await register(client, "new@test.com")
+
+
+async def test_unknown_user_type_is_rejected(client):
+    response = await client.post("/api/auth/register", json={
+        "email": "admin@test.com", "password": PASSWORD, "first_name": "A",
+        "last_name": "B", "user_type": "admin",
+    })
+
+    assert response.status_code == 422
+    assert await server.repos.users.count({}) == 0
+
+
+async def test_concurrent_registrations_create_one_account(client):
+    body = {"email": "race@test.com", "password": PASSWORD, "first_name": "A", "last_name": "B", "user_type": "parent"}
+
+    responses = await asyncio.gather(*(client.post("/api/auth/register", json=body) for _ in range(5)))
+
+    assert sorted(response.status_code for response in responses) == [200, 400, 400, 400, 400]
+    assert await server.repos.users.count({"email": "race@test.com"}) == 1
+
+
+async def test_invalid_login(client):
+    response = await client.post("/api/auth/login", json={"email": "nobody@test.com", "password": "wrong"})
+
+    assert response.status_code == 401
+
+
+async def test_login_upgrades_weaker_hashes(client, monkeypatch):
+    await register(client, "legacy@test.com")
+    monkeypatch.setattr(server, "password_context", passwords.build_context(5))
+    credentials = {"email": "legacy@test.com", "password": PASSWORD}
+
+    assert (await client.post("/api/auth/login", json=credentials)).status_code == 200
+    upgraded = (await server.repos.users.get_by_email("legacy@test.com"))["password"]
+    assert upgraded.startswith("$2b$05$")
+
+    # Already at the policy cost: verified without another rehash
+    assert (await client.post("/api/auth/login", json=credentials)).status_code == 200
+    assert (await server.repos.users.get_by_email("legacy@test.com"))["password"] == upgraded
+    wrong = {"email": "legacy@test.com", "password": "wrong"}
+    assert (await client.post("/api/auth/login", json=wrong)).status_code == 401
+
+
+async def test_unauthorized_access(client):
+    assert (await client.get("/api/user/profile")).status_code == 403
+    response = await client.get("/api/user/profile", headers=auth("not-a-jwt"))
+    assert response.status_code == 401
+
+
+async def test_catalog_visibility_per_tier(client):
+    parent = await register(client, "parent@test.com")
+    teacher = await register(client, "teacher@test.com", "teacher")
+    free_titles = {"Apprendre les couleurs - Maternelle"}
+
+    assert await sheet_titles(client, parent["token"]) == free_titles
+    assert await sheet_titles(client, teacher["token"]) == free_titles
+
+    response = await client.post("/api/subscription/simulate", headers=auth(parent["token"]))
+    assert response.status_code == 200
+    assert await sheet_titles(client, parent["token"]) == free_titles | {
+        "Les additions simples - CP", "Sciences : Le cycle de l'eau",
+    }
+    assert await sheet_titles(client, parent["token"], level="CP") == {"Les additions simples - CP"}
+
+    await server.repos.users.update_by_email("teacher@test.com", {"is_verified": True})
+    assert len(await sheet_titles(client, teacher["token"])) == 5
+    assert await sheet_titles(client, teacher["token"], subject="mathématiques") == {
+        "Les additions simples - CP", "Les fractions - Niveau avancé",
+    }
+
+
+async def test_only_parents_can_subscribe(client):
+    teacher = await register(client, "teacher@test.com", "teacher")
+
+    response = await client.post("/api/subscription/simulate", headers=auth(teacher["token"]))
+
+    assert response.status_code == 403
+
+
+async def test_teacher_verification_upload(client):
+    teacher = await register(client, "teacher@test.com", "teacher")
+    parent = await register(client, "parent@test.com")
+    files = {"file": ("verification.txt", b"Test verification document content", "text/plain")}
+
+    response = await client.post("/api/teacher/verification", files=files, headers=auth(teacher["token"]))
+    assert response.status_code == 200
+    assert response.json()["status"] == "pending"
+
+    response = await client.post("/api/teacher/verification", files=files, headers=auth(teacher["token"]))
+    assert response.status_code == 400
+
+    response = await client.post("/api/teacher/verification", files=files, headers=auth(parent["token"]))
+    assert response.status_code == 403
+
+
+async def test_verification_review_queue(client):
+    teacher = await register(client, "teacher@test.com", "teacher")
+    first = auth((await register(client, ADMIN_EMAIL))["token"])
+    second_admin = await register(client, "admin2@test.com")
+    await server.repos.users.update_by_id(second_admin["user"]["id"], {"is_admin": True})
+    second = auth(second_admin["token"])
+    files = {"file": ("diplome.txt", b"Justificatif", "text/plain")}
+    await client.post("/api/teacher/verification", files=files, headers=auth(teacher["token"]))
+
+    claimed = (await client.post("/api/admin/verifications/claim", headers=first)).json()
+    assert claimed["teacher"]["email"] == "teacher@test.com" and "password" not in claimed["teacher"]
+    verification_id = claimed["verification"]["id"]
+    # Held by the first reviewer: nothing left for the second one
+    assert (await client.post("/api/admin/verifications/claim", headers=second)).json()["verification"] is None
+    response = await client.post(f"/api/admin/verifications/{verification_id}/approve", headers=second)
+    assert response.status_code == 409
+
+    document = await client.get(f"/api/admin/verifications/{verification_id}/document", headers=second)
+    assert document.content == b"Justificatif"
+    for _ in range(2):  # retrying the same decision is harmless
+        response = await client.post(f"/api/admin/verifications/{verification_id}/approve", headers=first,
+                                     data={"note": "OK"})
+        assert response.status_code == 200
+    profile = await client.get("/api/user/profile", headers=auth(teacher["token"]))
+    assert profile.json()["is_verified"] is True
+    counts = (await client.get("/api/admin/verifications", headers=first)).json()
+    assert counts == {"pending": 0, "in_review": 0, "approved": 1, "rejected": 0}
+
+
+async def test_file_download(client):
+    parent = await register(client, "parent@test.com")
+
+    response = await client.get("/api/files/sample_couleurs.pdf", headers=auth(parent["token"]))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    # Only names a sheet refers to get a placeholder
+    response = await client.get("/api/files/whatever.pdf", headers=auth(parent["token"]))
+    assert response.status_code == 404
+
+
+async def test_catalog_searches_pdf_text(client):
+    parent = await register(client, "parent@test.com")
+    for index, text in enumerate(["Le cycle de l'eau et la pluie", "Les fractions décimales"]):
+        content_hash = f"{index}" * 64
+        await server.repos.previews.save(content_hash, {"text": text})
+        await server.repos.sheets.insert({
+            "id": f"s{index}", "title": f"Fiche {index}", "description": "", "level": "CM1",
+            "subject": "sciences", "is_premium": False, "is_teacher_only": False,
+            "file_url": f"/api/files/s{index}.pdf", "content_hash": content_hash, "created_at": datetime.utcnow(),
+        })
+
+    response = await client.get("/api/pedagogical-sheets", params={"q": "pluie"}, headers=auth(parent["token"]))
+
+    assert [sheet["id"] for sheet in response.json()["sheets"]] == ["s0"]
+    assert await sheet_titles(client, parent["token"], q="Décimales") == {"Fiche 1"}
+
+
+async def test_password_reset_flow(client, monkeypatch):
+    await register(client, "forgot@test.com")
+
+    response = await client.post("/api/auth/forgot-password", json={"email": "forgot@test.com"})
+    assert response.status_code == 200
+    record = await server.db.password_resets.find_one({"email": "forgot@test.com"})
+    message = await server.db.outbox.find_one({"to": "forgot@test.com"})
+    assert message["status"] == "queued" and record["token"] in message["body"]
+
+    response = await client.post("/api/auth/reset-password", json={
+        "token": record["token"], "new_password": "Nouveau123!",
+    })
+    assert response.status_code == 200
+
+    response = await client.post("/api/auth/login", json={"email": "forgot@test.com", "password": "Nouveau123!"})
+    assert response.status_code == 200
+
+    # A replayed token is refused without hashing the new password
+    hashes = []
+    hash_password = server.hash_password
+    monkeypatch.setattr(server, "hash_password", lambda password: hashes.append(password) or hash_password(password))
+    response = await client.post("/api/auth/reset-password", json={
+        "token": record["token"], "new_password": "Encore123!",
+    })
+    assert response.status_code == 400
+    assert hashes == []
+
+
+async def test_shed_reset_leaves_the_token_usable(client, monkeypatch):
+    await register(client, "forgot@test.com")
+    await client.post("/api/auth/forgot-password", json={"email": "forgot@test.com"})
+    record = await server.db.password_resets.find_one({"email": "forgot@test.com"})
+    reset = {"token": record["token"], "new_password": "Nouveau123!"}
+
+    with monkeypatch.context() as patched:
+        patched.setattr(server, "hash_admission", admission.HashAdmission(workers=1, max_pending=0))
+        response = await client.post("/api/auth/reset-password", json=reset)
+    assert response.status_code == 503
+
+    response = await client.post("/api/auth/reset-password", json=reset)
+    assert response.status_code == 200
+
+
+async def test_reset_requests_keep_one_record_and_token_is_single_use(client):
+    await register(client, "forgot@test.com")
+    for _ in range(3):
+        await client.post("/api/auth/forgot-password", json={"email": "forgot@test.com"})
+    assert await server.db.password_resets.count_documents({"email": "forgot@test.com"}) == 1
+    record = await server.db.password_resets.find_one({"email": "forgot@test.com"})
+
+    responses = await asyncio.gather(*(
+        client.post("/api/auth/reset-password", json={"token": record["token"], "new_password": f"Nouveau{i}!"})
+        for i in range(3)
+    ))
+
+    assert sorted(response.status_code for response in responses) == [200, 400, 400]
+
+
+async def test_admin_sheet_management(client):
+    admin = await register(client, ADMIN_EMAIL)
+    assert admin["user"]["is_admin"] is True
+    headers = auth(admin["token"])
+
+    response = await client.post("/api/admin/pedagogical-sheets", headers=headers, data={
+        "title": "Fiche de test", "description": "Créée par le test", "level": "CM1",
+        "subject": "sciences", "is_premium": "true", "is_teacher_only": "false",
+    }, files={"file": ("fiche.pdf", b"%PDF-1.4 test", "application/pdf")})
+    assert response.status_code == 200
+    sheet_id = response.json()["sheet"]["id"]
+
+    response = await client.get("/api/admin/pedagogical-sheets", headers=headers)
+    assert response.json()["total"] == 6
+
+    response = await client.put(f"/api/admin/pedagogical-sheets/{sheet_id}", headers=headers,
+                                json={"title": "Fiche modifiée"})
+    assert response.status_code == 200
+    assert response.json()["sheet"]["title"] == "Fiche modifiée"
+    assert response.json()["sheet"]["is_premium"] is True
+    response = await client.put("/api/admin/pedagogical-sheets/missing", headers=headers, json={"title": "x"})
+    assert response.status_code == 404
+
+    response = await client.get("/api/admin/stats", headers=headers)
+    assert response.json()["sheets"]["total"] == 6
+    assert response.json()["users"]["total"] == 1
+
+    assert (await client.delete(f"/api/admin/pedagogical-sheets/{sheet_id}", headers=headers)).status_code == 200
+    assert (await client.delete(f"/api/admin/pedagogical-sheets/{sheet_id}", headers=headers)).status_code == 404
+
+
+async def test_admin_reset_user_password(client):
+    admin = await register(client, ADMIN_EMAIL)
+    await register(client, "parent@test.com")
+
+    response = await client.post("/api/admin/reset-user-password", headers=auth(admin["token"]),
+                                 data={"email": "parent@test.com", "new_password": "AdminSet123!"})
+    assert response.status_code == 200
+
+    response = await client.post("/api/auth/login", json={"email": "parent@test.com", "password": "AdminSet123!"})
+    assert response.status_code == 200
+
+
+async def test_admin_bulk_user_import(client, monkeypatch):
+    admin = await register(client, ADMIN_EMAIL)
+    await register(client, "parent@test.com")
+    monkeypatch.setattr(server, "import_pool", ThreadPoolExecutor(2))
+    csv_file = ("email,first_name,last_name,user_type,password\n"
+                "parent@test.com,A,B,parent,x\nnew@test.com,C,D,teacher,Imported1!\n")
+
+    response = await client.post("/api/admin/users/import", headers=auth(admin["token"]),
+                                 files={"file": ("ecole.csv", csv_file.encode(), "text/csv")})
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["imported"], report["failed"]) == (1, 1)
+    assert report["errors"] == [{"line": 2, "email": "parent@test.com", "error": "email already registered"}]
+    login = await client.post("/api/auth/login", json={"email": "new@test.com", "password": "Imported1!"})
+    assert login.status_code == 200
+
+    response = await client.post("/api/admin/users/import", headers=auth(admin["token"]),
+                                 files={"file": ("bad.csv", b"email,password\n", "text/csv")})
+    assert response.status_code == 400
+
+
+async def test_admin_user_search_pages_without_password_hashes(client):
+    admin = await register(client, ADMIN_EMAIL)
+    for index, last_name in enumerate(["Dupont", "Dupond", "Durand", "Élie", "Dupuis"]):
+        response = await client.post("/api/auth/register", json={
+            "email": f"user{index}@test.com", "password": PASSWORD, "first_name": "Prénom",
+            "last_name": last_name, "user_type": "teacher" if index % 2 else "parent",
+        })
+        assert response.status_code == 200
+    headers = auth(admin["token"])
+
+    async def pages(**params):
+        results, cursor = [], None
+        while True:
+            response = await client.get("/api/admin/users", headers=headers,
+                                        params={**params, "limit": 2, **({"cursor": cursor} if cursor else {})})
+            assert response.status_code == 200, response.text
+            body = response.json()
+            assert all("password" not in user and "_id" not in user for user in body["users"])
+            results += body["users"]
+            cursor = body["next_cursor"]
+            if cursor is None:
+                return results
+
+    newest_first = [user["email"] for user in await pages()]
+    assert newest_first == [f"user{index}@test.com" for index in range(4, -1, -1)] + [ADMIN_EMAIL]
+    assert [user["last_name"] for user in await pages(name="  DUP")] == ["Dupond", "Dupont", "Dupuis"]
+    assert [user["last_name"] for user in await pages(name="elie")] == ["Élie"]
+    assert [user["email"] for user in await pages(email="user", user_type="teacher")] == [
+        "user1@test.com", "user3@test.com",
+    ]
+    assert len(await pages(is_verified=False)) == 2
+
+    bad = await client.get("/api/admin/users", headers=headers, params={"cursor": "bm90LWEtY3Vyc29y"})
+    assert bad.status_code == 400
+
+
+async def test_admin_routes_reject_non_admins(client):
+    parent = await register(client, "parent@test.com")
+    headers = auth(parent["token"])
+
+    assert (await client.get("/api/admin/stats", headers=headers)).status_code == 403
+    assert (await client.get("/api/admin/pedagogical-sheets", headers=headers)).status_code == 403
+    assert (await client.delete("/api/admin/pedagogical-sheets/x", headers=headers)).status_code == 403
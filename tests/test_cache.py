@@ -0,0 +1,78 @@
+"""Per-process TTL cache and its use by the repositories."""
+import pytest
+
+import metrics
+from cache import MISSING, TTLCache, freeze
+from memory_store import MemoryDatabase
+from repositories import Repositories
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("cache.time.monotonic", lambda: now[0])
+    cache = TTLCache("test", ttl=10)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    now[0] += 11
+    assert cache.get("a") is MISSING
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache("test", ttl=60, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+
+
+def test_zero_ttl_disables_the_cache():
+    cache = TTLCache("test", ttl=0)
+    cache.set("a", 1)
+
+    assert cache.get("a") is MISSING
+
+
+def test_lookups_are_counted():
+    cache = TTLCache("counted", ttl=60)
+    cache.get("a")
+    cache.set("a", 1)
+    cache.get("a")
+
+    assert metrics.CACHE_LOOKUPS.value("counted", "miss") == 1
+    assert metrics.CACHE_LOOKUPS.value("counted", "hit") == 1
+
+
+def test_freeze_ignores_key_order():
+    assert freeze({"a": 1, "b": False}) == freeze({"b": False, "a": 1})
+
+
+async def test_user_updates_invalidate_cached_user():
+    repos = Repositories(MemoryDatabase(), user_cache_ttl=60)
+    await repos.users.insert({"id": "u1", "email": "a@test.com", "is_premium": False})
+    assert (await repos.users.get_by_id("u1"))["is_premium"] is False
+
+    await repos.users.update_by_id("u1", {"is_premium": True})
+    assert (await repos.users.get_by_id("u1"))["is_premium"] is True
+    await repos.users.update_by_email("a@test.com", {"is_premium": False})
+    assert (await repos.users.get_by_id("u1"))["is_premium"] is False
+
+
+async def test_sheet_writes_invalidate_catalog():
+    repos = Repositories(MemoryDatabase(), catalog_cache_ttl=60)
+    assert await repos.sheets.list({}, 10) == []
+
+    await repos.sheets.insert({"id": "s1", "title": "Fiche"})
+
+    assert [sheet["id"] for sheet in await repos.sheets.list({}, 10)] == ["s1"]
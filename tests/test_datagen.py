@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from datagen import TEACHER, VERIFIED, generate_sheets, generate_users, generate_verifications
+from server import is_sample_sheet
+
+NOW = datetime(2025, 9, 1)
+
+
+def test_generation_is_deterministic():
+    first = list(generate_users(7, 200, bytearray(200), "hash", NOW))
+    second = list(generate_users(7, 200, bytearray(200), "hash", NOW))
+    other_seed = list(generate_users(8, 200, bytearray(200), "hash", NOW))
+
+    assert first == second
+    assert first != other_seed
+    assert len({user["email"] for user in first}) == 200
+
+
+def test_user_tiers_and_verifications_are_consistent():
+    flags = bytearray(5000)
+    users = list(generate_users(1, 5000, flags, "hash", NOW))
+    teachers = [user for user in users if user["user_type"] == "teacher"]
+
+    assert 0.15 < len(teachers) / len(users) < 0.25
+    assert not any(user["is_premium"] for user in teachers)
+
+    verifications = list(generate_verifications(1, flags, NOW))
+    teacher_ids = {user["id"] for user in teachers}
+    verified_ids = {user["id"] for user in teachers if user["is_verified"]}
+    assert {v["user_id"] for v in verifications} <= teacher_ids
+    assert {v["user_id"] for v in verifications if v["status"] == "approved"} == verified_ids
+    assert sum(1 for f in flags if f & TEACHER and f & VERIFIED) == len(verified_ids)
+
+
+def test_sheets_cover_levels_and_subjects():
+    sheets = list(generate_sheets(3, 2000, NOW))
+
+    assert len({sheet["level"] for sheet in sheets}) == 12
+    assert len({sheet["subject"] for sheet in sheets}) == 10
+    assert len({sheet["id"] for sheet in sheets}) == 2000
+    # Their files are placeholders, which storage reconciliation does not report missing
+    assert all(is_sample_sheet(sheet) for sheet in sheets)
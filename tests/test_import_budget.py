@@ -0,0 +1,55 @@
+"""Cold-start budget: what a fresh worker pays to import the API."""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from importtime import BACKEND_DIR, measure, parse_importtime, subtree
+
+# Generous enough for a loaded CI machine; tighten with IMPORT_BUDGET_MS
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "2500"))
+# Heavy or rarely used packages that must only be imported on first use
+LAZY_MODULES = ["pandas", "numpy", "boto3", "jose", "PIL", "pypdf", "aiosmtpd", "uvicorn", "httpx"]
+
+
+def imported_modules(env: dict) -> set:
+    result = subprocess.run(
+        [sys.executable, "-c", "import json, sys, server; print(json.dumps(sorted(sys.modules)))"],
+        cwd=BACKEND_DIR, env={**os.environ, **env}, capture_output=True, text=True, check=True,
+    )
+    return set(json.loads(result.stdout))
+
+
+def test_parse_importtime_tracks_depth():
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   child\n"
+        "import time:       300 |        420 | parent\n"
+    )
+
+    records = parse_importtime(output)
+
+    assert [(r.name, r.self_us, r.cumulative_us, r.depth) for r in records] == [
+        ("child", 120, 120, 1), ("parent", 300, 420, 0),
+    ]
+    assert subtree(records, "parent") == records
+
+
+def test_server_import_stays_within_budget():
+    records = subtree(measure("server", {"REPOSITORY_BACKEND": "mongo"}), "server")
+
+    assert records[-1].cumulative_us / 1000 < IMPORT_BUDGET_MS
+
+
+@pytest.mark.parametrize("backend", ["mongo", "memory"])
+def test_heavy_dependencies_are_not_imported_eagerly(backend):
+    modules = imported_modules({"REPOSITORY_BACKEND": backend})
+
+    assert not modules & set(LAZY_MODULES)
+    # Only the selected repository backend's driver is loaded
+    if backend == "mongo":
+        assert "memory_store" not in modules
+    else:
+        assert "motor" not in modules
@@ -0,0 +1,133 @@
+"""Job queue claim/lease protocol, retries and dead letters."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from memory_store import MemoryDatabase
+from repositories import Repositories
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def queue():
+    return Repositories(MemoryDatabase()).jobs
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(jobs, "HANDLERS", {})
+    monkeypatch.setattr(jobs, "LEASES", {})
+
+    @jobs.handler("ok")
+    async def ok(payload):
+        calls.append(payload)
+
+    @jobs.handler("boom")
+    async def boom(payload):
+        raise RuntimeError("smtp down")
+
+    return calls
+
+
+async def test_claimed_job_is_leased_to_one_worker(queue):
+    await queue.enqueue("ok", {"n": 1})
+
+    job = await queue.claim("w1", lease_seconds=60)
+
+    assert job["status"] == "running" and job["worker"] == "w1" and job["attempts"] == 1
+    assert await queue.claim("w2", lease_seconds=60) is None
+
+
+async def test_expired_lease_is_reclaimed_and_stale_ack_ignored(queue):
+    await queue.enqueue("ok", {})
+    stale = await queue.claim("w1", lease_seconds=60)
+    await queue.collection.update_one({"id": stale["id"]}, {"$set": {"lease_until": datetime.utcnow()}})
+
+    job = await queue.claim("w2", lease_seconds=60)
+
+    assert job["worker"] == "w2" and job["attempts"] == 2
+    assert not await queue.complete(stale)
+    assert await queue.complete(job)
+
+
+async def test_future_jobs_are_not_due(queue):
+    await queue.enqueue("ok", {}, run_at=datetime.utcnow() + timedelta(minutes=5))
+
+    assert await queue.claim("w1", lease_seconds=60) is None
+
+
+async def test_pool_runs_handler_and_marks_done(queue, calls):
+    job_id = await queue.enqueue("ok", {"n": 1})
+    pool = jobs.JobWorkerPool(queue, concurrency=1)
+
+    assert await pool.run_once()
+    assert not await pool.run_once()
+
+    assert calls == [{"n": 1}]
+    assert (await queue.collection.find_one({"id": job_id}))["status"] == "done"
+
+
+async def test_long_handler_runs_under_its_own_lease(queue, calls):
+    leases = []
+
+    @jobs.handler("slow", lease_seconds=3600)
+    async def slow(payload):
+        leases.append((await queue.collection.find_one({"type": "slow"}))["lease_until"])
+        await asyncio.sleep(0.05)  # longer than the pool's lease below
+
+    await queue.enqueue("slow", {})
+    pool = jobs.JobWorkerPool(queue, concurrency=1, lease_seconds=0.01)
+
+    assert await pool.run_once()
+
+    assert leases[0] > datetime.utcnow() + timedelta(minutes=59)
+    assert (await queue.collection.find_one({"type": "slow"}))["status"] == "done"
+
+
+async def test_failures_back_off_then_dead_letter(queue, calls):
+    job_id = await queue.enqueue("boom", {}, max_attempts=2)
+    pool = jobs.JobWorkerPool(queue, concurrency=1)
+
+    await pool.run_once()
+    job = await queue.collection.find_one({"id": job_id})
+    assert job["status"] == "queued" and "smtp down" in job["last_error"]
+    assert job["run_at"] > datetime.utcnow()
+
+    await queue.collection.update_one({"id": job_id}, {"$set": {"run_at": datetime.utcnow()}})
+    await pool.run_once()
+
+    assert await queue.collection.find_one({"id": job_id}) is None
+    assert (await queue.counts())["dead"] == 1
+    assert await queue.requeue_dead(job_id)
+    assert (await queue.counts()) == {"queued": 1, "running": 0, "dead": 0}
+
+
+def test_backoff_grows_exponentially_up_to_the_cap():
+    delays = [jobs.backoff_delay(attempt, base=1, cap=10) for attempt in (1, 2, 3, 4, 10)]
+
+    assert 0.5 <= delays[0] <= 1 and 1 <= delays[1] <= 2 and 2 <= delays[2] <= 4 and 4 <= delays[3] <= 8
+    assert 5 <= delays[4] <= 10
+
+
+async def test_started_pool_picks_up_notified_jobs(queue, calls):
+    pool = jobs.JobWorkerPool(queue, concurrency=2, poll_seconds=30)
+    pool.start()
+    await queue.enqueue("ok", {"n": 2})
+    pool.notify()
+
+    for _ in range(100):
+        if calls:
+            break
+        await asyncio.sleep(0.01)
+    await pool.stop()
+
+    assert calls == [{"n": 2}]
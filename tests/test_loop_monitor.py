@@ -0,0 +1,23 @@
+import asyncio
+import time
+
+from loop_monitor import LoopLagMonitor
+
+
+def test_blocking_call_is_captured_with_its_stack():
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.3)  # blocks the loop
+        await asyncio.sleep(0.05)
+        monitor.stop()
+
+    asyncio.run(scenario())
+
+    assert len(monitor.stalls) == 1
+    stall = monitor.stalls[0]
+    assert "scenario" in stall["location"]
+    assert stall["duration_ms"] >= 200
+    assert any("time.sleep(0.3)" in line for line in stall["stack"])
@@ -0,0 +1,189 @@
+"""Upload type sniffing and the verification review-copy pipeline."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import media
+import server
+from memory_store import MemoryDatabase
+
+pytestmark = pytest.mark.anyio
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.parametrize("head,content_type", [
+    (b"\xff\xd8\xff\xe1\x00\x18Exif", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR", "image/png"),
+    (b"RIFF\x10\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (b"\x00\x00\x00\x18ftypheic\x00\x00", "image/heic"),
+    (b"%PDF-1.7\n%\xe2\xe3", "application/pdf"),
+    (b"GIF89a\x01\x00", "image/gif"),
+    (b"just some text", None),
+])
+def test_detect_type_reads_magic_bytes(head, content_type):
+    assert media.detect_type(head) == content_type
+
+
+def phone_photo(path, size=(4000, 3000)):
+    image = Image.new("RGB", size, "navy")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90° clockwise to display
+    exif[0x010F] = "PhoneMaker"
+    image.save(path, "JPEG", quality=95, exif=exif)
+
+
+def test_review_copy_is_upright_small_and_metadata_free(tmp_path):
+    source, destination = str(tmp_path / "photo.jpg"), str(tmp_path / "review.jpg")
+    phone_photo(source)
+
+    review = media.downscale_image(source, destination, max_side=1600)
+
+    assert (review["width"], review["height"]) == (1200, 1600)
+    with Image.open(destination) as image:
+        assert image.format == "JPEG"
+        assert not image.getexif() and "icc_profile" not in image.info
+    assert review["bytes"] < os.path.getsize(source)
+
+
+def test_transparent_png_is_flattened_on_white(tmp_path):
+    source, destination = str(tmp_path / "scan.png"), str(tmp_path / "review.jpg")
+    Image.new("RGBA", (100, 50), (0, 0, 0, 0)).save(source)
+
+    media.downscale_image(source, destination)
+
+    with Image.open(destination) as image:
+        assert image.getpixel((10, 10)) == (255, 255, 255)
+
+
+def test_concurrent_writers_of_one_image_do_not_collide(tmp_path):
+    source, destination = str(tmp_path / "photo.jpg"), str(tmp_path / "review.jpg")
+    phone_photo(source, size=(800, 600))
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: media.downscale_image(source, destination), range(8)))
+
+    assert sorted(os.listdir(tmp_path)) == ["photo.jpg", "review.jpg"]
+    with Image.open(destination) as image:
+        assert image.size == (600, 800)
+
+
+async def test_verification_job_replaces_photo_with_review_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "VERIFICATIONS_DIR", str(tmp_path / "verifications"))
+    monkeypatch.setattr(media, "COLD_STORAGE_DIR", str(tmp_path / "cold"))
+    monkeypatch.setattr(server, "media_pool", ThreadPoolExecutor(1))
+    previous = server.db
+    server.use_database(MemoryDatabase())
+    os.makedirs(server.VERIFICATIONS_DIR)
+    upload = os.path.join(server.VERIFICATIONS_DIR, "abc_carte.jpg")
+    phone_photo(upload)
+    await server.repos.verifications.insert({
+        "id": "v1", "user_id": "u1", "document_url": upload, "status": "pending",
+    })
+    try:
+        for _ in range(2):  # delivery is at least once
+            await server.process_verification_document({"verification_id": "v1"})
+        verification = await server.repos.verifications.get("v1")
+    finally:
+        server.use_database(previous)
+
+    assert verification["content_type"] == "image/jpeg"
+    assert verification["document_url"] == os.path.join(server.VERIFICATIONS_DIR, "v1_review.jpg")
+    assert verification["original_url"] == str(tmp_path / "cold" / "verifications" / "abc_carte.jpg")
+    assert not os.path.exists(upload) and os.path.exists(verification["original_url"])
+    assert verification["review_bytes"] < verification["original_bytes"]
+
+
+async def test_pdf_upload_moves_to_cold_storage_as_is(tmp_path, monkeypatch):
+    monkeypatch.setattr(media, "COLD_STORAGE_DIR", str(tmp_path / "cold"))
+    previous = server.db
+    server.use_database(MemoryDatabase())
+    upload = str(tmp_path / "diplome.pdf")
+    with open(upload, "wb") as f:
+        f.write(b"%PDF-1.4\n" + b"0" * 100)
+    await server.repos.verifications.insert({"id": "v2", "user_id": "u2", "document_url": upload})
+    try:
+        await server.process_verification_document({"verification_id": "v2"})
+        verification = await server.repos.verifications.get("v2")
+    finally:
+        server.use_database(previous)
+
+    assert verification["content_type"] == "application/pdf"
+    archived = str(tmp_path / "cold" / "verifications" / "diplome.pdf")
+    assert verification["document_url"] == verification["original_url"] == archived
+    assert not os.path.exists(upload) and os.path.getsize(archived) == verification["original_bytes"]
+
+
+def text_pdf(text: str) -> bytes:
+    """A one-page PDF showing `text` in Helvetica."""
+    stream = f"BT /F1 24 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+
+def test_pdf_preview_has_text_and_thumbnail(tmp_path):
+    pytest.importorskip("pypdf")
+    pytest.importorskip("pypdfium2")
+    source, thumbnail = str(tmp_path / "fiche.pdf"), str(tmp_path / "thumb.jpg")
+    with open(source, "wb") as f:
+        f.write(text_pdf("Les fractions au CM1"))
+
+    preview = media.sheet_preview(source, "application/pdf", thumbnail)
+
+    assert "Les fractions au CM1" in preview["text"] and preview["page_count"] == 1
+    with Image.open(thumbnail) as image:
+        assert max(image.size) == media.THUMBNAIL_SIDE and image.height > image.width
+
+
+async def test_sheet_upload_gets_a_cached_preview(tmp_path, monkeypatch):
+    pytest.importorskip("pypdfium2")
+    monkeypatch.setattr(server, "UPLOADS_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(media, "PREVIEWS_DIR", str(tmp_path / "previews"))
+    monkeypatch.setattr(server, "media_pool", ThreadPoolExecutor(1))
+    calls = []
+    sheet_preview = media.sheet_preview
+    monkeypatch.setattr(media, "sheet_preview", lambda *args: calls.append(args) or sheet_preview(*args))
+    previous = server.db
+    server.use_database(MemoryDatabase())
+    os.makedirs(server.UPLOADS_DIR)
+    content = text_pdf("Le cycle de la pluie")
+    for index in range(2):  # the same file uploaded twice
+        with open(os.path.join(server.UPLOADS_DIR, f"s{index}.pdf"), "wb") as f:
+            f.write(content)
+        await server.repos.sheets.insert({
+            "id": f"s{index}", "file_url": f"/api/files/s{index}.pdf", "content_hash": "ab" * 32,
+            "is_premium": False, "is_teacher_only": False,
+        })
+    try:
+        for sheet_id in ("s0", "s1", "s1"):
+            await server.process_sheet_document({"sheet_id": sheet_id})
+        sheets = await server.repos.sheets.list({}, 10)
+        artefacts = await server.repos.previews.get("ab" * 32)
+    finally:
+        server.use_database(previous)
+
+    assert len(calls) == 1
+    assert {sheet["preview"]["url"] for sheet in sheets} == {f"/api/previews/{'ab' * 32}.jpg"}
+    assert all("text" not in sheet["preview"] for sheet in sheets)
+    assert "cycle de la pluie" in artefacts["text"]
+    assert os.path.exists(os.path.join(media.PREVIEWS_DIR, f"{'ab' * 32}.jpg"))
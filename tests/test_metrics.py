@@ -0,0 +1,40 @@
+from metrics import Counter, Histogram, Registry
+
+
+def test_counter_renders_labels():
+    registry = Registry()
+    requests_total = Counter("requests_total", "Requests.", ("route", "status"), registry=registry)
+    requests_total.inc("/api/health", "200")
+    requests_total.inc("/api/health", "200")
+    requests_total.inc("/api/files/{filename}", "404")
+
+    text = registry.render()
+
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/api/health",status="200"} 2' in text
+    assert 'requests_total{route="/api/files/{filename}",status="404"} 1' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = Histogram("latency_seconds", "Latency.", ("route",), registry=registry, buckets=(0.1, 1.0))
+    latency.observe(0.05, "/a")
+    latency.observe(0.1, "/a")
+    latency.observe(0.5, "/a")
+    latency.observe(3.0, "/a")
+
+    text = registry.render()
+
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="1"} 3' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{route="/a"} 4' in text
+    assert latency.count("/a") == 4
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    counter = Counter("escaped_total", "Escaping.", ("value",), registry=registry)
+    counter.inc('a"b\\c')
+
+    assert 'escaped_total{value="a\\"b\\\\c"} 1' in registry.render()
@@ -0,0 +1,154 @@
+"""Email outbox: templates, batch claiming and SMTP delivery against aiosmtpd."""
+import asyncio
+import os
+import socket
+import time
+
+import pytest
+from aiosmtpd.controller import Controller
+
+import outbox
+from memory_store import MemoryDatabase
+from repositories import Repositories
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def repository():
+    return Repositories(MemoryDatabase()).outbox
+
+
+class Mailbox:
+    """aiosmtpd handler keeping delivered messages and rejecting bounce@ addresses."""
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("bounce@"):
+            return "550 5.1.1 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos[0], envelope.content.decode()))
+        return "250 Message accepted"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    mailbox = Mailbox()
+    controller = Controller(mailbox, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield controller, mailbox
+    controller.stop()
+
+
+def reset_message(to: str) -> dict:
+    return outbox.render_message("password_reset", to, reset_link=f"https://example.test/reset?to={to}")
+
+
+def test_template_renders_link_into_compiled_body():
+    message = reset_message("a@test.com")
+
+    assert message["subject"].startswith("Réinitialisation de mot de passe")
+    assert "https://example.test/reset?to=a@test.com" in message["body"]
+    assert not message["body"].startswith(" ")
+
+
+async def test_claimed_batch_is_not_claimed_twice(repository):
+    await repository.enqueue([reset_message(f"user{i}@test.com") for i in range(5)])
+
+    first = await repository.claim_batch("w1", limit=3, lease_seconds=60)
+    second = await repository.claim_batch("w2", limit=3, lease_seconds=60)
+
+    assert len(first) == 3 and len(second) == 2
+    assert not {m["id"] for m in first} & {m["id"] for m in second}
+    assert await repository.claim_batch("w3", limit=3, lease_seconds=60) == []
+
+
+async def test_expired_claim_cannot_mark_messages_sent(repository):
+    await repository.enqueue([reset_message("a@test.com")])
+    [stale] = await repository.claim_batch("w1", limit=1, lease_seconds=-1)  # its lease has run out
+    [current] = await repository.claim_batch("w2", limit=1, lease_seconds=60)
+
+    await repository.mark_sent(stale["batch"], [stale["id"]])
+    assert (await repository.counts())["sending"] == 1
+
+    await repository.mark_sent(current["batch"], [current["id"]])
+    assert (await repository.counts())["sent"] == 1
+
+
+async def test_file_sink_keeps_one_file_per_message(repository, tmp_path):
+    await repository.enqueue([reset_message("same@test.com"), reset_message("same@test.com")])
+    dispatcher = outbox.OutboxDispatcher(repository, outbox.FileSink(str(tmp_path)), rate=0)
+
+    assert await dispatcher.dispatch_once() == 2
+
+    files = os.listdir(tmp_path)
+    assert len(files) == 2
+    assert "To: same@test.com" in (tmp_path / files[0]).read_text()
+    assert (await repository.counts())["sent"] == 2
+
+
+async def test_smtp_batches_reuse_pooled_connections(repository, smtp_server):
+    controller, mailbox = smtp_server
+    transport = outbox.SMTPPool(controller.hostname, controller.port, size=2, timeout=5)
+    dispatcher = outbox.OutboxDispatcher(repository, transport, batch_size=10, rate=0)
+    await repository.enqueue([reset_message(f"user{i}@test.com") for i in range(20)])
+
+    assert await dispatcher.dispatch_once() == 10
+    assert await dispatcher.dispatch_once() == 10
+    await dispatcher.stop()
+
+    assert len(mailbox.messages) == 20
+    assert transport.connections_opened == 2
+    assert (await repository.counts())["sent"] == 20
+
+
+async def test_permanent_rejection_fails_only_that_message(repository, smtp_server):
+    controller, mailbox = smtp_server
+    transport = outbox.SMTPPool(controller.hostname, controller.port, size=1, timeout=5)
+    dispatcher = outbox.OutboxDispatcher(repository, transport, rate=0)
+    await repository.enqueue([reset_message("ok@test.com"), reset_message("bounce@test.com")])
+
+    await dispatcher.dispatch_once()
+    await dispatcher.stop()
+
+    assert [to for to, _ in mailbox.messages] == ["ok@test.com"]
+    failed = await repository.collection.find_one({"to": "bounce@test.com"})
+    assert failed["status"] == "failed" and "550" in failed["last_error"]
+
+
+async def test_unreachable_server_schedules_a_retry(repository):
+    transport = outbox.SMTPPool("127.0.0.1", free_port(), size=1, timeout=1)
+    dispatcher = outbox.OutboxDispatcher(repository, transport, rate=0)
+    await repository.enqueue([reset_message("later@test.com")])
+
+    await dispatcher.dispatch_once()
+
+    message = await repository.collection.find_one({"to": "later@test.com"})
+    assert message["status"] == "queued" and message["attempts"] == 1
+    assert "connect failed" in message["last_error"]
+    assert await repository.claim_batch("w", limit=10, lease_seconds=60) == []
+
+
+async def test_throttle_paces_messages():
+    throttle = outbox.Throttle(rate=200)
+    start = time.monotonic()
+
+    await asyncio.gather(throttle.acquire(10), throttle.acquire(10), throttle.acquire(10))
+
+    assert time.monotonic() - start >= 0.09
@@ -0,0 +1,23 @@
+"""bcrypt cost calibration and the upgrade policy."""
+import passwords
+
+
+def test_calibrate_picks_highest_cost_within_target(monkeypatch):
+    # 10 ms at the floor cost, doubling per round
+    monkeypatch.setattr(passwords, "time_hash", lambda rounds, samples=3: 0.010 * 2 ** (rounds - 10))
+
+    assert passwords.calibrate(target_ms=100, min_rounds=10) == 13
+    assert passwords.calibrate(target_ms=5, min_rounds=10) == 10
+    assert passwords.calibrate(target_ms=10_000, min_rounds=10, max_rounds=14) == 14
+
+
+def test_context_upgrades_only_weaker_hashes():
+    weaker = passwords.build_context(4).hash("secret")
+    current = passwords.build_context(5)
+    stronger = passwords.build_context(6).hash("secret")
+
+    assert current.needs_update(weaker)
+    assert not current.needs_update(current.hash("secret"))
+    assert not current.needs_update(stronger)
+    valid, new_hash = current.verify_and_update("secret", weaker)
+    assert valid and new_hash.startswith("$2b$05$")
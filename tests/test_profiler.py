@@ -0,0 +1,33 @@
+import sys
+
+from profiler import collapse_stack, flamegraph_html, format_collapsed
+
+
+def _inner():
+    return collapse_stack(sys._getframe())
+
+
+def _outer():
+    return _inner()
+
+
+def test_collapse_stack_orders_outer_to_inner():
+    stack = _outer()
+    labels = stack.split(";")
+
+    assert labels[-1].startswith("_inner (test_profiler.py:")
+    assert labels[-2].startswith("_outer (test_profiler.py:")
+
+
+def test_format_collapsed_is_sorted_and_counted():
+    text = format_collapsed([("cpu;b", 2), ("cpu;a", 5)])
+
+    assert text == "cpu;a 5\ncpu;b 2\n"
+
+
+def test_flamegraph_html_escapes_frames():
+    page = flamegraph_html([("cpu;/api/x;<lambda> (server.py:1)", 3), ("mongo;awaiting mongo", 1)])
+
+    assert "&lt;lambda&gt;" in page
+    assert "<lambda>" not in page
+    assert "75.0%" in page
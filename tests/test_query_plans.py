@@ -0,0 +1,280 @@
+"""Winning-plan regression tests for every query shape used by server.py.
+
+Each shape is explained with executionStats against a seeded database that
+carries the indexes from ``server.INDEXES``. A plan passes when it contains
+no COLLSCAN, uses an index, and examines no more keys than the documents it
+returns (plus a little slack for index-bound seeks). A sorted query must
+also take its order from an index: a blocking SORT stage fails it, as a
+limited query that lost its sort index would scan every match to sort them.
+
+Runs against MONGO_URL (default mongodb://localhost:27017) and skips when
+no mongod answers, unless REQUIRE_MONGO=1 (set by the tests workflow):
+
+    REQUIRE_MONGO=1 python -m pytest -q tests/test_query_plans.py
+"""
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+import server
+from repositories import USER_TYPES, name_key
+from slow_queries import plan_stages, winning_plan
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+
+LEVELS = ["PS", "MS", "GS", "CP", "CE1", "CE2", "CM1", "CM2", "6e", "5e", "4e", "3e"]
+SUBJECTS = [
+    "mathématiques", "français", "sciences", "découverte du monde",
+    "histoire", "géographie", "anglais", "arts plastiques",
+]
+USER_COUNT = 3000
+SHEET_COUNT = 3000
+RESET_COUNT = 500
+VERIFICATION_COUNT = 500
+# Keys examined beyond the matching documents when bounds skip values
+SEEK_SLACK = 30
+INDEX_STAGES = {"IXSCAN", "COUNT_SCAN", "IDHACK", "EXPRESS_IXSCAN"}
+
+
+def seed(database):
+    rng = random.Random(1234)
+    base = datetime(2024, 1, 1)
+
+    users = []
+    for i in range(USER_COUNT):
+        user_type = "teacher" if rng.random() < 0.3 else "parent"
+        users.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "email": f"user{i}@example.fr",
+            "password": "x",
+            "first_name": "Prénom",
+            "last_name": f"Nom{i % 300}",
+            "name_key": name_key("Prénom", f"Nom{i % 300}"),
+            "user_type": user_type,
+            "is_premium": user_type == "parent" and rng.random() < 0.2,
+            "is_verified": user_type == "parent" or rng.random() < 0.5,
+            "is_admin": False,
+            "created_at": base + timedelta(minutes=i),
+        })
+    database.users.insert_many(users)
+
+    database.pedagogical_sheets.insert_many([
+        {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "title": f"Fiche {i}",
+            "description": "Description",
+            "level": rng.choice(LEVELS),
+            "subject": rng.choice(SUBJECTS),
+            "is_premium": rng.random() < 0.4,
+            "is_teacher_only": rng.random() < 0.3,
+            "file_url": f"/api/files/{i}.pdf",
+            "created_at": base + timedelta(minutes=i),
+        }
+        for i in range(SHEET_COUNT)
+    ])
+
+    now = datetime.utcnow()
+    database.password_resets.insert_many([
+        {
+            "id": str(uuid.uuid4()),
+            "email": users[i]["email"],
+            "token": f"token-{i}",
+            "used": i % 5 == 0,
+            "created_at": now,
+            "expires_at": now + timedelta(hours=1),
+        }
+        for i in range(RESET_COUNT)
+    ])
+
+    teachers = [user for user in users if user["user_type"] == "teacher"]
+    database.teacher_verifications.insert_many([
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": teachers[i % len(teachers)]["id"],
+            "document_url": f"/tmp/verifications/{i}.pdf",
+            "status": rng.choice(["pending", "approved", "rejected"]),
+            "created_at": now,
+        }
+        for i in range(VERIFICATION_COUNT)
+    ])
+    return users
+
+
+@pytest.fixture(scope="module")
+def plan_db():
+    client = MongoClient(MONGO_URL, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as exc:
+        if os.getenv("REQUIRE_MONGO"):
+            raise
+        pytest.skip(f"no mongod reachable at {MONGO_URL}: {exc}")
+
+    name = f"query_plans_{uuid.uuid4().hex[:8]}"
+    database = client[name]
+    seed(database)
+    for collection_name, indexes in server.INDEXES.items():
+        database[collection_name].create_indexes(indexes)
+    yield database
+    client.drop_database(name)
+    client.close()
+
+
+def explain_find(collection, filter, projection=None, sort=None, limit=0):
+    command = {"find": collection.name, "filter": filter}
+    if projection:
+        command["projection"] = projection
+    if sort:
+        command["sort"] = dict(sort)
+    if limit:
+        command["limit"] = limit
+    return collection.database.command({"explain": command, "verbosity": "executionStats"})
+
+
+def assert_indexed(collection, filter, allow_sort=False, **find_options):
+    explain = explain_find(collection, filter, **find_options)
+    stages = plan_stages(winning_plan(explain))
+    stats = explain["executionStats"]
+    matching = collection.count_documents(filter)
+    limit = find_options.get("limit") or matching
+
+    assert "COLLSCAN" not in stages, f"{filter} uses a collection scan: {stages}"
+    assert INDEX_STAGES & set(stages), f"{filter} uses no index: {stages}"
+    assert stats["nReturned"] == min(matching, limit)
+    assert stats["totalKeysExamined"] <= stats["nReturned"] + SEEK_SLACK, (
+        f"{filter} examined {stats['totalKeysExamined']} keys to return {stats['nReturned']} documents ({stages})"
+    )
+    if find_options.get("sort") and not allow_sort:
+        assert "SORT" not in stages, f"{filter} sorts in memory: {stages}"
+    assert stats["totalDocsExamined"] <= max(stats["totalKeysExamined"], matching)
+
+
+def test_user_lookup_by_email(plan_db):
+    assert_indexed(plan_db.users, {"email": "user42@example.fr"}, limit=1)
+
+
+def test_user_lookup_by_id(plan_db):
+    user_id = plan_db.users.find_one({"email": "user7@example.fr"})["id"]
+    assert_indexed(plan_db.users, {"id": user_id}, limit=1)
+
+
+ADMIN_FILTERS = [
+    {},
+    {"user_type": ["teacher"]},
+    {"user_type": ["parent"], "is_premium": [True]},
+    {"user_type": ["teacher"], "is_verified": [False]},
+]
+
+
+@pytest.mark.parametrize("filters", ADMIN_FILTERS)
+def test_admin_user_listing(plan_db, filters):
+    # UserRepository.search turns every open filter into $in over all values
+    query = {
+        "user_type": {"$in": filters.get("user_type", list(USER_TYPES))},
+        "is_premium": {"$in": filters.get("is_premium", [False, True])},
+        "is_verified": {"$in": filters.get("is_verified", [False, True])},
+    }
+    assert_indexed(plan_db.users, query, sort=[("_id", -1)], limit=51)
+
+
+def test_admin_user_search_by_email_prefix(plan_db):
+    assert_indexed(plan_db.users, {"email": {"$regex": "^user12"}}, sort=[("email", 1)], limit=51)
+
+
+def test_admin_user_search_by_name_prefix(plan_db):
+    assert_indexed(plan_db.users, {"name_key": {"$regex": "^nom12"}}, sort=[("name_key", 1), ("id", 1)], limit=51)
+
+
+CATALOG_USERS = {
+    "free_parent": {"user_type": "parent", "is_premium": False, "is_verified": True},
+    "premium_parent": {"user_type": "parent", "is_premium": True, "is_verified": True},
+    "verified_teacher": {"user_type": "teacher", "is_premium": False, "is_verified": True},
+    "unverified_teacher": {"user_type": "teacher", "is_premium": False, "is_verified": False},
+}
+CATALOG_FILTERS = [(None, None), ("CP", None), (None, "mathématiques"), ("CP", "mathématiques")]
+
+
+@pytest.mark.parametrize("tier", sorted(CATALOG_USERS))
+@pytest.mark.parametrize("level,subject", CATALOG_FILTERS)
+def test_catalog_query(plan_db, tier, level, subject):
+    query = server.build_sheet_query(CATALOG_USERS[tier], level, subject)
+    assert_indexed(
+        plan_db.pedagogical_sheets, query,
+        projection={"_id": 0}, sort=server.CATALOG_SORT, limit=server.CATALOG_PAGE_SIZE,
+    )
+
+
+def test_catalog_search(plan_db):
+    query = server.build_sheet_query(CATALOG_USERS["free_parent"], None, None)
+    query["content_hash"] = {"$in": ["0" * 64, "1" * 64]}
+    # Sorted in memory, but only the files matched by the search (SEARCH_MATCH_LIMIT at most)
+    assert_indexed(
+        plan_db.pedagogical_sheets, query, allow_sort=True,
+        projection={"_id": 0}, sort=server.CATALOG_SORT, limit=server.CATALOG_PAGE_SIZE,
+    )
+
+
+def test_admin_catalog_listing(plan_db):
+    assert_indexed(
+        plan_db.pedagogical_sheets, {},
+        projection={"_id": 0}, sort=server.CATALOG_SORT, limit=1000,
+    )
+
+
+def test_sheet_lookup_by_id(plan_db):
+    sheet_id = plan_db.pedagogical_sheets.find_one({}, sort=[("created_at", 1)])["id"]
+    assert_indexed(plan_db.pedagogical_sheets, {"id": sheet_id}, limit=1)
+
+
+def test_password_reset_lookup(plan_db):
+    assert_indexed(plan_db.password_resets, {
+        "email": "user1@example.fr",
+        "token": "token-1",
+        "used": False,
+        "expires_at": {"$gt": datetime.utcnow()},
+    }, limit=1)
+
+
+def test_password_reset_upsert_by_email(plan_db):
+    assert_indexed(plan_db.password_resets, {"email": "user3@example.fr"})
+
+
+def test_pending_verification_lookup(plan_db):
+    user_id = plan_db.teacher_verifications.find_one({})["user_id"]
+    assert_indexed(
+        plan_db.teacher_verifications, {"user_id": user_id, "status": {"$in": ["pending", "in_review"]}}, limit=1
+    )
+
+
+def test_review_queue_claim(plan_db):
+    assert_indexed(plan_db.teacher_verifications, {"$or": [
+        {"status": "pending"},
+        {"status": "in_review", "lease_until": {"$lte": datetime.utcnow()}},
+    ]}, sort=[("created_at", 1)], limit=1)
+
+
+def test_storage_reconciliation_lookups(plan_db):
+    names = [f"/api/files/{i}.pdf" for i in range(0, 2000, 2)]
+    assert_indexed(plan_db.pedagogical_sheets, {"file_url": {"$in": names}}, projection={"_id": 0, "file_url": 1})
+    paths = [f"/tmp/verifications/{i}.pdf" for i in range(0, 400, 2)]
+    assert_indexed(plan_db.teacher_verifications, {
+        "$or": [{"document_url": {"$in": paths}}, {"original_url": {"$in": paths}}],
+    })
+
+
+@pytest.mark.parametrize("collection_name,filter", [
+    ("users", {"user_type": "parent"}),
+    ("users", {"user_type": "teacher"}),
+    ("users", {"is_premium": True}),
+    ("users", {"user_type": "teacher", "is_verified": True}),
+    ("pedagogical_sheets", {"is_premium": True}),
+    ("pedagogical_sheets", {"is_teacher_only": True}),
+])
+def test_stats_counts(plan_db, collection_name, filter):
+    # count_documents runs the same filter as a $match; its plan matches find's
+    assert_indexed(plan_db[collection_name], filter, projection={"_id": 0})
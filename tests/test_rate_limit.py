@@ -0,0 +1,175 @@
+"""Token buckets, the auth rate-limit middleware and cross-worker sync."""
+from datetime import datetime
+
+import httpx
+import pytest
+from starlette.responses import JSONResponse
+
+import rate_limit
+import server
+from memory_store import MemoryDatabase
+from repositories import RateLimitRepository
+
+pytestmark = pytest.mark.anyio
+
+LOGIN = "/api/auth/login"
+RULES = {LOGIN: (rate_limit.Limit("ip", 5, 1.0), rate_limit.Limit("email", 2, 0.5))}
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_email_bucket_empties_and_refills():
+    clock = FakeClock()
+    limiter = rate_limit.RateLimiter(RULES, clock=clock)
+
+    assert limiter.check(LOGIN, "1.2.3.4", "a@test.com") == (0.0, None)
+    assert limiter.check(LOGIN, "1.2.3.4", "a@test.com") == (0.0, None)
+    wait, scope = limiter.check(LOGIN, "1.2.3.4", "a@test.com")
+    assert scope == "email" and wait == pytest.approx(2.0)
+
+    # Other accounts from the same address still pass
+    assert limiter.check(LOGIN, "1.2.3.4", "b@test.com") == (0.0, None)
+    clock.now += 2
+    assert limiter.check(LOGIN, "1.2.3.4", "a@test.com") == (0.0, None)
+
+
+def test_rejected_request_takes_no_token():
+    clock = FakeClock()
+    limiter = rate_limit.RateLimiter(RULES, clock=clock)
+    for index in range(5):
+        assert limiter.check(LOGIN, "1.2.3.4", f"user{index}@test.com")[0] == 0
+    assert limiter.check(LOGIN, "1.2.3.4", "victim@test.com")[1] == "ip"
+
+    # The IP rejection left the victim's email bucket untouched
+    assert limiter.check(LOGIN, "5.6.7.8", "victim@test.com") == (0.0, None)
+    assert limiter.check(LOGIN, "5.6.7.8", "victim@test.com") == (0.0, None)
+
+
+def test_bucket_table_is_bounded():
+    limiter = rate_limit.RateLimiter(RULES, max_keys=10, clock=FakeClock())
+    for index in range(50):
+        limiter.check(LOGIN, f"10.0.0.{index}", None)
+    assert len(limiter.buckets) == 10
+
+
+async def test_sync_shares_consumption_between_workers():
+    repository = RateLimitRepository(MemoryDatabase().rate_limits)
+    clock = FakeClock()
+    first = rate_limit.RateLimiter(RULES, clock=clock)
+    second = rate_limit.RateLimiter(RULES, clock=clock)
+
+    assert first.check(LOGIN, "", "a@test.com")[0] == 0
+    assert first.check(LOGIN, "", "a@test.com")[0] == 0
+    await first.sync(repository)
+    # Locally the second worker still has a full bucket and admits one more
+    assert second.check(LOGIN, "", "a@test.com")[0] == 0
+    await second.sync(repository)
+
+    wait, scope = second.check(LOGIN, "", "a@test.com")
+    assert scope == "email" and wait > 0
+    document = await repository.collection.find_one({"_id": f"{LOGIN}|email|a@test.com"})
+    assert document["tokens"] == pytest.approx(-1, abs=0.01)
+    assert document["version"] == 1
+
+
+async def test_merge_refills_from_last_update():
+    repository = RateLimitRepository(MemoryDatabase().rate_limits)
+    start = datetime(2024, 1, 1)
+    assert await repository.merge("key", 4, 5, 1.0, start) == 1
+    assert await repository.merge("key", 1, 5, 1.0, start.replace(second=2)) == 2
+    assert await repository.merge("key", 0, 5, 1.0, start.replace(minute=1)) == 5
+
+
+async def test_over_limit_login_rejected_before_handler(monkeypatch):
+    previous = server.db
+    server.use_database(MemoryDatabase())
+    server.rate_limiter.clear()
+    middleware = rate_limit.RateLimitMiddleware(server.app, rate_limit.RateLimiter(RULES), enabled=True)
+    lookups = []
+    get_by_email = server.repos.users.get_by_email
+
+    async def counted(email):
+        lookups.append(email)
+        return await get_by_email(email)
+
+    monkeypatch.setattr(server.repos.users, "get_by_email", counted)
+    transport = httpx.ASGITransport(app=middleware)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            credentials = {"email": " Who@Test.com", "password": "wrong"}
+            for _ in range(2):
+                assert (await client.post(LOGIN, json=credentials)).status_code == 401
+            response = await client.post(LOGIN, json=credentials)
+            assert response.status_code == 429
+            assert int(response.headers["Retry-After"]) >= 1
+            assert len(lookups) == 2
+            # Unlimited routes pass straight through
+            assert (await client.get("/api/health")).status_code == 200
+    finally:
+        server.use_database(previous)
+
+
+async def test_large_body_reaches_the_app_whole():
+    received = []
+
+    async def app(scope, receive, send):
+        more_body = True
+        while more_body:
+            message = await receive()
+            received.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+    chunks = [b'{"email": "big@test.com", "pad": "', b"x" * 10_000, b"y" * 10_000, b"z" * 10_000, b'"}']
+    messages = [{"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1}
+                for index, chunk in enumerate(chunks)]
+
+    async def receive():
+        return messages.pop(0)
+
+    middleware = rate_limit.RateLimitMiddleware(app, rate_limit.RateLimiter(RULES), enabled=True)
+    scope = {"type": "http", "method": "POST", "path": LOGIN, "client": ("10.0.0.1", 1234)}
+    await middleware(scope, receive, None)
+
+    assert b"".join(received) == b"".join(chunks)
+
+
+async def test_clients_behind_a_trusted_proxy_get_their_own_buckets():
+    from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+    async def app(scope, receive, send):
+        await JSONResponse({}, status_code=200)(scope, receive, send)
+
+    limiter = rate_limit.RateLimiter({LOGIN: (rate_limit.Limit("ip", 1, 0.01),)})
+    proxied = ProxyHeadersMiddleware(rate_limit.RateLimitMiddleware(app, limiter, enabled=True),
+                                     trusted_hosts="10.0.0.1")
+    transport = httpx.ASGITransport(app=proxied, client=("10.0.0.1", 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        statuses = [
+            (await client.post(LOGIN, json={}, headers={"X-Forwarded-For": address})).status_code
+            for address in ("203.0.113.1", "203.0.113.2", "203.0.113.1")
+        ]
+
+    assert statuses == [200, 200, 429]
+
+
+async def test_retry_after_rounds_up(monkeypatch):
+    limiter = rate_limit.RateLimiter(RULES)
+    monkeypatch.setattr(limiter, "check", lambda path, ip, email: (1.4, "ip"))
+    middleware = rate_limit.RateLimitMiddleware(JSONResponse({}), limiter, enabled=True)
+    transport = httpx.ASGITransport(app=middleware)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(LOGIN, json={})
+
+    # Waiting only 1 s would be refused again
+    assert response.status_code == 429 and response.headers["Retry-After"] == "2"
@@ -0,0 +1,67 @@
+import json
+import threading
+import time
+import types
+
+import slow_queries
+from slow_queries import SlowQueryRecorder, command_filter, plan_stages, query_shape, winning_plan
+
+
+def test_catalog_filters_share_a_shape_per_tier():
+    free_parent = {"level": "CP", "is_premium": False, "is_teacher_only": False}
+    other_level = {"is_teacher_only": False, "level": "CE1", "is_premium": False}
+    premium_parent = {"level": "CP", "is_teacher_only": False}
+
+    assert query_shape(free_parent) == query_shape(other_level)
+    assert query_shape(free_parent) != query_shape(premium_parent)
+    assert json.dumps(query_shape(free_parent), sort_keys=True) == (
+        '{"is_premium": "bool", "is_teacher_only": "bool", "level": "str"}'
+    )
+
+
+def test_operators_are_kept_in_shape():
+    shape = query_shape({"email": "a@b.fr", "used": False, "expires_at": {"$gt": 3}})
+
+    assert shape == {"email": "str", "expires_at": {"$gt": "int"}, "used": "bool"}
+
+
+def test_command_filter_per_command():
+    assert command_filter("find", {"find": "users", "filter": {"id": "x"}}) == {"id": "x"}
+    assert command_filter("aggregate", {"pipeline": [{"$match": {"a": 1}}, {"$group": {}}]}) == {"a": 1}
+    assert command_filter("delete", {"deletes": [{"q": {"email": "e"}, "limit": 0}]}) == {"email": "e"}
+    assert command_filter("insert", {"documents": [{}]}) == {}
+
+
+def test_collscan_is_found_in_nested_plan():
+    explain = {
+        "queryPlanner": {
+            "winningPlan": {"stage": "LIMIT", "inputStage": {"stage": "COLLSCAN"}},
+        }
+    }
+
+    assert plan_stages(winning_plan(explain)) == ["LIMIT", "COLLSCAN"]
+
+
+def test_concurrent_slow_queries_start_one_explain_worker(monkeypatch):
+    recorder = SlowQueryRecorder("mongodb://unused", explain=True)
+    started = []
+
+    class Worker:
+        def __init__(self, **kwargs):
+            time.sleep(0.01)  # widen the window between the check and the assignment
+
+        def start(self):
+            started.append(self)
+
+    monkeypatch.setattr(slow_queries, "threading", types.SimpleNamespace(Thread=Worker))
+    callers = [
+        threading.Thread(target=recorder._schedule_explain, args=(("db", "users", "find", str(i)), "db", {}))
+        for i in range(8)
+    ]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+
+    assert len(started) == 1
+    assert recorder._explain_queue.qsize() == 8
@@ -0,0 +1,162 @@
+"""Startup lease, idempotent seeding and warm-up across workers."""
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+import jobs
+import outbox
+import passwords
+import server
+from memory_store import MemoryDatabase
+from repositories import Repositories
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def database():
+    previous = server.db
+    database = MemoryDatabase()
+    server.use_database(database)
+    yield database
+    server.use_database(previous)
+
+
+async def test_lease_is_exclusive_until_released(database):
+    leases = Repositories(database).leases
+
+    assert await leases.acquire("job", "a", ttl=60)
+    assert not await leases.acquire("job", "b", ttl=60)
+    assert await leases.acquire("job", "a", ttl=60)
+
+    assert not await leases.release("job", "b")
+    assert await leases.release("job", "a")
+    assert await leases.acquire("job", "b", ttl=60)
+    assert (await leases.holder("job"))["owner"] == "b"
+
+
+async def test_expired_lease_can_be_taken_over(database):
+    leases = Repositories(database).leases
+    await leases.acquire("job", "crashed", ttl=60)
+    await database.leases.update_one({"_id": "job"}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}})
+
+    assert await leases.holder("job") is None
+    assert await leases.acquire("job", "b", ttl=60)
+
+
+async def test_concurrent_workers_seed_once(database):
+    await asyncio.gather(*(server.run_startup_tasks(poll_interval=0.001) for _ in range(4)))
+
+    assert await database.pedagogical_sheets.count_documents({}) == 5
+    assert await database.leases.count_documents({}) == 0
+
+
+async def test_later_workers_skip_completed_startup_work(database, monkeypatch):
+    calls = []
+    ensure_indexes = server.ensure_indexes
+    monkeypatch.setattr(server, "ensure_indexes", lambda: calls.append(1) or ensure_indexes())
+
+    for _ in range(3):
+        await server.run_startup_tasks()
+
+    assert calls == [1]
+    assert (await database.startup.find_one({"_id": "startup"}))["version"] == server.STARTUP_VERSION
+
+
+async def test_blocked_index_leaves_startup_unrecorded(database, monkeypatch):
+    monkeypatch.setattr(server, "missing_indexes", {})
+    await database.users.insert_many([{"id": f"u{i}", "email": "twice@test.com"} for i in range(2)])
+
+    await server.run_startup_tasks()
+
+    # The other users indexes are still built, and the next start retries
+    assert server.missing_indexes == {"users": ["email_unique"]}
+    assert "id_unique" in database.users._indexes and "email_unique" not in database.users._indexes
+    assert await database.startup.count_documents({}) == 0
+
+    await database.users.delete_one({"id": "u1"})
+    await server.run_startup_tasks()
+
+    assert server.missing_indexes == {}
+    assert (await database.startup.find_one({"_id": "startup"}))["version"] == server.STARTUP_VERSION
+
+
+async def test_startup_lease_is_renewed_while_running(database, monkeypatch):
+    monkeypatch.setattr(server, "STARTUP_LEASE_SECONDS", 0.06)
+    init_sample_data = server.init_sample_data
+    expiries = []
+
+    async def slow_seed():
+        for _ in range(3):
+            await asyncio.sleep(0.04)
+            expiries.append((await database.leases.find_one({"_id": server.STARTUP_LEASE}))["expires_at"])
+        await init_sample_data()
+
+    monkeypatch.setattr(server, "init_sample_data", slow_seed)
+    await server.run_startup_tasks()
+
+    # The lease outlived its 60 ms ttl, and each check saw it pushed further
+    assert expiries == sorted(expiries) and expiries[0] < expiries[-1]
+    assert await database.leases.count_documents({}) == 0
+
+
+async def test_reseeding_keeps_sample_ids(database, monkeypatch):
+    await server.run_startup_tasks()
+    first = await database.pedagogical_sheets.find_one({"file_url": "/api/files/sample_eau.pdf"})
+    await database.pedagogical_sheets.delete_many({})
+
+    monkeypatch.setattr(server, "STARTUP_VERSION", "next")  # a release changing the seed data
+    await server.run_startup_tasks()
+
+    again = await database.pedagogical_sheets.find_one({"file_url": "/api/files/sample_eau.pdf"})
+    assert again["id"] == first["id"]
+    assert await database.pedagogical_sheets.count_documents({}) == 5
+
+
+async def test_startup_backfills_name_keys_in_batches(database, monkeypatch):
+    monkeypatch.setattr(server, "NAME_KEY_BATCH", 2)
+    await database.users.insert_many([
+        {"id": f"u{i}", "email": f"u{i}@test.com", "first_name": "Zoé", "last_name": f"Nom {i}"}
+        for i in range(3)
+    ])
+    await server.run_startup_tasks()
+    await server.run_startup_tasks()  # a second worker starting
+    assert await database.jobs.count_documents({"type": "backfill_name_keys"}) == 1
+
+    pool = jobs.JobWorkerPool(server.repos.jobs)
+    while await pool.run_once():
+        pass
+
+    assert await database.users.count_documents({"name_key": {"$exists": False}}) == 0
+    assert (await database.users.find_one({"id": "u2"}))["name_key"] == "nom 2 zoe"
+
+
+async def test_warm_up_primes_caches_and_reports_ready(database, monkeypatch):
+    monkeypatch.setattr(server, "password_context", passwords.build_context(4))
+    monkeypatch.setattr(server, "BCRYPT_ROUNDS", "4")
+    monkeypatch.setattr(server, "readiness", {"ready": False, "warmup": {}})
+    monkeypatch.setattr(server, "LOOP_MONITOR_ENABLED", False)
+    monkeypatch.setattr(jobs, "JOB_WORKERS", 0)
+    monkeypatch.setattr(outbox, "OUTBOX_ENABLED", False)
+    # The user cache is opt-in
+    monkeypatch.setattr(server, "USER_CACHE_TTL", 30)
+    server.use_database(database)
+    await database.users.insert_one({"id": "u1", "email": "a@test.com"})
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.get("/api/ready")).status_code == 503
+
+        await server.startup_event()
+        response = await client.get("/api/ready")
+
+    assert response.status_code == 200
+    assert set(response.json()["warmup"]) == {"mongo_pool", "user_cache", "catalog_cache", "crypto", "models"}
+    assert len(server.repos.users.cache) == 1
+    assert len(server.repos.sheets.cache) == len(server.WARMUP_TIERS)
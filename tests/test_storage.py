@@ -0,0 +1,104 @@
+"""Storage reconciliation: orphans quarantined after the grace period, missing files reported."""
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+import media
+import server
+import storage
+import uploads
+from memory_store import MemoryDatabase
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    for module, name in [(server, "UPLOADS_DIR"), (server, "SAMPLE_FILES_DIR"), (server, "VERIFICATIONS_DIR"),
+                         (media, "COLD_STORAGE_DIR"), (uploads, "UPLOAD_PARTS_DIR"), (storage, "QUARANTINE_DIR")]:
+        monkeypatch.setattr(module, name, str(tmp_path / name.lower()))
+        os.makedirs(getattr(module, name))
+    previous = server.db
+    server.use_database(MemoryDatabase())
+    yield
+    server.use_database(previous)
+
+
+def touch(directory, name):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * 10)
+    return path
+
+
+def files(directory):
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+async def test_orphans_are_quarantined_and_missing_files_reported(dirs):
+    repos = server.repos
+    touch(server.UPLOADS_DIR, "kept.pdf")
+    touch(server.UPLOADS_DIR, "deleted.pdf")
+    touch(server.SAMPLE_FILES_DIR, "random.pdf")
+    kept_document = touch(server.VERIFICATIONS_DIR, "v1_diplome.pdf")
+    rejected_document = touch(server.VERIFICATIONS_DIR, "v2_diplome.pdf")
+    touch(uploads.UPLOAD_PARTS_DIR, "active.part")
+    touch(uploads.UPLOAD_PARTS_DIR, "abandoned.part")
+    for sheet_id, name in [("s1", "kept.pdf"), ("s2", "gone.pdf")]:
+        await repos.sheets.insert({"id": sheet_id, "file_url": f"/api/files/{name}"})
+    await repos.verifications.insert({"id": "v1", "document_url": kept_document, "status": "approved"})
+    await repos.verifications.insert({"id": "v2", "document_url": rejected_document, "status": "rejected"})
+    await repos.uploads.insert({"id": "active", "status": "uploading"})
+
+    report = await storage.reconcile(server.storage_areas(), server.storage_references(), grace=-60, batch_size=2)
+
+    assert files(server.UPLOADS_DIR) == ["kept.pdf"]
+    assert files(server.SAMPLE_FILES_DIR) == []
+    assert files(server.VERIFICATIONS_DIR) == ["v1_diplome.pdf"]
+    assert files(uploads.UPLOAD_PARTS_DIR) == ["active.part"]
+    assert files(os.path.join(storage.QUARANTINE_DIR, "sheets")) == ["deleted.pdf"]
+    assert files(os.path.join(storage.QUARANTINE_DIR, "verifications")) == ["v2_diplome.pdf"]
+    assert report.areas["sheets"].scanned == 2 and report.areas["sheets"].orphaned == 1
+    assert report.areas["upload_parts"].orphaned_bytes == 10
+    assert report.missing["sheets"].missing == 1
+    assert report.missing["sheets"].examples == [{"id": "s2", "path": os.path.join(server.UPLOADS_DIR, "gone.pdf")}]
+    assert report.missing["verifications"].missing == 0
+
+
+async def test_recent_files_survive_the_grace_period(dirs):
+    touch(server.UPLOADS_DIR, "just-uploaded.pdf")  # its sheet is not inserted yet
+    area = storage.Area("sheets", server.UPLOADS_DIR, server.referenced_sheet_files)
+
+    recent = await storage.reconcile_area(area, time.time(), grace=3600)
+    later = await storage.reconcile_area(area, time.time() + 7200, grace=3600, action="delete")
+
+    assert (recent.scanned, recent.orphaned) == (1, 0)
+    assert later.orphaned == 1 and files(server.UPLOADS_DIR) == []
+    assert files(storage.QUARANTINE_DIR) == []
+
+
+async def test_quarantine_is_purged_after_its_retention(dirs):
+    touch(server.UPLOADS_DIR, "orphan.pdf")
+    area = storage.Area("sheets", server.UPLOADS_DIR, server.referenced_sheet_files)
+    await storage.reconcile_area(area, time.time(), grace=-60)
+
+    assert await storage.purge_quarantine(time.time(), retention=3600) == 0
+    assert await storage.purge_quarantine(time.time() + 7200, retention=3600) == 1
+    assert files(os.path.join(storage.QUARANTINE_DIR, "sheets")) == []
+
+
+async def test_reconcile_job_stores_its_report_and_reschedules(dirs):
+    await server.reconcile_storage({})
+
+    report = await server.repos.storage_reports.latest()
+    assert report["action"] == storage.RECONCILE_ACTION and report["finished_at"] <= datetime.utcnow()
+    assert set(report["areas"]) == {"sheets", "sample_files", "verifications", "verification_originals",
+                                    "upload_parts"}
+    assert await server.repos.jobs.is_queued("reconcile_storage")
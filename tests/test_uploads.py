@@ -0,0 +1,164 @@
+"""Resumable sheet uploads: resume after a drop, chunk retries, finalize, expiry."""
+import base64
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+import passwords
+import server
+import uploads
+from memory_store import MemoryDatabase
+
+pytestmark = pytest.mark.anyio
+
+CONTENT = b"%PDF-1.4 " + os.urandom(10_000)
+SHEET = {"title": "Pack CM1", "description": "Fiches de l'année", "level": "CM1", "subject": "mathématiques"}
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def admin(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "password_context", passwords.build_context(4))
+    monkeypatch.setattr(server, "UPLOADS_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(uploads, "UPLOAD_PARTS_DIR", str(tmp_path / "parts"))
+    previous = server.db
+    server.use_database(MemoryDatabase())
+    server.rate_limiter.clear()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/api/auth/register", json={
+            "email": "marine.alves1995@gmail.com", "password": "TestPass123!",
+            "first_name": "Marine", "last_name": "Alves", "user_type": "teacher",
+        })
+        client.headers["Authorization"] = f"Bearer {response.json()['token']}"
+        yield client
+    server.use_database(previous)
+
+
+def chunk_headers(offset, data):
+    checksum = base64.b64encode(hashlib.sha256(data).digest()).decode()
+    return {"Upload-Offset": str(offset), "Upload-Checksum": f"sha256 {checksum}"}
+
+
+async def start(client, content=CONTENT, **fields):
+    response = await client.post("/api/admin/uploads", json={
+        **SHEET, "filename": "pack.pdf", "size": len(content), **fields,
+    })
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+async def send(client, upload_id, offset, data):
+    return await client.patch(f"/api/admin/uploads/{upload_id}", content=data, headers=chunk_headers(offset, data))
+
+
+async def test_upload_resumes_after_a_dropped_chunk(admin):
+    upload_id = await start(admin, sha256=hashlib.sha256(CONTENT).hexdigest())
+
+    assert (await send(admin, upload_id, 0, CONTENT[:4000])).headers["Upload-Offset"] == "4000"
+    # The next chunk is cut short by a dropped connection: its checksum fails
+    response = await admin.patch(f"/api/admin/uploads/{upload_id}", content=CONTENT[4000:6000],
+                                 headers=chunk_headers(4000, CONTENT[4000:8000]))
+    assert response.status_code == 400
+    # The client asks where to resume; the lost response of chunk one is retried too
+    status = await admin.head(f"/api/admin/uploads/{upload_id}")
+    assert status.headers["Upload-Offset"] == "4000"
+    assert (await send(admin, upload_id, 0, CONTENT[:4000])).status_code == 204
+    assert (await send(admin, upload_id, 4000, CONTENT[4000:])).headers["Upload-Offset"] == str(len(CONTENT))
+
+    response = await admin.post(f"/api/admin/uploads/{upload_id}/finalize")
+    assert response.status_code == 200, response.text
+    sheet = response.json()["sheet"]
+    assert sheet["id"] == upload_id and sheet["title"] == "Pack CM1"
+    with open(os.path.join(server.UPLOADS_DIR, os.path.basename(sheet["file_url"])), "rb") as f:
+        assert f.read() == CONTENT
+    assert not os.path.exists(uploads.part_path(upload_id))
+    stored = await server.repos.sheets.get(upload_id)
+    assert stored["content_hash"] == hashlib.sha256(CONTENT).hexdigest()
+    assert await server.repos.jobs.is_queued("process_sheet_document")
+
+    # Finalize is idempotent: a retry returns the same sheet and adds no other
+    again = await admin.post(f"/api/admin/uploads/{upload_id}/finalize")
+    assert again.json()["sheet"] == sheet
+    assert await server.repos.sheets.count() == 1
+
+
+async def test_chunks_must_follow_the_offset(admin):
+    upload_id = await start(admin)
+    await send(admin, upload_id, 0, CONTENT[:100])
+
+    skipped = await send(admin, upload_id, 200, CONTENT[200:300])
+    assert skipped.status_code == 409 and skipped.headers["Upload-Offset"] == "100"
+    # Same offset as a stored chunk but different bytes: not a retry
+    changed = await send(admin, upload_id, 0, b"x" * 100)
+    assert changed.status_code == 409
+    assert (await send(admin, upload_id, 100, CONTENT[100:] + b"extra")).status_code == 400
+    incomplete = await admin.post(f"/api/admin/uploads/{upload_id}/finalize")
+    assert incomplete.status_code == 409 and incomplete.headers["Upload-Offset"] == "100"
+
+
+async def test_whole_file_checksum_is_checked_on_finalize(admin):
+    upload_id = await start(admin, sha256="00" * 32)
+    await send(admin, upload_id, 0, CONTENT)
+
+    response = await admin.post(f"/api/admin/uploads/{upload_id}/finalize")
+
+    assert response.status_code == 400
+    assert (await admin.get(f"/api/admin/uploads/{upload_id}")).json()["status"] == "failed"
+    assert await server.repos.sheets.count() == 0
+    assert not os.path.exists(uploads.part_path(upload_id))
+
+
+async def test_garbage_collection_expires_abandoned_uploads(admin):
+    abandoned = await start(admin)
+    active = await start(admin)
+    await send(admin, abandoned, 0, CONTENT[:100])
+    later = datetime.utcnow() + timedelta(seconds=uploads.UPLOAD_EXPIRY_SECONDS / 2)
+    await server.repos.uploads.collection.update_one(
+        {"id": abandoned}, {"$set": {"expires_at": later - timedelta(seconds=1)}})
+
+    assert await uploads.collect_garbage(server.repos.uploads, later, batch_size=1) == 1
+
+    assert not os.path.exists(uploads.part_path(abandoned))
+    assert os.path.exists(uploads.part_path(active))
+    assert (await send(admin, abandoned, 100, CONTENT[100:200])).status_code == 410
+
+
+async def test_append_that_lost_its_lock_is_not_acknowledged(admin, monkeypatch):
+    upload_id = await start(admin)
+    await send(admin, upload_id, 0, CONTENT[:100])
+    session = await server.repos.uploads.get(upload_id)
+    assert session["last_chunk"]["offset"] == 0 and "chunks" not in session
+
+    async def lost(*args):
+        return False  # the lock expired while writing and the session moved on
+
+    monkeypatch.setattr(server.repos.uploads, "advance", lost)
+    response = await send(admin, upload_id, 100, CONTENT[100:200])
+
+    assert response.status_code == 409 and response.headers["Upload-Offset"] == "100"
+
+
+async def test_oversized_chunk_without_content_length_is_refused(admin, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_CHUNK_BYTES", 1000)
+    upload_id = await start(admin)
+    sent = []
+
+    async def body():
+        for _ in range(100):
+            sent.append(1)
+            yield b"x" * 100
+
+    response = await admin.patch(f"/api/admin/uploads/{upload_id}", content=body(),
+                                 headers=chunk_headers(0, b"x" * 10_000))
+
+    assert response.status_code == 413
+    assert len(sent) < 100  # refused before the whole body was read
+    assert (await admin.head(f"/api/admin/uploads/{upload_id}")).headers["Upload-Offset"] == "0"
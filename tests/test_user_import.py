@@ -0,0 +1,107 @@
+"""CSV user import: validation, per-row duplicate reporting, batching."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import user_import
+from memory_store import MemoryDatabase
+from repositories import Repositories
+
+pytestmark = pytest.mark.anyio
+
+CSV = """email,first_name,last_name,user_type,password
+ana@ecole.fr,Ana,Martin,teacher,Secret1!
+leo@ecole.fr,Léo,Petit,parent,Secret2!
+not-an-email,Jo,Roux,parent,Secret3!
+ana@ecole.fr,Ana,Bis,teacher,Secret4!
+kim@ecole.fr,Kim,Durand,director,Secret5!
+taken@ecole.fr,Tom,Leroy,parent,Secret6!
+max@ecole.fr,Max,,parent,Secret7!
+zoe@ecole.fr,Zoé,Simon,parent,Secret8!
+"""
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def users():
+    repository = Repositories(MemoryDatabase()).users
+    await repository.collection.create_index("email", unique=True, name="email_unique")
+    await repository.insert({"id": "existing", "email": "taken@ecole.fr"})
+    return repository
+
+
+async def test_import_reports_each_rejected_line(users):
+    with ThreadPoolExecutor(2) as pool:
+        report = await user_import.import_users(users, CSV.splitlines(True), 4, pool, batch_size=2, workers=2)
+
+    assert (report.rows, report.imported, report.failed) == (8, 3, 5)
+    assert [(error.line, error.error) for error in report.errors] == [
+        (4, "invalid email"),
+        (5, "duplicate email in file"),
+        (6, "user_type must be one of parent, teacher"),
+        (8, "missing last_name"),
+        (7, "email already registered"),
+    ]
+    ana = await users.get_by_email("ana@ecole.fr")
+    assert ana["user_type"] == "teacher" and not ana["is_verified"] and not ana["is_admin"]
+    assert ana["password"].startswith("$2b$04$")
+    assert await users.count() == 4
+
+
+async def test_missing_columns_rejected_before_any_write(users):
+    with pytest.raises(ValueError, match="password"):
+        await user_import.import_users(users, ["email,first_name,last_name,user_type\n"], 4, None)
+
+
+async def test_hashing_runs_in_a_process_pool(users):
+    with user_import.hash_process_pool(1) as pool:
+        report = await user_import.import_users(users, CSV.splitlines(True)[:3], 4, pool, workers=1)
+
+    assert report.imported == 2
+    leo = await users.get_by_email("leo@ecole.fr")
+    assert user_import.bcrypt.verify("Secret2!", leo["password"])
+
+
+async def test_rows_are_parsed_off_the_event_loop(users, monkeypatch):
+    threads = set()
+    validate_row = user_import.validate_row
+    monkeypatch.setattr(user_import, "validate_row",
+                        lambda row: threads.add(threading.current_thread()) or validate_row(row))
+
+    with ThreadPoolExecutor(2) as pool:
+        await user_import.import_users(users, CSV.splitlines(True), 4, pool, batch_size=2, workers=2)
+
+    assert threads and threading.current_thread() not in threads
+
+
+async def test_pending_write_is_stopped_when_reading_fails(users, monkeypatch):
+    cancelled = asyncio.Event()
+
+    calls = []
+
+    async def slow_insert_many(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            return []
+        try:
+            await asyncio.sleep(10)  # the second batch is still being written
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    monkeypatch.setattr(users, "insert_many", slow_insert_many)
+
+    def lines():
+        yield from CSV.splitlines(True)[:3]
+        raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+    with ThreadPoolExecutor(2) as pool, pytest.raises(ValueError):
+        await user_import.import_users(users, lines(), 4, pool, batch_size=1, workers=1)
+
+    assert cancelled.is_set()
@@ -0,0 +1,54 @@
+"""Review queue claims: ordering, exclusivity and lease expiry."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from memory_store import MemoryDatabase
+from repositories import Repositories
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def queue():
+    verifications = Repositories(MemoryDatabase()).verifications
+    start = datetime(2024, 1, 1)
+    for index in range(3):
+        await verifications.insert({
+            "id": f"v{index}", "user_id": f"u{index}", "document_url": f"/tmp/verifications/{index}.jpg",
+            "status": "pending", "created_at": start + timedelta(minutes=index),
+        })
+    return verifications
+
+
+async def test_concurrent_reviewers_never_share_a_record(queue):
+    claims = await asyncio.gather(*(queue.claim(f"admin{index}", 60) for index in range(5)))
+
+    assert sorted(claim["id"] for claim in claims if claim) == ["v0", "v1", "v2"]
+    assert sum(claim is None for claim in claims) == 2
+
+
+async def test_expired_claim_returns_to_the_queue(queue):
+    abandoned = await queue.claim("gone", lease_seconds=0)
+    assert abandoned["id"] == "v0"
+
+    reclaimed = await queue.claim("admin", lease_seconds=60)
+    assert reclaimed["id"] == "v0" and reclaimed["reviewer"] == "admin"
+    assert await queue.decide("v0", "gone", "approved") is None
+    assert (await queue.decide("v0", "admin", "rejected", "illisible"))["status"] == "rejected"
+    # A decided record is not re-queued, and cannot be flipped by a retry
+    assert (await queue.claim("admin", 60))["id"] == "v1"
+    assert await queue.decide("v0", "admin", "approved") is None
+
+
+async def test_release_puts_the_record_back_first_in_line(queue):
+    await queue.claim("admin", 60)
+    assert await queue.release("v0", "admin")
+    assert not await queue.release("v0", "admin")
+    assert (await queue.claim("other", 60))["id"] == "v0"